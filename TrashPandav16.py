@@ -1,60 +1,298 @@
+import time
+# Taken before anything heavy is imported, for the startup report.
+STARTED_AT = time.perf_counter()
 import os
-import json
-import subprocess
+import multiprocessing
 import sys
 import threading
 import tkinter as tk
+import tkinter.font as tkfont
 from tkinter import filedialog, messagebox, Scrollbar
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from PIL import Image, ExifTags, ImageTk
-import pillow_heif
+from PIL import Image, ImageTk
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-import shutil
 import webbrowser
 import logging
 
-# --- Optional Dependency Imports ---
-try:
-    import cairosvg
-except ImportError:
-    cairosvg = None
-try:
-    import rawpy
-except ImportError:
-    rawpy = None
-
-# Register the HEIC opener with Pillow
-pillow_heif.register_heif_opener()
+from trashpanda.backends import load_for, load_times
+from trashpanda.convert import SUPPORTED_IMAGE_EXTS, ORIGINAL_FORMAT, ConvertOptions, convert_images, default_worker_count, encoding_summary, ensure_pool, make_pool, svg_supported
+from trashpanda.dedup import ContentIndex
+from trashpanda.encoders import DEFAULT_PROFILE, PROFILES, format_supported
+from trashpanda.index import MetadataIndex
+from trashpanda.manifest import BatchManifest
+from trashpanda.metadata import STREAM_CHUNK, format_metadata, iter_chunks, write_csv, write_jsonl
+from trashpanda.paths import user_cache_dir
+from trashpanda.preview import PreviewWorker, ThumbnailCache
+from trashpanda.progress import REFRESH_MS, ProgressChannel
+from trashpanda.renditions import Rendition
+from trashpanda.scan import FileList, FolderScanner
+from trashpanda.trace import STARTUP_TARGET_MS, BatchTrace, StartupTimer, save_recent_trace
+from trashpanda.video import SUPPORTED_VIDEO_EXTS, can_strip_natively, find_ffmpeg_bin, process_videos
+from trashpanda.watch import FolderWatcher, IngestQueue
+
 logging.basicConfig(level=logging.INFO)
 
-SUPPORTED_IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.heic', '.webp', '.bmp', '.gif', '.tiff', '.svg', '.raf', '.cr2', '.cr3', '.arw', '.nef', '.dng')
-SUPPORTED_VIDEO_EXTS = ('.mp4', '.mov', '.avi', '.mkv')
-
-def find_ffmpeg_bin(name):
-    # First, check local directory (if bundled with exe, e.g. PyInstaller's _MEIPASS or .)
-    base_dirs = [getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__))), os.getcwd()]
-    for base in base_dirs:
-        candidate = os.path.join(base, name)
-        if os.path.isfile(candidate):
-            return candidate
-        # Windows: allow .exe
-        if os.name == 'nt':
-            candidate_exe = candidate + '.exe'
-            if os.path.isfile(candidate_exe):
-                return candidate_exe
-    # Else, fallback to PATH
-    return shutil.which(name)
+
+class VirtualFileList(ttk.Frame):
+    """
+    A file list whose tk.Listbox only ever holds the rows on screen. Rows are
+    drawn from `items` (a sequence of paths); scrolling, selection and keyboard
+    navigation are tracked here by item index, so the cost of showing 200k
+    files is the same as showing 20. Fires <<ListboxSelect>> on .listbox.
+    """
+
+    def __init__(self, master, items, **listbox_options):
+        super().__init__(master)
+        self.items = items
+        self.top = 0
+        self.selection = set()
+        self.anchor = None
+        self.active = None
+        self.listbox = tk.Listbox(self, selectmode=tk.EXTENDED, exportselection=False, activestyle="none", **listbox_options)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox.pack(side="left", fill="both", expand=True)
+
+        self.listbox.bind("<Configure>", lambda e: self.refresh())
+        self.listbox.bind("<Button-1>", self.on_click)
+        self.listbox.bind("<Shift-Button-1>", lambda e: self.on_click(e, extend=True))
+        self.listbox.bind("<Control-Button-1>", lambda e: self.on_click(e, toggle=True))
+        self.listbox.bind("<B1-Motion>", lambda e: self.on_click(e, extend=True))
+        self.listbox.bind("<Up>", lambda e: self.move(-1))
+        self.listbox.bind("<Down>", lambda e: self.move(1))
+        self.listbox.bind("<Shift-Up>", lambda e: self.move(-1, extend=True))
+        self.listbox.bind("<Shift-Down>", lambda e: self.move(1, extend=True))
+        self.listbox.bind("<Prior>", lambda e: self.move(-self.visible_rows()))
+        self.listbox.bind("<Next>", lambda e: self.move(self.visible_rows()))
+        self.listbox.bind("<Home>", lambda e: self.move(-len(self.items)))
+        self.listbox.bind("<End>", lambda e: self.move(len(self.items)))
+        self.listbox.bind("<Control-a>", self.select_all)
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1) if e.delta else "break")
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(1))
+
+    def row_height(self):
+        # Tk lays listbox rows out at linespace + 1 + 2 * selectborderwidth pixels.
+        font = tkfont.Font(font=self.listbox.cget("font"))
+        return font.metrics("linespace") + 1 + 2 * int(self.listbox.cget("selectborderwidth"))
+
+    def visible_rows(self):
+        inset = 2 * (int(self.listbox.cget("borderwidth")) + int(self.listbox.cget("highlightthickness")))
+        return max(1, (self.listbox.winfo_height() - inset) // self.row_height())
+
+    def refresh(self):
+        """Redraws the visible rows and the scrollbar."""
+        total = len(self.items)
+        rows = self.visible_rows()
+        self.top = max(0, min(self.top, total - rows))
+        end = min(total, self.top + rows)
+        self.listbox.delete(0, tk.END)
+        if end > self.top:
+            self.listbox.insert(tk.END, *[os.path.basename(p) for p in self.items[self.top:end]])
+        for index in range(self.top, end):
+            if index in self.selection:
+                self.listbox.selection_set(index - self.top)
+        if total > rows:
+            self.scrollbar.set(self.top / total, end / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def items_added(self):
+        """Call after appending to items; only redraws rows if the new ones can be on screen."""
+        total = len(self.items)
+        rows = self.visible_rows()
+        if self.listbox.size() < rows:
+            self.refresh()
+        elif total:
+            self.scrollbar.set(self.top / total, (self.top + rows) / total)
+
+    def items_removed(self):
+        """Call after removing from items; indices have shifted, so the selection is dropped."""
+        self.selection.clear()
+        self.anchor = self.active = None
+        self.refresh()
+
+    def curselection(self):
+        return sorted(self.selection)
+
+    def yview(self, *args):
+        total = len(self.items)
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * total)
+        elif args[0] == "scroll":
+            step = self.visible_rows() if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.refresh()
+
+    def scroll(self, units):
+        self.top += units * 3
+        self.refresh()
+        return "break"
+
+    def see(self, index):
+        rows = self.visible_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + rows:
+            self.top = index - rows + 1
+
+    def _selection_changed(self):
+        self.refresh()
+        self.listbox.event_generate("<<ListboxSelect>>")
+
+    def on_click(self, event, extend=False, toggle=False):
+        self.listbox.focus_set()
+        row = self.listbox.nearest(event.y)
+        if row < 0 or self.top + row >= len(self.items):
+            return "break"
+        index = self.top + row
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selection = set(range(low, high + 1))
+        elif toggle:
+            self.selection ^= {index}
+            self.anchor = index
+        else:
+            self.selection = {index}
+            self.anchor = index
+        self.active = index
+        self._selection_changed()
+        return "break"
+
+    def move(self, delta, extend=False):
+        if not self.items:
+            return "break"
+        start = self.active if self.active is not None else self.top
+        index = max(0, min(len(self.items) - 1, start + delta))
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selection = set(range(low, high + 1))
+        else:
+            self.selection = {index}
+            self.anchor = index
+        self.active = index
+        self.see(index)
+        self._selection_changed()
+        return "break"
+
+    def select_all(self, event=None):
+        self.selection = set(range(len(self.items)))
+        self._selection_changed()
+        return "break"
+
+
+class MetadataViewer(tk.Toplevel):
+    """
+    Shows metadata records a page at a time while they are still being read,
+    and exports them straight to JSONL or CSV without going through the text view.
+    """
+    PAGE_SIZE = 50
+
+    def __init__(self, master, total):
+        super().__init__(master)
+        self.title("Metadata Viewer")
+        self.geometry("800x600")
+        self.records = []
+        self.total = total
+        self.page = 0
+        self.closed = False
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        nav = ttk.Frame(self, padding=5)
+        nav.pack(side="top", fill="x")
+        self.prev_button = ttk.Button(nav, text="< Prev", style="secondary.TButton", command=lambda: self.show_page(self.page - 1))
+        self.prev_button.pack(side="left")
+        self.next_button = ttk.Button(nav, text="Next >", style="secondary.TButton", command=lambda: self.show_page(self.page + 1))
+        self.next_button.pack(side="left", padx=5)
+        self.page_label = ttk.Label(nav, text="")
+        self.page_label.pack(side="left", padx=10)
+        self.export_buttons = [
+            ttk.Button(nav, text="Export JSONL...", style="info.TButton", state="disabled", command=lambda: self.export("jsonl")),
+            ttk.Button(nav, text="Export CSV...", style="info.TButton", state="disabled", command=lambda: self.export("csv")),
+        ]
+        for button in reversed(self.export_buttons):
+            button.pack(side="right", padx=2)
+
+        self.text_area = tk.Text(self, wrap="word", bg="#2b2b2b", fg="white", font=("Consolas", 10), state="disabled")
+        scrollbar = ttk.Scrollbar(self, command=self.text_area.yview, style="light.Vertical.TScrollbar")
+        self.text_area.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        self.text_area.pack(side="left", fill="both", expand=True)
+        self.update_nav()
+
+    def close(self):
+        self.closed = True
+        self.destroy()
+
+    def page_count(self):
+        return max(1, -(-len(self.records) // self.PAGE_SIZE))
+
+    @staticmethod
+    def render(records):
+        return "".join(format_metadata(record) + "\n" + "=" * 40 + "\n\n" for record in records)
+
+    def add_records(self, records):
+        """Called on the Tk thread with each chunk the reader finishes; only the current page is drawn."""
+        if self.closed:
+            return
+        start = len(self.records)
+        self.records.extend(records)
+        page_end = (self.page + 1) * self.PAGE_SIZE
+        if start < page_end:
+            self.text_area.config(state="normal")
+            self.text_area.insert("end", self.render(self.records[start:page_end]))
+            self.text_area.config(state="disabled")
+        self.update_nav()
+
+    def finish(self):
+        if self.closed:
+            return
+        for button in self.export_buttons:
+            button.config(state="normal")
+        self.update_nav()
+
+    def show_page(self, page):
+        self.page = max(0, min(page, self.page_count() - 1))
+        start = self.page * self.PAGE_SIZE
+        self.text_area.config(state="normal")
+        self.text_area.delete("1.0", "end")
+        self.text_area.insert("1.0", self.render(self.records[start:start + self.PAGE_SIZE]))
+        self.text_area.config(state="disabled")
+        self.update_nav()
+
+    def update_nav(self):
+        self.page_label.config(text=f"Page {self.page + 1} of {self.page_count()}  ({len(self.records)} of {self.total} files read)")
+        self.prev_button.config(state="normal" if self.page > 0 else "disabled")
+        self.next_button.config(state="normal" if self.page < self.page_count() - 1 else "disabled")
+
+    def export(self, fmt):
+        path = filedialog.asksaveasfilename(
+            parent=self, title="Export Metadata", defaultextension=f".{fmt}",
+            filetypes=[(fmt.upper(), f"*.{fmt}"), ("All files", "*.*")],
+        )
+        if not path:
+            return
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                count = write_csv(self.records, f) if fmt == "csv" else write_jsonl(self.records, f)
+        except OSError as e:
+            messagebox.showerror("Export Failed", str(e), parent=self)
+            return
+        messagebox.showinfo("Exported", f"Exported {count} records to {os.path.basename(path)}.", parent=self)
+
 
 class MediaConverterApp(TkinterDnD.Tk):
     """
     An optimized GUI application for viewing metadata and converting media files.
     """
 
-    def __init__(self):
+    def __init__(self, startup=None):
         super().__init__()
         self.style = ttk.Style(theme="cosmo")
         self.withdraw()
+        self.startup = startup or StartupTimer(STARTED_AT)
+        self.startup.mark("tk")
 
         # --- Application Info ---
         self.APP_NAME = "Trash Panda"
@@ -63,7 +301,8 @@ class MediaConverterApp(TkinterDnD.Tk):
         self.DONATION_LINK = "https://buymeacoffee.com/fl6ki"
 
         # --- Application State ---
-        self.selected_files = []
+        self.selected_files = FileList()
+        self.scanners = set()
         # Try to find local ffmpeg/ffprobe first, then PATH
         self.ffmpeg_path = find_ffmpeg_bin('ffmpeg')
         self.ffprobe_path = find_ffmpeg_bin('ffprobe')
@@ -72,16 +311,40 @@ class MediaConverterApp(TkinterDnD.Tk):
         # --- Tkinter UI Variables ---
         self.remove_metadata_var = tk.BooleanVar(value=True)
         self.resize_images_var = tk.BooleanVar(value=False)
+        self.keep_icc_var = tk.BooleanVar(value=False)
+        self.skip_up_to_date_var = tk.BooleanVar(value=True)
+        self.dedupe_var = tk.BooleanVar(value=True)
         self.save_format_var = tk.StringVar(value="JPEG")
+        self.encoder_profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        self.worker_count_var = tk.IntVar(value=default_worker_count())
+        self.extra_sizes_var = tk.StringVar(value="")
 
         # --- UI Widget References ---
         self.file_listbox = None
         self.image_preview_label = None
         self.image_preview_close_btn = None
+        self.preview_worker = None
+        self.preview_path = None
+        self.metadata_index = None
+        self.batch_manifest = None
+        self.content_index = None
         self.progress_bar = None
         self.progress_label = None
+        self.pause_button = None
+        self.cancel_button = None
+        # The running batch's ProgressChannel, and the pending after() that redraws it.
+        self.progress = None
+        self.progress_refresh_id = None
         self.status_bar_label = None
         self.action_buttons = {}
+        # Watch Folder: the watcher, the queue its files go through and the settings (and warm pool) they're processed with.
+        self.watcher = None
+        self.watch_queue = None
+        self.watch_settings = None
+        # Files processed and failed since watching started.
+        self.watch_counts = [0, 0]
+        self.watch_button = None
+        self.watch_label = None
 
         self.show_splash()
 
@@ -113,15 +376,38 @@ class MediaConverterApp(TkinterDnD.Tk):
 
         tk.Label(splash, text=f"{self.APP_NAME} is waking up...", font=("Segoe UI", 12, "bold"), bg="#ffffff", fg="#333333").pack()
 
-        splash.after(1200, lambda: [splash.destroy(), self.run_main_app()])
+        # Drawn now, so it's on screen while the main window is built behind it.
+        splash.update()
+        self.startup.mark("splash")
+        self.after_idle(self.run_main_app, splash)
 
-    def run_main_app(self):
-        """Initializes and displays the main application window."""
-        self.deiconify()
+    def run_main_app(self, splash=None):
+        """Builds the main window (still hidden), then swaps it in for the splash as soon as it's ready."""
         self.setup_main_window()
+        self.update_idletasks()
+        self.startup.mark("window")
+        if splash is not None:
+            splash.destroy()
+        self.deiconify()
+        self.after_idle(self.on_interactive)
+
+    def on_interactive(self):
+        """Runs once the main window is up and the event loop is idle: logs how long startup took."""
+        self.startup.mark("interactive")
+        try:
+            target_ms = float(os.environ.get("TRASHPANDA_STARTUP_TARGET_MS", STARTUP_TARGET_MS))
+        except ValueError:
+            target_ms = STARTUP_TARGET_MS
+        report = self.startup.report(target_ms, load_times)
+        logging.info(report)
+        if os.environ.get("TRASHPANDA_STARTUP_REPORT"):
+            # Measuring only (e.g. in CI): print the report and exit non-zero if over target.
+            print(report)
+            self.destroy()
+            sys.exit(1 if self.startup.elapsed_ms() > target_ms else 0)
         if not self.ffmpeg_path or not self.ffprobe_path:
             messagebox.showwarning("Dependency Not Found",
-                                   "FFmpeg/FFprobe not found. Video features will be disabled. "
+                                   "FFmpeg/FFprobe not found. Only MP4/MOV metadata removal will work for videos. "
                                    "Please install FFmpeg and ensure it's in your system's PATH.\n"
                                    "You can also place ffmpeg(.exe) and ffprobe(.exe) next to this executable.")
 
@@ -155,15 +441,15 @@ class MediaConverterApp(TkinterDnD.Tk):
 
         list_frame = ttk.Labelframe(left_panel, text="Files", padding=10)
         list_frame.pack(fill="both", expand=True)
-        self.file_listbox = tk.Listbox(
-            list_frame, selectmode=tk.EXTENDED, width=40, height=12,
+        self.file_listbox = VirtualFileList(
+            list_frame, self.selected_files, width=40, height=12,
             bg="#f8f9fa", fg="#343a40", selectbackground="#0d6efd", selectforeground="white",
             font=("Segoe UI", 10), borderwidth=0, highlightthickness=0
         )
         self.file_listbox.pack(pady=5, fill="both", expand=True)
-        self.file_listbox.bind("<<ListboxSelect>>", self.on_file_select)
-        self.file_listbox.bind("<Delete>", self.delete_selected_files)
-        self.file_listbox.bind("<BackSpace>", self.delete_selected_files)
+        self.file_listbox.listbox.bind("<<ListboxSelect>>", self.on_file_select)
+        self.file_listbox.listbox.bind("<Delete>", self.delete_selected_files)
+        self.file_listbox.listbox.bind("<BackSpace>", self.delete_selected_files)
 
         button_frame = ttk.Frame(left_panel)
         button_frame.pack(pady=5, fill="x")
@@ -191,12 +477,24 @@ class MediaConverterApp(TkinterDnD.Tk):
             activebackground="#e9ecef", activeforeground="black", cursor="hand2"
         )
         self.image_preview_close_btn.place(relx=1.0, y=0, anchor="ne", x=-2)
+        self.preview_worker = PreviewWorker(self.on_preview_ready, cache=ThumbnailCache(disk_dir=user_cache_dir("previews")))
 
         # --- BOTTOM SECTION (Options & Conversion) ---
         options_lf = ttk.Labelframe(self, text="Processing Options", padding=15)
         options_lf.pack(pady=5, padx=10, fill="x")
         ttk.Checkbutton(options_lf, text="Remove Metadata (Images & Videos)", variable=self.remove_metadata_var, style="primary.TCheckbutton").pack(anchor="w", pady=2)
+        ttk.Checkbutton(options_lf, text="Keep Colour Profile (ICC) when removing metadata", variable=self.keep_icc_var, style="primary.TCheckbutton").pack(anchor="w", pady=2)
         ttk.Checkbutton(options_lf, text="Shrink Images to 50%", variable=self.resize_images_var, style="primary.TCheckbutton").pack(anchor="w", pady=2)
+        ttk.Checkbutton(options_lf, text="Skip files already processed with these options (resume)", variable=self.skip_up_to_date_var, style="primary.TCheckbutton").pack(anchor="w", pady=2)
+        ttk.Checkbutton(options_lf, text="Process identical files once (copy the first one's outputs)", variable=self.dedupe_var, style="primary.TCheckbutton").pack(anchor="w", pady=2)
+        workers_frame = ttk.Frame(options_lf)
+        workers_frame.pack(anchor="w", pady=2)
+        ttk.Label(workers_frame, text="Worker processes (1 = serial):").pack(side="left")
+        ttk.Spinbox(workers_frame, from_=1, to=max(default_worker_count(), 64), width=5, textvariable=self.worker_count_var).pack(side="left", padx=5)
+        sizes_frame = ttk.Frame(options_lf)
+        sizes_frame.pack(anchor="w", pady=2)
+        ttk.Label(sizes_frame, text="Also save smaller copies (longest edge in px, e.g. 2048, 256):").pack(side="left")
+        ttk.Entry(sizes_frame, width=20, textvariable=self.extra_sizes_var).pack(side="left", padx=5)
 
         convert_lf = ttk.Labelframe(self, text="Start Conversion", padding=15)
         convert_lf.pack(pady=5, padx=10, fill="x")
@@ -207,11 +505,21 @@ class MediaConverterApp(TkinterDnD.Tk):
         self.action_buttons['convert_vid'].grid(row=0, column=1, padx=5, pady=5, sticky="ew")
         self.action_buttons['metadata'] = ttk.Button(convert_lf, text="Show Metadata", style="info.TButton", command=self.show_metadata)
         self.action_buttons['metadata'].grid(row=0, column=2, padx=5, pady=5, sticky="ew")
+        self.watch_button = ttk.Button(convert_lf, text="Watch Folder...", style="primary.TButton", command=self.toggle_watch)
+        self.watch_button.grid(row=1, column=0, padx=5, pady=5, sticky="ew")
+        self.watch_label = ttk.Label(convert_lf, text="", anchor="w")
+        self.watch_label.grid(row=1, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
 
         self.progress_bar = ttk.Progressbar(self, orient="horizontal", length=400, mode="determinate")
         self.progress_bar.pack(pady=5, padx=10, fill="x")
         self.progress_label = ttk.Label(self, text="", font=("Segoe UI", 10))
         self.progress_label.pack(pady=2, padx=10)
+        batch_frame = ttk.Frame(self)
+        batch_frame.pack(pady=2)
+        self.pause_button = ttk.Button(batch_frame, text="Pause", style="secondary.TButton", state="disabled", command=self.toggle_pause)
+        self.pause_button.pack(side="left", padx=5)
+        self.cancel_button = ttk.Button(batch_frame, text="Cancel", style="danger.TButton", state="disabled", command=self.cancel_batch)
+        self.cancel_button.pack(side="left", padx=5)
         self.status_bar_label = ttk.Label(self, text="0 files selected", anchor="w", padding=5, style="secondary.TLabel")
         self.status_bar_label.pack(side="bottom", fill="x")
 
@@ -222,11 +530,11 @@ class MediaConverterApp(TkinterDnD.Tk):
         """Switches between light ('cosmo') and dark ('darkly') themes."""
         if self.style.theme.name == "cosmo":
             self.style.theme_use("darkly")
-            self.file_listbox.config(bg="#343a40", fg="white")
+            self.file_listbox.listbox.config(bg="#343a40", fg="white")
             self.image_preview_close_btn.config(bg="#212529", fg="white", activebackground="#343a40", activeforeground="white")
         else:
             self.style.theme_use("cosmo")
-            self.file_listbox.config(bg="#f8f9fa", fg="#343a40")
+            self.file_listbox.listbox.config(bg="#f8f9fa", fg="#343a40")
             self.image_preview_close_btn.config(bg="#f8f9fa", fg="black", activebackground="#e9ecef", activeforeground="black")
 
     def show_about_window(self):
@@ -254,48 +562,63 @@ class MediaConverterApp(TkinterDnD.Tk):
         selected_indices = self.file_listbox.curselection()
         if not selected_indices:
             return
-        file_path = self.selected_files[selected_indices[0]]
-        threading.Thread(target=self.update_image_preview, args=(file_path,), daemon=True).start()
-
-    def update_image_preview(self, file_path):
-        """Loads and displays an image thumbnail in the preview panel."""
-        try:
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext not in SUPPORTED_IMAGE_EXTS:
-                self.after(0, self.image_preview_label.config, {"text": "No preview available\n(not a standard image)", "image": ""})
-                return
-            if not os.path.exists(file_path):
-                self.after(0, self.image_preview_label.config, {"text": "File missing", "image": ""})
-                return
-
-            img = Image.open(file_path)
-            preview_width = self.image_preview_label.winfo_width()
-            preview_height = self.image_preview_label.winfo_height()
-            if preview_width < 50 or preview_height < 50:
-                preview_width, preview_height = 400, 400
-
-            img.thumbnail((preview_width - 20, preview_height - 20), Image.Resampling.LANCZOS)
-            photo_image = ImageTk.PhotoImage(img)
+        index = selected_indices[0]
+        self.update_image_preview(self.selected_files[index], index)
+
+    def update_image_preview(self, file_path, index=None):
+        """Queues a thumbnail of file_path for the preview panel, superseding any pending one."""
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in SUPPORTED_IMAGE_EXTS:
+            self.preview_path = None
+            self.preview_worker.cancel()
+            self.image_preview_label.config(text="No preview available\n(not a standard image)", image="")
+            return
+        if not os.path.exists(file_path):
+            self.preview_path = None
+            self.preview_worker.cancel()
+            self.image_preview_label.config(text="File missing", image="")
+            return
 
-            def set_image():
-                self.image_preview_label.config(image=photo_image, text="")
-                self.image_preview_label.image = photo_image
-            self.after(0, set_image)
-        except Exception as e:
-            logging.error(f"Error creating preview for {file_path}: {e}")
-            self.after(0, self.image_preview_label.config, {"text": "Preview failed to load", "image": ""})
+        preview_width = self.image_preview_label.winfo_width()
+        preview_height = self.image_preview_label.winfo_height()
+        if preview_width < 50 or preview_height < 50:
+            preview_width, preview_height = 400, 400
+        # Round the box so small resizes of the window still hit the cache.
+        box = ((preview_width - 20) // 50 * 50, (preview_height - 20) // 50 * 50)
+
+        neighbours = []
+        if index is not None:
+            for i in (index + 1, index - 1, index + 2):
+                if 0 <= i < len(self.selected_files) and os.path.splitext(self.selected_files[i])[1].lower() in SUPPORTED_IMAGE_EXTS:
+                    neighbours.append(self.selected_files[i])
+        self.preview_path = file_path
+        self.preview_worker.request(file_path, box, neighbours)
+
+    def on_preview_ready(self, file_path, img, error):
+        """Called from the preview worker thread; hands the result to the Tk thread."""
+        self.after(0, self.show_preview, file_path, img, error)
+
+    def show_preview(self, file_path, img, error):
+        if file_path != self.preview_path:
+            return
+        if error is not None:
+            self.image_preview_label.config(text="Preview failed to load", image="")
+            return
+        photo_image = ImageTk.PhotoImage(img)
+        self.image_preview_label.config(image=photo_image, text="")
+        self.image_preview_label.image = photo_image
 
     def clear_preview(self):
         """Clears the image preview panel."""
+        self.preview_path = None
+        self.preview_worker.cancel()
         self.image_preview_label.config(image="", text="Select an image to preview")
         self.image_preview_label.image = None
 
-    def update_file_listbox(self):
-        self.file_listbox.delete(0, tk.END)
-        for f in self.selected_files:
-            self.file_listbox.insert(tk.END, os.path.basename(f))
+    def update_status(self):
         count = len(self.selected_files)
-        self.status_bar_label.config(text=f"{count} file{'s' if count != 1 else ''} selected")
+        scanning = " (scanning folders...)" if self.scanners else ""
+        self.status_bar_label.config(text=f"{count} file{'s' if count != 1 else ''} selected{scanning}")
 
     def select_files(self):
         files = filedialog.askopenfilenames()
@@ -303,36 +626,48 @@ class MediaConverterApp(TkinterDnD.Tk):
             self.add_files(files)
 
     def add_files(self, files):
-        """Add files or folders (recursively if folders) to the file list."""
-        current_files = set(self.selected_files)
-        for f in files:
-            if os.path.isdir(f):
-                for root, _, filenames in os.walk(f):
-                    for fn in filenames:
-                        full_path = os.path.join(root, fn)
-                        ext = os.path.splitext(full_path)[1].lower()
-                        if ext in SUPPORTED_IMAGE_EXTS or ext in SUPPORTED_VIDEO_EXTS:
-                            if full_path not in current_files:
-                                self.selected_files.append(full_path)
-                                current_files.add(full_path)
-            else:
-                if f not in current_files:
-                    self.selected_files.append(f)
-        self.update_file_listbox()
+        """Add files or folders (recursively if folders) to the file list. Folders are scanned in the background."""
+        scanner = FolderScanner(
+            files, SUPPORTED_IMAGE_EXTS + SUPPORTED_VIDEO_EXTS,
+            on_batch=lambda paths: self.on_scanned(scanner, paths),
+            on_done=lambda cancelled: self.after(0, lambda: self.on_scan_done(scanner)),
+        )
+        self.scanners.add(scanner)
+        self.update_status()
+
+    def on_scanned(self, scanner, paths):
+        """Called on the scanner's thread: hands the batch to the UI, then imports any codec it needs."""
+        self.after(0, lambda: self.on_scan_batch(scanner, paths))
+        # e.g. pillow_heif for the first HEIC, so it's loaded before a preview or conversion wants it.
+        load_for(paths)
+
+    def on_scan_batch(self, scanner, paths):
+        if scanner not in self.scanners:
+            return
+        if self.selected_files.add(paths):
+            self.file_listbox.items_added()
+            self.update_status()
+
+    def on_scan_done(self, scanner):
+        self.scanners.discard(scanner)
+        self.update_status()
 
     def clear_file_list(self):
+        for scanner in self.scanners:
+            scanner.cancel()
+        self.scanners.clear()
         self.selected_files.clear()
-        self.update_file_listbox()
+        self.file_listbox.items_removed()
+        self.update_status()
 
     def drop(self, event):
         files = self.tk.splitlist(event.data)
         self.add_files(files)
 
     def delete_selected_files(self, event=None):
-        selected_indices = self.file_listbox.curselection()
-        for i in reversed(selected_indices):
-            del self.selected_files[i]
-        self.update_file_listbox()
+        self.selected_files.remove_indices(self.file_listbox.curselection())
+        self.file_listbox.items_removed()
+        self.update_status()
 
     def set_ui_state(self, is_enabled):
         state = "normal" if is_enabled else "disabled"
@@ -347,61 +682,66 @@ class MediaConverterApp(TkinterDnD.Tk):
             messagebox.showerror("Error", "Please select files first.")
             return
 
+        files = list(self.selected_files)
+        viewer = MetadataViewer(self, len(files))
+
         def metadata_worker():
-            combined_text = ""
-            for f in self.selected_files:
-                ext = os.path.splitext(f)[1].lower()
-                if ext in SUPPORTED_VIDEO_EXTS:
-                    combined_text += self.read_video_metadata(f)
-                else:
-                    combined_text += self.read_photo_metadata(f)
-                combined_text += "\n" + "=" * 40 + "\n\n"
-            self.after(0, self.show_text_popup, "Metadata Viewer", combined_text)
+            if self.metadata_index is None:
+                self.metadata_index = MetadataIndex()
+            for chunk in iter_chunks(files, STREAM_CHUNK):
+                if viewer.closed:
+                    return
+                records = self.metadata_index.refresh(chunk, self.ffprobe_path)
+                self.after(0, viewer.add_records, records)
+            self.after(0, viewer.finish)
 
         threading.Thread(target=metadata_worker, daemon=True).start()
 
-    def read_photo_metadata(self, image_path):
-        try:
-            ext = os.path.splitext(image_path)[1].lower()
-            if ext in ('.raf', '.cr2', '.cr3', '.arw', '.nef', '.dng') and rawpy:
-                with rawpy.imread(image_path) as raw:
-                    return f"File: {os.path.basename(image_path)}\n  Camera: {raw.camera_manufacturer} {raw.model}\n  Timestamp: {raw.timestamp}"
-            img = Image.open(image_path)
-            exif_data = img.getexif()
-            text_content = f"File: {os.path.basename(image_path)}\n"
-            if exif_data:
-                for tag_id, value in exif_data.items():
-                    tag = ExifTags.TAGS.get(tag_id, tag_id)
-                    if isinstance(value, bytes):
-                        value = value.decode(errors='replace')
-                    text_content += f"  {tag}: {value}\n"
-            else:
-                text_content += "  No EXIF metadata found."
-            return text_content
-        except Exception as e:
-            return f"Error reading {os.path.basename(image_path)}: {e}"
+    # ==================================
+    # == Batch Progress
+    # ==================================
+    def start_progress(self, progress):
+        """Shows a batch's progress, redrawn REFRESH_MS apart however fast its files finish."""
+        self.progress = progress
+        self.set_ui_state(False)
+        self.pause_button.config(state="normal", text="Pause")
+        self.cancel_button.config(state="normal")
+        self.refresh_progress()
+
+    def refresh_progress(self):
+        snapshot = self.progress.snapshot()
+        self.progress_bar.config(maximum=max(1, snapshot.total), value=snapshot.units)
+        self.progress_label.config(text=snapshot.text())
+        self.progress_refresh_id = self.after(REFRESH_MS, self.refresh_progress)
+
+    def stop_progress(self):
+        if self.progress_refresh_id is not None:
+            self.after_cancel(self.progress_refresh_id)
+            self.progress_refresh_id = None
+        if self.progress is not None:
+            snapshot = self.progress.snapshot()
+            self.progress_bar.config(maximum=max(1, snapshot.total), value=snapshot.units)
+            self.progress = None
+        self.pause_button.config(state="disabled", text="Pause")
+        self.cancel_button.config(state="disabled")
+
+    def toggle_pause(self):
+        if self.progress is None:
+            return
+        if self.progress.paused:
+            self.progress.resume()
+            self.pause_button.config(text="Pause")
+        else:
+            self.progress.pause()
+            self.pause_button.config(text="Resume")
 
-    def read_video_metadata(self, video_path):
-        if not self.ffprobe_path:
-            return f"File: {os.path.basename(video_path)}\n  ffprobe not found."
-        try:
-            cmd = [self.ffprobe_path, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", video_path]
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-            return json.dumps(json.loads(result.stdout), indent=4)
-        except Exception as e:
-            return f"Error reading video metadata for {os.path.basename(video_path)}: {e}"
-
-    def show_text_popup(self, title, content):
-        popup = tk.Toplevel(self)
-        popup.title(title)
-        popup.geometry("800x600")
-        text_area = tk.Text(popup, wrap="word", bg="#2b2b2b", fg="white", font=("Consolas", 10))
-        scrollbar = ttk.Scrollbar(popup, command=text_area.yview, style="light.Vertical.TScrollbar")
-        text_area.configure(yscrollcommand=scrollbar.set)
-        scrollbar.pack(side="right", fill="y")
-        text_area.pack(side="left", fill="both", expand=True)
-        text_area.insert("1.0", content)
-        text_area.config(state="disabled")
+    def cancel_batch(self):
+        if self.progress is None:
+            return
+        self.progress.cancel()
+        # Files already in flight finish (or their ffmpeg is killed); the rest never start.
+        self.pause_button.config(state="disabled", text="Pause")
+        self.cancel_button.config(state="disabled")
 
     # ==================================
     # == Conversion Logic (Threaded)
@@ -413,7 +753,7 @@ class MediaConverterApp(TkinterDnD.Tk):
 
         format_popup = tk.Toplevel(self)
         format_popup.title("Choose Format")
-        format_popup.geometry("300x150")
+        format_popup.geometry("300x310")
         format_popup.transient(self)
         ttk.Label(format_popup, text="Select output format:").pack(pady=10)
         has_svg = any(f.lower().endswith(".svg") for f in self.selected_files)
@@ -421,16 +761,37 @@ class MediaConverterApp(TkinterDnD.Tk):
         jpeg_radio.pack(pady=5)
         png_radio = ttk.Radiobutton(format_popup, text="PNG", variable=self.save_format_var, value="PNG")
         png_radio.pack(pady=5)
+        webp_radio = ttk.Radiobutton(format_popup, text="WebP", variable=self.save_format_var, value="WEBP")
+        webp_radio.pack(pady=5)
+        avif_radio = ttk.Radiobutton(format_popup, text="AVIF", variable=self.save_format_var, value="AVIF")
+        avif_radio.pack(pady=5)
+        original_radio = ttk.Radiobutton(format_popup, text="Original (lossless metadata strip)", variable=self.save_format_var, value=ORIGINAL_FORMAT)
+        original_radio.pack(pady=5)
+        for fmt, radio in (("WEBP", webp_radio), ("AVIF", avif_radio)):
+            if not format_supported(fmt):
+                radio.config(state="disabled")
+                if self.save_format_var.get() == fmt:
+                    self.save_format_var.set("JPEG")
+        profile_frame = ttk.Frame(format_popup)
+        profile_frame.pack(pady=5)
+        ttk.Label(profile_frame, text="Encoder profile:").pack(side="left")
+        ttk.Combobox(profile_frame, values=PROFILES, width=10, state="readonly", textvariable=self.encoder_profile_var).pack(side="left", padx=5)
         if has_svg:
             self.save_format_var.set("PNG")
-            jpeg_radio.config(state="disabled")
-            if not cairosvg:
+            for radio in (jpeg_radio, webp_radio, avif_radio, original_radio):
+                radio.config(state="disabled")
+            if not svg_supported():
                 messagebox.showerror("Missing Dependency", "Please install 'cairosvg' to convert SVG files.\n(pip install cairosvg)")
                 format_popup.destroy()
                 return
 
         def on_confirm():
             format_popup.destroy()
+            try:
+                renditions = self.get_renditions()
+            except ValueError:
+                messagebox.showerror("Error", "Smaller copy sizes must be whole numbers of pixels, separated by commas.")
+                return
             ask_output = messagebox.askyesno(
                 "Save Location",
                 "Do you want to choose a different output folder? (No = save in source folder)"
@@ -441,75 +802,76 @@ class MediaConverterApp(TkinterDnD.Tk):
                     return
             else:
                 output_folder = None
-            threading.Thread(target=self.image_conversion_worker, args=(output_folder,), daemon=True).start()
+            threading.Thread(target=self.image_conversion_worker, args=(output_folder, renditions), daemon=True).start()
 
         ttk.Button(format_popup, text="Confirm & Continue", command=on_confirm, style="primary.TButton").pack(pady=10)
 
-    def image_conversion_worker(self, output_folder):
-        self.after(0, self.set_ui_state, False)
-        skipped_files = []
-        files_to_process = [f for f in self.selected_files if os.path.isfile(f) and os.path.splitext(f)[1].lower() in SUPPORTED_IMAGE_EXTS]
-        total_files = len(files_to_process)
-        self.after(0, self.progress_bar.config, {"maximum": total_files, "value": 0})
+    def get_batch_manifest(self):
+        if self.batch_manifest is None:
+            self.batch_manifest = BatchManifest()
+        return self.batch_manifest
+
+    def get_content_index(self):
+        """The content index for de-duplicating inputs, or None when that's switched off."""
+        if not self.dedupe_var.get():
+            return None
+        if self.content_index is None:
+            self.content_index = ContentIndex()
+        return self.content_index
+
+    def get_renditions(self):
+        """The main output plus one copy per size in the extra sizes box; empty when there are none."""
+        sizes = [int(part) for part in self.extra_sizes_var.get().replace(" ", "").split(",") if part]
+        if not sizes:
+            return ()
+        if any(size <= 0 for size in sizes):
+            raise ValueError("sizes must be positive")
         target_format = self.save_format_var.get()
+        # Resized copies can't keep the original container, so they fall back to JPEG.
+        copy_format = "JPEG" if target_format == ORIGINAL_FORMAT else target_format
+        main = Rendition(target_format, scale=0.5 if self.resize_images_var.get() else 1.0)
+        return (main,) + tuple(Rendition(copy_format, max_size=size, suffix=f"_{size}") for size in sorted(set(sizes), reverse=True))
+
+    def get_image_options(self, renditions=()):
+        return ConvertOptions(
+            target_format=self.save_format_var.get(),
+            remove_metadata=self.remove_metadata_var.get(),
+            resize=self.resize_images_var.get(),
+            keep_icc=self.keep_icc_var.get(),
+            renditions=renditions,
+            profile=self.encoder_profile_var.get(),
+        )
 
-        for idx, path in enumerate(files_to_process):
-            filename = os.path.basename(path)
-            self.after(0, self.progress_label.config, {"text": f"Processing {idx + 1}/{total_files}: {filename}"})
-            self.after(0, self.progress_bar.config, {"value": idx + 1})
+    def get_worker_count(self):
+        try:
+            return int(self.worker_count_var.get())
+        except (tk.TclError, ValueError):
+            return default_worker_count()
 
-            try:
-                ext = os.path.splitext(path)[1].lower()
-                if output_folder:
-                    out_dir = output_folder
-                else:
-                    out_dir = os.path.dirname(path)
-                out_filename = os.path.splitext(filename)[0] + "_processed." + target_format.lower()
-                out_path = os.path.join(out_dir, out_filename)
-
-                if ext == '.svg':
-                    if target_format == "PNG" and cairosvg:
-                        cairosvg.svg2png(url=path, write_to=out_path)
-                        continue
-                    else:
-                        raise ValueError("SVG can only be converted to PNG.")
-
-                if ext == '.heic':
-                    heif_file = pillow_heif.read_heif(path)
-                    img = Image.frombytes(heif_file.mode, heif_file.size, heif_file.data, "raw")
-                else:
-                    img = Image.open(path)
-
-                if self.remove_metadata_var.get():
-                    pixel_data = list(img.getdata())
-                    img = Image.new(img.mode, img.size)
-                    img.putdata(pixel_data)
-
-                if self.resize_images_var.get():
-                    w, h = img.size
-                    img = img.resize((w // 2, h // 2), Image.Resampling.LANCZOS)
-
-                if target_format == "JPEG":
-                    if img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    img.save(out_path, 'JPEG', quality=95)
-                else:
-                    img.save(out_path, 'PNG')
-
-            except Exception as e:
-                logging.error(f"Error converting {filename}: {e}")
-                skipped_files.append(filename)
+    def image_conversion_worker(self, output_folder, renditions=()):
+        files_to_process = [f for f in self.selected_files if os.path.isfile(f) and os.path.splitext(f)[1].lower() in SUPPORTED_IMAGE_EXTS]
+        progress = ProgressChannel(len(files_to_process))
+        self.after(0, self.start_progress, progress)
+        options = self.get_image_options(renditions)
+        workers = self.get_worker_count()
+
+        trace = BatchTrace("Images")
+        results = convert_images(files_to_process, output_folder, options, workers=workers, manifest=self.get_batch_manifest(),
+                                 force=not self.skip_up_to_date_var.get(), trace=trace, progress=progress,
+                                 dedup=self.get_content_index())
+        self.log_trace(trace)
+        skipped_files = [os.path.basename(r.path) for r in results if r.error]
+        cancelled = sum(1 for r in results if r.cancelled)
 
-        self.after(0, self.progress_bar.config, {"value": total_files})
-        self.after(0, self.on_conversion_complete, skipped_files, "Images")
+        self.after(0, self.on_conversion_complete, skipped_files, "Images", encoding_summary(results), cancelled)
 
     def start_video_processing(self):
-        if not self.ffmpeg_path:
-            messagebox.showerror("Error", "FFmpeg is not installed or not in PATH.")
-            return
         if not self.selected_files:
             messagebox.showerror("Error", "Please select video files to process.")
             return
+        if not self.ffmpeg_path and not any(can_strip_natively(f, self.remove_metadata_var.get()) for f in self.selected_files):
+            messagebox.showerror("Error", "FFmpeg is not installed or not in PATH.\n(MP4/MOV metadata can be removed without it.)")
+            return
 
         ask_output = messagebox.askyesno(
             "Save Location",
@@ -525,48 +887,147 @@ class MediaConverterApp(TkinterDnD.Tk):
         threading.Thread(target=self.video_processing_worker, args=(output_folder,), daemon=True).start()
 
     def video_processing_worker(self, output_folder):
-        self.after(0, self.set_ui_state, False)
         skipped_files = []
         files_to_process = [f for f in self.selected_files if os.path.isfile(f) and os.path.splitext(f)[1].lower() in SUPPORTED_VIDEO_EXTS]
-        total_files = len(files_to_process)
-        self.after(0, self.progress_bar.config, {"maximum": total_files, "value": 0})
-
-        for idx, path in enumerate(files_to_process):
-            filename = os.path.basename(path)
-            ext = os.path.splitext(path)[1].lower()
-            if output_folder:
-                out_dir = output_folder
-            else:
-                out_dir = os.path.dirname(path)
-            out_filename = os.path.splitext(filename)[0] + "_processed.mp4"
-            out_path = os.path.join(out_dir, out_filename)
+        # Also fed ffmpeg's per-file progress, so long remuxes still move the bar.
+        progress = ProgressChannel(len(files_to_process))
+        self.after(0, self.start_progress, progress)
+
+        def on_result(result, done, total):
+            if result.error:
+                filename = os.path.basename(result.key)
+                logging.error(f"Error processing video {filename}: {result.error}")
+                skipped_files.append(filename)
 
-            self.after(0, self.progress_label.config, {"text": f"Processing {idx + 1}/{total_files}: {filename}"})
-            self.after(0, self.progress_bar.config, {"value": idx + 1})
+        trace = BatchTrace("Videos")
+        results = process_videos(files_to_process, output_folder, self.ffmpeg_path,
+                                 remove_metadata=self.remove_metadata_var.get(), on_result=on_result,
+                                 manifest=self.get_batch_manifest(), force=not self.skip_up_to_date_var.get(),
+                                 trace=trace, progress=progress, dedup=self.get_content_index())
+        self.log_trace(trace)
+        cancelled = sum(1 for r in results if r.cancelled)
 
-            try:
-                cmd = [self.ffmpeg_path, '-i', path, '-y']
-                if self.remove_metadata_var.get():
-                    cmd.extend(['-map_metadata', '-1'])
-                cmd.extend(['-c:v', 'copy', '-c:a', 'copy', out_path])
-                subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            except Exception as e:
-                logging.error(f"Error processing video {filename}: {e}")
-                skipped_files.append(filename)
+        self.after(0, self.on_conversion_complete, skipped_files, "Videos", None, cancelled)
 
-        self.after(0, self.progress_bar.config, {"value": total_files})
-        self.after(0, self.on_conversion_complete, skipped_files, "Videos")
+    # ==================================
+    # == Watch Folder
+    # ==================================
+    def toggle_watch(self):
+        """Starts converting whatever lands in a folder, with the current options, or stops."""
+        if self.watcher is not None:
+            self.stop_watching()
+            return
+        try:
+            renditions = self.get_renditions()
+        except ValueError:
+            messagebox.showerror("Error", "Smaller copy sizes must be whole numbers of pixels, separated by commas.")
+            return
+        folder = filedialog.askdirectory(title="Select Folder to Watch")
+        if not folder:
+            return
+        # Outputs saved next to their sources would land in the watched folder, so ask where they go.
+        output_folder = filedialog.askdirectory(title="Select Output Folder")
+        if not output_folder:
+            return
+        remove_metadata = self.remove_metadata_var.get()
+        workers = self.get_worker_count()
+        options = self.get_image_options(renditions)
+        exts = options.source_exts() + (SUPPORTED_VIDEO_EXTS if self.ffmpeg_path or remove_metadata else ())
+        settings = {
+            "options": options,
+            "workers": workers,
+            "remove_metadata": remove_metadata,
+            "force": not self.skip_up_to_date_var.get(),
+            "dedup": self.get_content_index(),
+            # Started once and reused by every batch, so a lone new photo doesn't wait for workers to spawn.
+            "pool": make_pool(workers) if workers > 1 else None,
+        }
+        self.watch_counts = [0, 0]
+        self.watch_settings = settings
+        self.watch_queue = IngestQueue(lambda paths: self.watch_worker(paths, output_folder, settings))
+        self.watcher = FolderWatcher([folder], exts, self.watch_queue.put, ignore=[output_folder])
+        self.watch_button.config(text="Stop Watching", style="danger.TButton")
+        self.watch_label.config(text=f"Watching {os.path.basename(folder) or folder} for new files...")
+        logging.info(f"Watching {folder} ({self.watcher.mode}), saving to {output_folder}")
+
+    def watch_worker(self, paths, output_folder, settings):
+        """Runs on the watch queue's thread for each batch of files that have finished arriving."""
+        images = [p for p in paths if os.path.splitext(p)[1].lower() in SUPPORTED_IMAGE_EXTS]
+        videos = [p for p in paths if p not in images]
+        results = []
+        trace = BatchTrace("Watch")
+        if images:
+            settings["pool"] = ensure_pool(settings["pool"], settings["workers"])
+            # Failures are logged by convert_images.
+            results += convert_images(images, output_folder, settings["options"], workers=settings["workers"],
+                                      manifest=self.get_batch_manifest(), force=settings["force"], trace=trace,
+                                      dedup=settings["dedup"], pool=settings["pool"])
+        if videos:
+            video_results = process_videos(videos, output_folder, self.ffmpeg_path, remove_metadata=settings["remove_metadata"],
+                                           manifest=self.get_batch_manifest(), force=settings["force"], trace=trace,
+                                           dedup=settings["dedup"])
+            for result in video_results:
+                if result.error:
+                    logging.error(f"Error processing video {os.path.basename(result.key)}: {result.error}")
+            results += video_results
+        self.log_trace(trace)
+        self.after(0, self.on_watch_batch, len(results), sum(1 for r in results if r.error))
+
+    def on_watch_batch(self, done, failed):
+        if self.watcher is None:
+            return
+        self.watch_counts[0] += done
+        self.watch_counts[1] += failed
+        done, failed = self.watch_counts
+        self.watch_label.config(text=f"Watching: {done} files processed" + (f", {failed} failed" if failed else ""))
+
+    def stop_watching(self):
+        watcher, watch_queue, settings = self.watcher, self.watch_queue, self.watch_settings
+        self.watcher = self.watch_queue = self.watch_settings = None
+        self.watch_button.config(text="Watch Folder...", style="primary.TButton")
+        self.watch_label.config(text="Stopped watching.")
+
+        def finish():
+            # Lets the batch in progress and anything already queued finish, off the UI thread.
+            watcher.stop()
+            watch_queue.stop()
+            if settings["pool"] is not None:
+                settings["pool"].shutdown()
+
+        threading.Thread(target=finish, daemon=True).start()
+
+    def log_trace(self, trace):
+        """Logs where a batch's time went and keeps its Chrome trace with the last few in the cache folder."""
+        trace.finish()
+        if not trace.files:
+            return
+        logging.info(trace.summary())
+        try:
+            logging.info(f"Trace saved to {save_recent_trace(trace, user_cache_dir('traces'))}")
+        except OSError as e:
+            logging.warning(f"Could not save the batch trace: {e}")
 
-    def on_conversion_complete(self, skipped_files, file_type):
+    def on_conversion_complete(self, skipped_files, file_type, summary=None, cancelled=0):
+        self.stop_progress()
         self.set_ui_state(True)
-        self.progress_label.config(text="Done!")
+        status = "Cancelled." if cancelled else "Done!"
+        self.progress_label.config(text=f"{status} {summary}" if summary else status)
+        details = f"\n\n{summary}" if summary else ""
+        if cancelled:
+            details = f"\n\n{cancelled} {file_type.lower()} were not processed because the batch was cancelled.{details}"
         if skipped_files:
-            message = f"Completed, but some {file_type.lower()} were skipped:\n\n{', '.join(skipped_files)}"
+            message = f"Completed, but some {file_type.lower()} were skipped:\n\n{', '.join(skipped_files)}{details}"
             messagebox.showwarning("Completed with Errors", message)
+        elif cancelled:
+            messagebox.showinfo("Cancelled", f"Batch cancelled.{details}")
         else:
-            messagebox.showinfo("Completed", f"All {file_type.lower()} processed successfully!")
+            messagebox.showinfo("Completed", f"All {file_type.lower()} processed successfully!{details}")
 
 
 if __name__ == "__main__":
-    app = MediaConverterApp()
+    # Needed for the conversion process pool in frozen (PyInstaller) builds.
+    multiprocessing.freeze_support()
+    startup = StartupTimer(STARTED_AT)
+    startup.mark("imports")
+    app = MediaConverterApp(startup)
     app.mainloop()
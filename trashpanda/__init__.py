@@ -0,0 +1,5 @@
+"""
+Trash Panda core: media conversion logic shared by the GUI and its worker processes.
+
+Nothing in this package may import tkinter, tkinterdnd2 or ttkbootstrap.
+"""
@@ -0,0 +1,84 @@
+"""
+Optional codec backends, imported the first time a file needs one.
+
+pillow_heif, rawpy and cairosvg each take tens to hundreds of milliseconds to
+import (more from a cold disk or a packaged build), and most batches never
+touch a HEIC, RAW or SVG file. backend() imports one on first use, once per
+process, and remembers whether it loaded; load_for(paths) imports whatever a
+list of files is going to need, so a folder scan can warm them up before the
+first file is opened.
+"""
+import importlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+BACKEND_MODULES = {"heif": "pillow_heif", "raw": "rawpy", "svg": "cairosvg"}
+
+EXT_BACKENDS = {
+    '.heic': "heif", '.heif': "heif",
+    '.raf': "raw", '.cr2': "raw", '.cr3': "raw", '.arw': "raw", '.nef': "raw", '.dng': "raw",
+    '.svg': "svg",
+}
+
+_loaded = {}
+# Seconds each backend that loaded took to import, for the startup report.
+load_times = {}
+_lock = threading.Lock()
+
+
+def _register_heif(module):
+    # Lets Image.open read HEIC/HEIF as well as pillow_heif.open_heif.
+    module.register_heif_opener()
+
+
+_SETUP = {"heif": _register_heif}
+
+
+def backend(name):
+    """The backend's module (see BACKEND_MODULES), imported on first use, or None if it isn't available."""
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+    with _lock:
+        if name not in _loaded:
+            start = time.perf_counter()
+            try:
+                module = importlib.import_module(BACKEND_MODULES[name])
+                setup = _SETUP.get(name)
+                if setup:
+                    setup(module)
+            except (ImportError, OSError) as e:
+                # OSError: installed, but its native library (e.g. libcairo) is missing.
+                logging.info(f"{BACKEND_MODULES[name]} is not available: {e}")
+                module = None
+            else:
+                load_times[name] = time.perf_counter() - start
+            _loaded[name] = module
+    return _loaded[name]
+
+
+def installed(name):
+    """True if the backend's package is installed. Doesn't import it."""
+    return importlib.util.find_spec(BACKEND_MODULES[name]) is not None
+
+
+def backend_name_for(path):
+    return EXT_BACKENDS.get(os.path.splitext(path)[1].lower())
+
+
+def backend_for(path):
+    """The backend path's extension needs, loaded; None if it needs none or it isn't available."""
+    name = backend_name_for(path)
+    return backend(name) if name else None
+
+
+def load_for(paths):
+    """Imports every backend the given files need that isn't loaded yet. Returns their names."""
+    needed = {backend_name_for(path) for path in paths} - {None} - set(_loaded)
+    for name in sorted(needed):
+        backend(name)
+    return needed
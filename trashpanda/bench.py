@@ -0,0 +1,383 @@
+"""
+Benchmark harness.
+
+Builds a reproducible synthetic corpus (JPEG, PNG, HEIC, WebP and SVG at
+several resolutions, JPEGs with large EXIF/XMP blocks and, when ffmpeg is
+available, short test clips), times each pipeline stage on it and compares the
+numbers with a stored JSON baseline:
+
+    python -m trashpanda bench -o baseline.json
+    python -m trashpanda bench --baseline baseline.json    # exits 1 on a regression
+
+Every stage runs in a fresh process, so its peak memory is its own.
+"""
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from .backends import BACKEND_MODULES, backend
+from .convert import SUPPORTED_IMAGE_EXTS
+from .decode import decode_image
+from .encoders import encode, format_supported
+from .metadata import read_metadata_batch
+from .paths import atomic_output, user_cache_dir
+from .scan import iter_files
+from .strip import LOSSLESS_STRIP_EXTS, strip_file
+from .trace import peak_rss_mb
+from .video import SUPPORTED_VIDEO_EXTS, process_videos
+
+# Bump when the corpus recipe changes, so old baselines aren't compared against new files.
+CORPUS_VERSION = 1
+# Resolution and number of files per format at that resolution.
+CORPUS_SIZES = {"small": ((640, 480), 4), "medium": ((1920, 1080), 2), "large": ((4032, 3024), 1)}
+QUICK_SIZES = ("small", "medium")
+CORPUS_IMAGE_FORMATS = {".jpg": ("JPEG", {"quality": 90}), ".png": ("PNG", {}), ".heic": ("HEIF", {"quality": 80}),
+                        ".webp": ("WEBP", {"quality": 80})}
+CLIP_EXTS = (".mp4", ".mov", ".mkv")
+CLIP_SECONDS = 3
+
+STAGES = ("scan", "probe", "decode", "render", "resize", "encode", "write", "strip", "video")
+ENCODE_FORMATS = ("JPEG", "PNG", "WEBP")
+DEFAULT_REPEAT = 3
+# A stage is a regression when it is this much slower (or bigger) than the baseline...
+DEFAULT_TOLERANCE = 0.25
+# ...and slower by at least this many seconds, so millisecond stages don't flap.
+MIN_SIGNIFICANT_SECONDS = 0.05
+
+ROW_HEADER = f"{'stage':<8} {'files':>6} {'seconds':>9} {'files/s':>9} {'MB/s':>8} {'peak MB':>8}"
+
+
+def default_corpus_dir(quick=False):
+    return user_cache_dir("bench", f"corpus-v{CORPUS_VERSION}{'-quick' if quick else ''}")
+
+
+def _synthetic_photo(size, seed):
+    """Gradients, hard-edged shapes and a little noise, so every codec has real work to do."""
+    rnd = random.Random(seed)
+    width, height = size
+    gradient = Image.linear_gradient("L")
+    img = Image.merge("RGB", [gradient.rotate(rnd.randrange(360)).resize(size) for _ in range(3)])
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x0, y0 = rnd.randrange(width), rnd.randrange(height)
+        box = (x0, y0, x0 + rnd.randrange(width // 4 + 1), y0 + rnd.randrange(height // 4 + 1))
+        fill = tuple(rnd.randrange(256) for _ in range(3))
+        if rnd.random() < 0.5:
+            draw.ellipse(box, fill=fill)
+        else:
+            draw.rectangle(box, fill=fill)
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    noise = Image.frombytes("L", size, rnd.randbytes(width * height)).convert("RGB")
+    return Image.blend(img, noise, 0.08)
+
+
+def _large_exif(seed):
+    """About 50 KB of EXIF, with a GPS block, a maker note and a long user comment."""
+    rnd = random.Random(seed)
+    exif = Image.Exif()
+    exif[0x010F] = "TrashPanda"
+    exif[0x0110] = "Benchmark Camera"
+    exif[0x0132] = "2024:01:01 12:00:00"
+    exif_ifd = exif.get_ifd(0x8769)
+    exif_ifd[0x927C] = rnd.randbytes(32 * 1024)
+    exif_ifd[0x9286] = b"ASCII\x00\x00\x00" + b"benchmark " * 1600
+    gps = exif.get_ifd(0x8825)
+    gps.update({1: "N", 2: (37.0, 20.0, 5.6), 3: "W", 4: (122.0, 0.0, 32.4)})
+    return exif
+
+
+def _synthetic_svg(size, seed):
+    rnd = random.Random(seed)
+    width, height = size
+    shapes = []
+    for _ in range(200):
+        colour = f"#{rnd.randrange(0x1000000):06x}"
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        if rnd.random() < 0.5:
+            shapes.append(f'<circle cx="{x}" cy="{y}" r="{rnd.randrange(5, width // 8)}" fill="{colour}" fill-opacity="0.6"/>')
+        else:
+            shapes.append(f'<rect x="{x}" y="{y}" width="{rnd.randrange(5, width // 4)}" height="{rnd.randrange(5, height // 4)}" fill="{colour}"/>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+            f'<metadata>TrashPanda benchmark</metadata>{"".join(shapes)}</svg>')
+
+
+def clip_command(ffmpeg_path, out_path):
+    """ffmpeg's own test pattern and tone, with the kind of tags phones write."""
+    return [ffmpeg_path, "-y", "-v", "error",
+            "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=30:duration={CLIP_SECONDS}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={CLIP_SECONDS}",
+            "-c:v", "mpeg4", "-q:v", "5", "-c:a", "aac",
+            "-metadata", "title=TrashPanda benchmark", "-metadata", "location=+37.3349-122.0090/", out_path]
+
+
+def make_corpus(folder, quick=False, ffmpeg_path=None):
+    """
+    Writes the benchmark corpus into folder (once; later calls find it complete).
+    The same version always produces the same images; clips need ffmpeg.
+    """
+    marker = os.path.join(folder, ".complete")
+    if os.path.exists(marker):
+        return folder
+    formats = dict(CORPUS_IMAGE_FORMATS)
+    # Also registers the HEIF writer.
+    if backend("heif") is None:
+        logging.warning("pillow_heif is not installed: the corpus has no HEIC files.")
+        formats = {ext: fmt for ext, fmt in formats.items() if fmt[0] != "HEIF"}
+    images = os.path.join(folder, "images")
+    os.makedirs(images, exist_ok=True)
+    for name in (QUICK_SIZES if quick else CORPUS_SIZES):
+        size, count = CORPUS_SIZES[name]
+        for n in range(count):
+            stem = f"{name}_{n}"
+            img = _synthetic_photo(size, stem)
+            for ext, (fmt, params) in formats.items():
+                with atomic_output(os.path.join(images, stem + ext)) as tmp_path:
+                    img.save(tmp_path, fmt, **params)
+            with atomic_output(os.path.join(images, f"{stem}_exif.jpg")) as tmp_path:
+                img.save(tmp_path, "JPEG", quality=90, exif=_large_exif(stem),
+                         xmp=b'<x:xmpmeta xmlns:x="adobe:ns:meta/">' + b" " * 16 * 1024 + b"</x:xmpmeta>")
+            with open(os.path.join(images, stem + ".svg"), "w", encoding="utf-8") as f:
+                f.write(_synthetic_svg(size, stem))
+    if ffmpeg_path:
+        videos = os.path.join(folder, "videos")
+        os.makedirs(videos, exist_ok=True)
+        for ext in CLIP_EXTS:
+            with atomic_output(os.path.join(videos, "clip" + ext)) as tmp_path:
+                subprocess.run(clip_command(ffmpeg_path, tmp_path), check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if len(formats) == len(CORPUS_IMAGE_FORMATS):
+        # Left unmarked without HEIC, so the corpus is finished once pillow_heif is installed.
+        with open(marker, "w") as f:
+            f.write(str(CORPUS_VERSION))
+    return folder
+
+
+def _corpus_files(corpus):
+    """(raster images, SVGs, videos) in corpus. SVGs are rendered rather than decoded, so they get a stage of their own."""
+    images, svgs = [], []
+    for path in iter_files(corpus, SUPPORTED_IMAGE_EXTS):
+        (svgs if path.endswith(".svg") else images).append(path)
+    videos = list(iter_files(corpus, SUPPORTED_VIDEO_EXTS))
+    return images, svgs, videos
+
+
+def _decoded(path):
+    img = decode_image(path, memory_limit_mb=None)
+    img.load()
+    return img
+
+
+def _out_path(out_dir, path, ext=None):
+    stem, source_ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(out_dir, stem + (ext or source_ext))
+
+
+# Each stage returns (seconds, files, bytes). Only the work the stage is named after is
+# timed; anything it needs first (decoding, for the resize and encode stages) is not.
+
+def _stage_scan(corpus, out_dir, tools):
+    start = time.perf_counter()
+    paths = list(iter_files(corpus, SUPPORTED_IMAGE_EXTS + SUPPORTED_VIDEO_EXTS))
+    return time.perf_counter() - start, len(paths), 0
+
+
+def _stage_probe(corpus, out_dir, tools):
+    images, _, videos = _corpus_files(corpus)
+    paths = images + (videos if tools["ffprobe"] else [])
+    start = time.perf_counter()
+    read_metadata_batch(paths, tools["ffprobe"])
+    return time.perf_counter() - start, len(paths), sum(os.path.getsize(p) for p in paths)
+
+
+def _stage_decode(corpus, out_dir, tools):
+    images, _, _ = _corpus_files(corpus)
+    seconds = 0.0
+    for path in images:
+        start = time.perf_counter()
+        _decoded(path)
+        seconds += time.perf_counter() - start
+    return seconds, len(images), sum(os.path.getsize(p) for p in images)
+
+
+def _stage_render(corpus, out_dir, tools):
+    _, svgs, _ = _corpus_files(corpus)
+    cairosvg = backend("svg")
+    start = time.perf_counter()
+    for path in svgs:
+        with atomic_output(_out_path(out_dir, path, ".png")) as tmp_path:
+            cairosvg.svg2png(url=path, write_to=tmp_path)
+    return time.perf_counter() - start, len(svgs), sum(os.path.getsize(p) for p in svgs)
+
+
+def _stage_resize(corpus, out_dir, tools):
+    images, _, _ = _corpus_files(corpus)
+    seconds, total = 0.0, 0
+    for path in images:
+        img = _decoded(path)
+        start = time.perf_counter()
+        img.resize((img.width // 2, img.height // 2), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        seconds += time.perf_counter() - start
+        total += os.path.getsize(path)
+    return seconds, len(images), total
+
+
+def _stage_encode(corpus, out_dir, tools):
+    images, _, _ = _corpus_files(corpus)
+    formats = [fmt for fmt in ENCODE_FORMATS if format_supported(fmt)]
+    seconds, total = 0.0, 0
+    for path in images:
+        img = _decoded(path)
+        for fmt in formats:
+            buf = io.BytesIO()
+            start = time.perf_counter()
+            encode(img, buf, fmt)
+            seconds += time.perf_counter() - start
+            total += buf.tell()
+    return seconds, len(images) * len(formats), total
+
+
+def _stage_write(corpus, out_dir, tools):
+    images, _, _ = _corpus_files(corpus)
+    seconds, total = 0.0, 0
+    for path in images:
+        buf = io.BytesIO()
+        encode(_decoded(path), buf, "JPEG")
+        data = buf.getvalue()
+        start = time.perf_counter()
+        with atomic_output(_out_path(out_dir, path, ".jpg")) as tmp_path:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+        seconds += time.perf_counter() - start
+        total += len(data)
+    return seconds, len(images), total
+
+
+def _stage_strip(corpus, out_dir, tools):
+    paths = [p for p in iter_files(corpus, LOSSLESS_STRIP_EXTS)]
+    start = time.perf_counter()
+    for path in paths:
+        with atomic_output(_out_path(out_dir, path)) as tmp_path:
+            strip_file(path, tmp_path)
+    return time.perf_counter() - start, len(paths), sum(os.path.getsize(p) for p in paths)
+
+
+def _stage_video(corpus, out_dir, tools):
+    _, _, videos = _corpus_files(corpus)
+    start = time.perf_counter()
+    results = process_videos(videos, out_dir, tools["ffmpeg"])
+    failed = [r.error for r in results if r.error]
+    if failed:
+        raise RuntimeError(f"video processing failed: {failed[0]}")
+    return time.perf_counter() - start, len(videos), sum(os.path.getsize(p) for p in videos)
+
+
+_STAGE_FUNCS = {
+    "scan": _stage_scan, "probe": _stage_probe, "decode": _stage_decode, "render": _stage_render, "resize": _stage_resize,
+    "encode": _stage_encode, "write": _stage_write, "strip": _stage_strip, "video": _stage_video,
+}
+
+
+def _run_stage(stage, corpus, repeat, tools):
+    """Pool entry point: runs one stage `repeat` times and keeps the fastest run."""
+    # Imported up front so no stage's timing includes loading a codec.
+    for name in BACKEND_MODULES:
+        backend(name)
+    best = None
+    for _ in range(max(1, repeat)):
+        with tempfile.TemporaryDirectory(prefix="trashpanda-bench-") as out_dir:
+            run = _STAGE_FUNCS[stage](corpus, out_dir, tools)
+        if best is None or run[0] < best[0]:
+            best = run
+    seconds, files, nbytes = best
+    peak = peak_rss_mb()
+    return {
+        "seconds": round(seconds, 4),
+        "files": files,
+        "mb": round(nbytes / 1e6, 3),
+        "files_per_s": round(files / seconds, 2) if seconds else None,
+        "mb_per_s": round(nbytes / 1e6 / seconds, 2) if seconds and nbytes else None,
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+    }
+
+
+def run_benchmarks(corpus, stages=STAGES, repeat=DEFAULT_REPEAT, ffmpeg_path=None, ffprobe_path=None, on_stage=None):
+    """
+    Times each stage on corpus and returns the results as a JSON-ready dict.
+    on_stage(stage, result) is called as each one finishes.
+    """
+    tools = {"ffmpeg": ffmpeg_path, "ffprobe": ffprobe_path}
+    _, svgs, videos = _corpus_files(corpus)
+    results = {
+        "corpus_version": CORPUS_VERSION,
+        "corpus_files": sum(1 for _ in iter_files(corpus, SUPPORTED_IMAGE_EXTS + SUPPORTED_VIDEO_EXTS)),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pillow": Image.__version__,
+        "repeat": repeat,
+        "stages": {},
+    }
+    ctx = multiprocessing.get_context("spawn")
+    for stage in stages:
+        if stage == "video" and not videos:
+            continue
+        if stage == "render" and (not svgs or backend("svg") is None):
+            if svgs:
+                logging.warning("cairosvg is not available: the render stage is skipped.")
+            continue
+        # A fresh process per stage, so peak memory isn't inherited from the one before.
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            result = pool.submit(_run_stage, stage, corpus, repeat, tools).result()
+        results["stages"][stage] = result
+        if on_stage:
+            on_stage(stage, result)
+    return results
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns a message per stage that got slower, or used more memory, than baseline by more than tolerance."""
+    regressions = []
+    if baseline.get("corpus_version") != results.get("corpus_version") or baseline.get("corpus_files") != results.get("corpus_files"):
+        return ["baseline was recorded on a different corpus; record a new one"]
+    for stage, now in results["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or before.get("files") != now["files"]:
+            continue
+        old, new = before.get("seconds"), now["seconds"]
+        if old and new > old * (1 + tolerance) and new - old >= MIN_SIGNIFICANT_SECONDS:
+            regressions.append(f"{stage}: {old:.3f} s -> {new:.3f} s (+{new / old - 1:.0%})")
+        old, new = before.get("peak_rss_mb"), now.get("peak_rss_mb")
+        if old and new and new > old * (1 + tolerance):
+            regressions.append(f"{stage}: peak memory {old:.0f} MB -> {new:.0f} MB (+{new / old - 1:.0%})")
+    return regressions
+
+
+def format_row(stage, result, baseline=None):
+    def num(value, width, places):
+        return f"{value:>{width}.{places}f}" if value is not None else f"{'-':>{width}}"
+    row = (f"{stage:<8} {result['files']:>6} {result['seconds']:>9.3f} {num(result['files_per_s'], 9, 1)} "
+           f"{num(result['mb_per_s'], 8, 1)} {num(result['peak_rss_mb'], 8, 0)}")
+    before = (baseline or {}).get("stages", {}).get(stage)
+    if before and before.get("seconds"):
+        row += f" {result['seconds'] / before['seconds'] - 1:>+8.0%}"
+    return row
+
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with atomic_output(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
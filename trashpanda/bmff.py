@@ -0,0 +1,52 @@
+"""
+Minimal ISO base media file format (MP4/MOV/HEIF/CR3) box walking.
+"""
+import struct
+from collections import namedtuple
+
+# type: 4-byte box type; start: offset of the box header; payload: offset of the
+# first payload byte (after any largesize/usertype); end: offset just past the box.
+Box = namedtuple("Box", "type start payload end uuid")
+
+
+def iter_boxes(buf, start=0, end=None):
+    """Yields the boxes laid out back to back in buf[start:end]. Stops quietly at truncated data."""
+    end = len(buf) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        uuid = None
+        if box_type == b"uuid":
+            uuid = bytes(buf[pos + header:pos + header + 16])
+            header += 16
+        if size < header or pos + size > end:
+            return
+        yield Box(box_type, pos, pos + header, pos + size, uuid)
+        pos += size
+
+
+def find_box(buf, box_type, start=0, end=None):
+    """Returns the first box of box_type directly inside buf[start:end], or None."""
+    for box in iter_boxes(buf, start, end):
+        if box.type == box_type:
+            return box
+    return None
+
+
+def find_path(buf, path, start=0, end=None):
+    """Follows a list of box types (e.g. [b'moov', b'udta']) down from buf[start:end]."""
+    box = None
+    for box_type in path:
+        box = find_box(buf, box_type, start, end)
+        if box is None:
+            return None
+        start, end = box.payload, box.end
+    return box
@@ -0,0 +1,636 @@
+"""
+Headless command line interface.
+
+    python -m trashpanda convert photos/ -r -o out/ -f JPEG --resize -j 8
+    python -m trashpanda convert photos/ -o web/ --rendition full:jpeg:92 --rendition 2048:jpeg:85 --rendition 256:png
+    python -m trashpanda convert scans/ -o out/ -f WEBP --profile smallest
+    python -m trashpanda strip uploads/ -r -o clean/
+    python -m trashpanda convert big_batch/ -o out/ --stats --trace batch.json
+    python -m trashpanda video clips/ -o out/
+    python -m trashpanda watch incoming/ -r -o clean/ --settle 2
+    python -m trashpanda metadata card_dump/ -r --format csv -o card_dump.csv
+    python -m trashpanda query --kind video --creation-time
+    python -m trashpanda bench --baseline bench.json
+    python -m trashpanda serve --socket /tmp/trashpanda.sock
+    python -m trashpanda queue submit /mnt/shared/q archive/ -r -o /mnt/shared/out
+    python -m trashpanda queue work /mnt/shared/q
+
+Only the modules a command needs are imported, and never the GUI stack.
+"""
+import argparse
+import logging
+import os
+import sys
+
+# "ORIGINAL" mirrors convert.ORIGINAL_FORMAT and the profiles mirror encoders.PROFILES;
+# spelled out so --help doesn't import Pillow.
+IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "AVIF", "ORIGINAL")
+PROFILES = ("fast", "balanced", "smallest")
+
+
+def expand_inputs(inputs, exts, recursive=False):
+    """Yields the files named on the command line, expanding folders (one level unless recursive)."""
+    from .scan import iter_files
+
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for path in iter_files(item, exts, recursive):
+                if path not in seen:
+                    seen.add(path)
+                    yield path
+        elif os.path.isfile(item):
+            if item not in seen:
+                seen.add(item)
+                yield item
+        else:
+            logging.warning(f"Skipping {item}: no such file or directory")
+
+
+def _print_result(path, output, done, total, quiet, skipped=False, duplicate_of=None):
+    # Failures are already reported through logging by the workers.
+    if output and not quiet:
+        note = " (up to date)" if skipped else f" (identical to {duplicate_of})" if duplicate_of else ""
+        print(f"[{done}/{total}] {path} -> {output}{note}")
+
+
+def _report_video(result, done, total, quiet):
+    if result.error:
+        logging.error(f"Error processing video {os.path.basename(result.key)}: {result.error}")
+    else:
+        _print_result(result.key, result.output, done, total, quiet, result.skipped, result.duplicate_of)
+
+
+def _check_output_dir(output_dir):
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+
+def _rendition_arg(text):
+    from .renditions import parse_rendition
+    try:
+        return parse_rendition(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _open_manifest(args):
+    if args.no_manifest:
+        return None
+    from .manifest import BatchManifest
+    return BatchManifest(args.manifest, verify=args.verify)
+
+
+def _open_content_index(args):
+    if args.no_dedupe:
+        return None
+    from .dedup import ContentIndex
+    return ContentIndex(link=args.link_duplicates)
+
+
+def _open_trace(args, name):
+    if not (args.stats or args.trace):
+        return None
+    from .trace import BatchTrace
+    return BatchTrace(name)
+
+
+def _finish_trace(trace, args):
+    if trace is None:
+        return
+    trace.finish()
+    if args.stats:
+        print(trace.summary(), file=sys.stderr)
+    if args.trace:
+        trace.write_chrome_trace(args.trace)
+        print(f"Trace written to {args.trace}", file=sys.stderr)
+
+
+def _summary(results, done_word):
+    failed = sum(1 for r in results if r.error)
+    skipped = sum(1 for r in results if r.skipped)
+    duplicates = sum(1 for r in results if r.duplicate_of and not r.error)
+    done = len(results) - failed - skipped - duplicates
+    print(f"{done} {done_word}, {duplicates} identical to another, {skipped} up to date, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def _image_options(args, target_format=None):
+    """ConvertOptions from the image flags. Raises ValueError if they can't work."""
+    from .convert import ORIGINAL_FORMAT, ConvertOptions
+    from .encoders import format_supported
+    from .renditions import check_renditions
+
+    renditions = tuple(getattr(args, "renditions", None) or ())
+    try:
+        check_renditions(renditions)
+    except ValueError as e:
+        raise ValueError(f"Invalid renditions: {e}")
+    formats = {r.format for r in renditions} or {target_format or args.format}
+    for fmt in sorted(formats - {ORIGINAL_FORMAT}):
+        if not format_supported(fmt):
+            raise ValueError(f"This Pillow build can't write {fmt}.")
+    return ConvertOptions(
+        target_format=target_format or args.format,
+        remove_metadata=args.strip,
+        resize=args.resize,
+        keep_icc=args.keep_icc,
+        memory_limit_mb=args.memory_limit,
+        renditions=renditions,
+        profile=getattr(args, "profile", PROFILES[1]),
+    )
+
+
+def _usable_images(paths, options):
+    """paths without the files options can't handle (other formats when keeping the original), with a notice."""
+    exts = options.source_exts()
+    usable = [path for path in paths if os.path.splitext(path)[1].lower() in exts]
+    skipped = len(paths) - len(usable)
+    if skipped:
+        print(f"Skipping {skipped} file{'s' if skipped > 1 else ''}: keeping the original format only works for "
+              f"JPEG, PNG and WebP sources.", file=sys.stderr)
+    return usable
+
+
+def cmd_convert(args, target_format=None):
+    from .convert import SUPPORTED_IMAGE_EXTS, convert_images, encoding_summary
+
+    try:
+        options = _image_options(args, target_format)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    files = _usable_images(list(expand_inputs(args.inputs, SUPPORTED_IMAGE_EXTS, args.recursive)), options)
+    _check_output_dir(args.output)
+    manifest = _open_manifest(args)
+    dedup = _open_content_index(args)
+    trace = _open_trace(args, args.command)
+    try:
+        results = convert_images(
+            files, args.output, options, workers=args.workers,
+            on_result=lambda r, done, total: _print_result(r.path, ", ".join(r.outputs), done, total, args.quiet, r.skipped, r.duplicate_of),
+            manifest=manifest, force=args.force, trace=trace, dedup=dedup,
+        )
+    finally:
+        if manifest:
+            manifest.close()
+        if dedup:
+            dedup.close()
+    _finish_trace(trace, args)
+    status = _summary(results, "converted")
+    print(encoding_summary(results), file=sys.stderr)
+    return status
+
+
+def cmd_strip(args):
+    args.strip = True
+    args.resize = False
+    args.memory_limit = 0
+    return cmd_convert(args, target_format=IMAGE_FORMATS[-1])
+
+
+def cmd_video(args):
+    from .video import SUPPORTED_VIDEO_EXTS, find_ffmpeg_bin, process_videos
+
+    ffmpeg_path = find_ffmpeg_bin('ffmpeg')
+    if not ffmpeg_path:
+        if not args.strip:
+            print("FFmpeg is not installed or not in PATH.", file=sys.stderr)
+            return 2
+        logging.warning("FFmpeg not found: only MP4/MOV files can have their metadata removed.")
+    files = list(expand_inputs(args.inputs, SUPPORTED_VIDEO_EXTS, args.recursive))
+    _check_output_dir(args.output)
+    manifest = _open_manifest(args)
+    dedup = _open_content_index(args)
+    trace = _open_trace(args, args.command)
+    try:
+        results = process_videos(files, args.output, ffmpeg_path, remove_metadata=args.strip, max_concurrent=args.jobs,
+                                 timeout=args.timeout, on_result=lambda r, done, total: _report_video(r, done, total, args.quiet),
+                                 manifest=manifest, force=args.force, trace=trace, dedup=dedup)
+    finally:
+        if manifest:
+            manifest.close()
+        if dedup:
+            dedup.close()
+    _finish_trace(trace, args)
+    return _summary(results, "processed")
+
+
+def cmd_metadata(args):
+    from .convert import SUPPORTED_IMAGE_EXTS
+    from .video import SUPPORTED_VIDEO_EXTS, find_ffmpeg_bin
+    from .metadata import format_metadata, iter_metadata, write_csv, write_jsonl
+
+    ffprobe_path = find_ffmpeg_bin('ffprobe')
+    files = expand_inputs(args.inputs, SUPPORTED_IMAGE_EXTS + SUPPORTED_VIDEO_EXTS, args.recursive)
+
+    def write(records, out):
+        if args.format == "jsonl":
+            write_jsonl(records, out)
+        elif args.format == "csv":
+            write_csv(records, out)
+        else:
+            for record in records:
+                out.write(format_metadata(record) + "\n" + "=" * 40 + "\n")
+
+    def write_all(records):
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8', newline='') as out:
+                write(records, out)
+        else:
+            write(records, sys.stdout)
+
+    trace = _open_trace(args, args.command)
+    if args.no_index:
+        write_all(iter_metadata(files, ffprobe_path, trace=trace))
+    else:
+        from .index import MetadataIndex
+        with MetadataIndex(args.index_db) as index:
+            write_all(index.iter_refresh(files, ffprobe_path, trace=trace))
+    _finish_trace(trace, args)
+    return 0
+
+
+def cmd_query(args):
+    import json
+    from .index import MetadataIndex
+
+    with MetadataIndex(args.index_db) as index:
+        if args.prune:
+            print(f"Pruned {index.prune()} missing files", file=sys.stderr)
+        for record in index.query(kind=args.kind, has_gps=True if args.gps else None,
+                                  has_creation_time=True if args.creation_time else None,
+                                  under=args.under, limit=args.limit):
+            print(json.dumps(record) if args.json else record["path"])
+    return 0
+
+
+def cmd_bench(args):
+    from . import bench
+    from .video import find_ffmpeg_bin
+
+    ffmpeg_path = find_ffmpeg_bin('ffmpeg')
+    if not ffmpeg_path:
+        logging.warning("FFmpeg not found: the corpus has no video clips and the video stage is skipped.")
+    baseline = bench.load_baseline(args.baseline) if args.baseline else None
+    corpus = args.corpus or bench.default_corpus_dir(args.quick)
+    print(f"Corpus: {corpus}", file=sys.stderr)
+    bench.make_corpus(corpus, quick=args.quick, ffmpeg_path=ffmpeg_path)
+
+    print(bench.ROW_HEADER + (f" {'vs base':>8}" if baseline else ""))
+    results = bench.run_benchmarks(
+        corpus, stages=args.stages or bench.STAGES, repeat=args.repeat, ffmpeg_path=ffmpeg_path,
+        ffprobe_path=find_ffmpeg_bin('ffprobe'), on_stage=lambda stage, result: print(bench.format_row(stage, result, baseline), flush=True),
+    )
+    if args.output:
+        bench.save_results(results, args.output)
+    if baseline is None:
+        return 0
+    regressions = bench.compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print(f"REGRESSION {message}", file=sys.stderr)
+    if not regressions:
+        print(f"No regressions against {args.baseline}.", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def cmd_watch(args):
+    import signal
+    import threading
+    from .convert import SUPPORTED_IMAGE_EXTS, convert_images, default_worker_count, ensure_pool, make_pool
+    from .video import SUPPORTED_VIDEO_EXTS, find_ffmpeg_bin, process_videos
+    from .watch import FolderWatcher, IngestQueue
+
+    if not args.output:
+        # Outputs written next to their sources would land in the watched folder.
+        print("watch needs an output folder (-o).", file=sys.stderr)
+        return 2
+    try:
+        options = _image_options(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    folders = [folder for folder in args.inputs if os.path.isdir(folder)]
+    for item in args.inputs:
+        if item not in folders:
+            logging.warning(f"Skipping {item}: not a folder")
+    if not folders:
+        return 2
+    exts = options.source_exts()
+    ffmpeg_path = find_ffmpeg_bin('ffmpeg')
+    if ffmpeg_path or args.strip:
+        exts += SUPPORTED_VIDEO_EXTS
+        if not ffmpeg_path:
+            logging.warning("FFmpeg not found: only MP4/MOV videos can have their metadata removed.")
+    else:
+        logging.warning("FFmpeg not found: videos are ignored.")
+    _check_output_dir(args.output)
+    workers = args.workers or default_worker_count()
+    manifest = _open_manifest(args)
+    dedup = _open_content_index(args)
+    trace = _open_trace(args, args.command)
+    totals = {"files": 0, "failed": 0}
+    # Started once and reused by every batch, so a lone new photo doesn't wait for workers to spawn.
+    pool = make_pool(workers) if workers > 1 else None
+
+    def handle(paths):
+        nonlocal pool
+        images = [p for p in paths if os.path.splitext(p)[1].lower() in SUPPORTED_IMAGE_EXTS]
+        videos = [p for p in paths if p not in images]
+        results = []
+        if images:
+            pool = ensure_pool(pool, workers)
+            results += convert_images(
+                images, args.output, options, workers=workers, manifest=manifest, force=args.force, trace=trace,
+                dedup=dedup, pool=pool,
+                on_result=lambda r, done, total: _print_result(r.path, ", ".join(r.outputs), done, total, args.quiet, r.skipped, r.duplicate_of),
+            )
+        if videos:
+            results += process_videos(
+                videos, args.output, ffmpeg_path, remove_metadata=args.strip, max_concurrent=args.jobs, timeout=args.timeout,
+                manifest=manifest, force=args.force, trace=trace, dedup=dedup,
+                on_result=lambda r, done, total: _report_video(r, done, total, args.quiet),
+            )
+        totals["files"] += len(results)
+        totals["failed"] += sum(1 for r in results if r.error)
+
+    ingest = IngestQueue(handle)
+    watcher = FolderWatcher(folders, exts, ingest.put, recursive=args.recursive, settle=args.settle, ignore=[args.output],
+                            existing=not args.new_only, poll=args.poll)
+    print(f"Watching {', '.join(folders)} ({watcher.mode}); Ctrl+C to stop", file=sys.stderr, flush=True)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    print("Stopping: finishing the files already queued...", file=sys.stderr, flush=True)
+    watcher.stop()
+    ingest.stop()
+    if pool is not None:
+        pool.shutdown()
+    if manifest:
+        manifest.close()
+    if dedup:
+        dedup.close()
+    _finish_trace(trace, args)
+    print(f"{totals['files']} files handled, {totals['failed']} failed", file=sys.stderr)
+    return 1 if totals["failed"] else 0
+
+
+def cmd_queue_submit(args):
+    from .convert import SUPPORTED_IMAGE_EXTS
+    from .video import SUPPORTED_VIDEO_EXTS
+    from .workqueue import WorkQueue
+
+    try:
+        options = _image_options(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    images, videos = [], []
+    for path in expand_inputs(args.inputs, SUPPORTED_IMAGE_EXTS + SUPPORTED_VIDEO_EXTS, args.recursive):
+        (images if os.path.splitext(path)[1].lower() in SUPPORTED_IMAGE_EXTS else videos).append(path)
+    images = _usable_images(images, options)
+    with WorkQueue(args.queue) as queue:
+        for kind, paths, job_options in (("image", images, options), ("video", videos, {"remove_metadata": args.strip})):
+            if paths:
+                job, count = queue.submit(kind, paths, job_options, args.output)
+                print(f"Job {job}: {count} {kind}s queued in {args.queue}", file=sys.stderr)
+    if not images and not videos:
+        print("No media files to queue.", file=sys.stderr)
+        return 1
+    return 0
+
+
+def cmd_queue_work(args):
+    import signal
+    import threading
+    from .convert import default_worker_count
+    from .video import SUPPORTED_VIDEO_EXTS, find_ffmpeg_bin
+    from .workqueue import WorkQueue, run_worker
+
+    ffmpeg_path = find_ffmpeg_bin('ffmpeg')
+    if not ffmpeg_path:
+        logging.warning("FFmpeg not found: only MP4/MOV videos can be processed by this worker.")
+
+    def on_result(path, outputs, error):
+        # Image failures are already reported through logging by convert_images.
+        if error and os.path.splitext(path)[1].lower() in SUPPORTED_VIDEO_EXTS:
+            logging.error(f"Error processing {os.path.basename(path)}: {error}")
+        elif outputs and not args.quiet:
+            print(f"{path} -> {', '.join(outputs)}", flush=True)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    with WorkQueue(args.queue, lease=args.lease) as queue:
+        try:
+            done, failed = run_worker(queue, worker=args.id, workers=args.workers or default_worker_count(), claim=args.claim,
+                                      ffmpeg_path=ffmpeg_path, follow=args.follow, on_result=on_result, stop=stop)
+        except KeyboardInterrupt:
+            print("Interrupted; unfinished files went back to the queue.", file=sys.stderr)
+            return 130
+    print(f"{done} processed, {failed} failed by this worker", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def cmd_queue_status(args):
+    from .workqueue import WorkQueue
+
+    with WorkQueue(args.queue) as queue:
+        if args.retry_failed:
+            print(f"{queue.retry_failed()} failed files queued again", file=sys.stderr)
+        for job in queue.summary():
+            counts = job["counts"]
+            print(f"Job {job['job']} ({job['kind']}s -> {job['output'] or 'next to the sources'}): "
+                  f"{sum(counts.values())} files, {counts.get('done', 0)} done, {counts.get('failed', 0)} failed, "
+                  f"{counts.get('leased', 0)} in progress, {counts.get('todo', 0)} to do")
+        for worker, count in sorted(queue.active_workers().items()):
+            print(f"  {worker}: {count} files leased")
+        if args.failed:
+            for path, error in queue.failures():
+                print(f"FAILED {path}: {error}")
+    return 0
+
+
+def cmd_serve(args):
+    from .service import ConverterService, serve
+    from .video import find_ffmpeg_bin
+
+    if args.verbose:
+        logging.getLogger().setLevel(logging.INFO)
+    service = ConverterService(workers=args.workers, ffprobe_path=find_ffmpeg_bin('ffprobe'))
+    print(f"Starting {service.workers} workers...", file=sys.stderr)
+
+    def ready(address, token):
+        print(f"Serving on {address} (Ctrl+C to stop)", file=sys.stderr)
+        if token and not args.token:
+            # stdout, so a script that started the service can read it.
+            print(f"Token: {token}", flush=True)
+        sys.stderr.flush()
+
+    try:
+        serve(service, host=args.host, port=args.port, socket_path=args.socket, on_ready=ready,
+              token=args.token, allow_remote=args.allow_remote)
+    except OSError as e:
+        print(f"Could not start the service: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="trashpanda", description="Batch media conversion and metadata removal, without the GUI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(p, outputs=True):
+        p.add_argument("inputs", nargs="+", help="files and/or folders")
+        p.add_argument("-r", "--recursive", action="store_true", help="descend into sub-folders")
+        p.add_argument("--stats", action="store_true", help="print where the time went: per-stage totals and the slowest files")
+        p.add_argument("--trace", metavar="FILE", help="write per-file, per-stage timings as Chrome trace JSON (chrome://tracing, Perfetto)")
+        if outputs:
+            p.add_argument("-o", "--output", help="output folder (default: next to each source file)")
+            p.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+            p.add_argument("--force", action="store_true", help="redo files whose output is already up to date")
+            p.add_argument("--verify", action="store_true", help="re-hash existing outputs before trusting them")
+            p.add_argument("--manifest", help="batch manifest file (default: in the user cache folder)")
+            p.add_argument("--no-manifest", action="store_true", help="don't skip or record finished outputs")
+            p.add_argument("--no-dedupe", action="store_true",
+                           help="process byte-identical inputs separately instead of reusing one's output")
+            p.add_argument("--link-duplicates", action="store_true",
+                           help="hard-link the output of identical inputs instead of copying it "
+                                "(saves space, but editing one output in place changes them all)")
+
+    def add_strip_flags(p):
+        p.add_argument("--keep-metadata", dest="strip", action="store_false", help="don't remove metadata")
+
+    def add_image_flags(p):
+        p.add_argument("-f", "--format", type=str.upper, choices=IMAGE_FORMATS, default="JPEG",
+                       help="output format; ORIGINAL keeps the source container and only strips metadata")
+        p.add_argument("--resize", action="store_true", help="shrink images to 50%%")
+        p.add_argument("--profile", choices=PROFILES, default=PROFILES[1],
+                       help="encoder trade-off: fast, balanced (default) or smallest files")
+        p.add_argument("--rendition", dest="renditions", action="append", type=_rendition_arg, metavar="SIZE:FORMAT[:QUALITY]",
+                       help="write this rendition of every image (repeatable; replaces -f/--resize). SIZE is 'full', "
+                            "a percentage or the longest edge in pixels, e.g. --rendition full:jpeg --rendition 256:webp")
+        add_strip_flags(p)
+        p.add_argument("--keep-icc", action="store_true", help="keep the ICC colour profile when removing metadata")
+        p.add_argument("--memory-limit", type=int, default=1024, metavar="MB",
+                       help="fail files that would need more than this much memory to decode (default: 1024, 0 = no limit)")
+
+    def add_video_flags(p):
+        p.add_argument("--jobs", type=int, default=3, help="ffmpeg processes to run at once (default: 3)")
+        p.add_argument("--timeout", type=float, default=None, help="kill an ffmpeg run after this many seconds")
+
+    def add_workers_flag(p):
+        p.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core, 1 = serial)")
+
+    p = sub.add_parser("convert", help="convert images")
+    add_common(p)
+    add_image_flags(p)
+    add_workers_flag(p)
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("strip", help="losslessly remove metadata from JPEG/PNG/WebP")
+    add_common(p)
+    p.add_argument("--keep-icc", action="store_true", help="keep the ICC colour profile")
+    add_workers_flag(p)
+    p.set_defaults(func=cmd_strip)
+
+    p = sub.add_parser("video", help="remove metadata from videos (MP4/MOV natively, anything else via ffmpeg)")
+    add_common(p)
+    add_strip_flags(p)
+    p.add_argument("-j", "--jobs", type=int, default=3, help="ffmpeg processes to run at once (default: 3)")
+    p.add_argument("--timeout", type=float, default=None, help="kill an ffmpeg run after this many seconds")
+    p.set_defaults(func=cmd_video)
+
+    # The settle default mirrors watch.SETTLE_SECONDS.
+    p = sub.add_parser("watch", help="convert images and clean videos as they arrive in watched folders")
+    add_common(p)
+    add_image_flags(p)
+    add_workers_flag(p)
+    add_video_flags(p)
+    p.add_argument("--settle", type=float, default=2.0, metavar="SECONDS",
+                   help="how long a file must stay unchanged before it is processed (default: 2)")
+    p.add_argument("--new-only", action="store_true", help="ignore the files already there when watching starts")
+    p.add_argument("--poll", action="store_true", help="poll for changes instead of using inotify (e.g. on network shares)")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("metadata", help="print or export image and video metadata")
+    add_common(p, outputs=False)
+    p.add_argument("--format", choices=("text", "jsonl", "csv"), default="text", help="output format (default: text)")
+    p.add_argument("-o", "--output", help="write to this file instead of stdout")
+    p.add_argument("--index-db", help="metadata index file (default: in the user cache folder)")
+    p.add_argument("--no-index", action="store_true", help="re-read every file and leave the index alone")
+    p.set_defaults(func=cmd_metadata)
+
+    p = sub.add_parser("query", help="list indexed files by metadata, without reading them again")
+    p.add_argument("--gps", action="store_true", help="only files with GPS tags")
+    p.add_argument("--creation-time", action="store_true", help="only files with a creation_time (videos)")
+    p.add_argument("--kind", choices=("image", "video"), help="only images or only videos")
+    p.add_argument("--under", help="only files inside this folder")
+    p.add_argument("--limit", type=int, help="stop after this many results")
+    p.add_argument("--json", action="store_true", help="print full records as JSON lines instead of paths")
+    p.add_argument("--prune", action="store_true", help="first drop index entries for files that no longer exist")
+    p.add_argument("--index-db", help="metadata index file (default: in the user cache folder)")
+    p.set_defaults(func=cmd_query)
+
+    # Stage names mirror bench.STAGES; spelled out so --help doesn't import Pillow.
+    p = sub.add_parser("bench", help="time each pipeline stage on a synthetic corpus and compare with a baseline")
+    p.add_argument("--corpus", help="corpus folder (default: generated once in the user cache folder)")
+    p.add_argument("--quick", action="store_true", help="leave the 12 MP images out of the corpus")
+    p.add_argument("--stage", dest="stages", action="append",
+                   choices=("scan", "probe", "decode", "render", "resize", "encode", "write", "strip", "video"),
+                   help="only run this stage (repeatable; default: all)")
+    p.add_argument("--repeat", type=int, default=3, help="runs per stage; the fastest counts (default: 3)")
+    p.add_argument("-o", "--output", help="save the results as JSON, e.g. to use as a baseline")
+    p.add_argument("--baseline", help="JSON results to compare with; exit code 1 on a regression")
+    p.add_argument("--tolerance", type=float, default=0.25,
+                   help="how much slower (or bigger) than the baseline counts as a regression (default: 0.25)")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("queue", help="split a batch between several processes or machines through a shared queue folder")
+    queue_sub = p.add_subparsers(dest="action", required=True)
+    q = queue_sub.add_parser("submit", help="queue files to be converted (images) or cleaned (videos) by workers")
+    q.add_argument("queue", help="queue folder, e.g. on a share every worker mounts at the same path")
+    q.add_argument("inputs", nargs="+", help="files and/or folders")
+    q.add_argument("-r", "--recursive", action="store_true", help="descend into sub-folders")
+    q.add_argument("-o", "--output", help="output folder (default: next to each source file)")
+    add_image_flags(q)
+    q.set_defaults(func=cmd_queue_submit)
+    # The lease and claim defaults mirror workqueue.DEFAULT_LEASE and DEFAULT_CLAIM.
+    q = queue_sub.add_parser("work", help="process queued files until none are left")
+    q.add_argument("queue", help="queue folder")
+    q.add_argument("-j", "--workers", type=int, default=None, help="worker processes for images (default: one per core)")
+    q.add_argument("--claim", type=int, default=4, help="files to claim at a time per worker process (default: 4)")
+    q.add_argument("--lease", type=float, default=120.0, metavar="SECONDS",
+                   help="how long a claim lasts unless renewed; a dead worker's files are retried after this (default: 120)")
+    q.add_argument("--id", help="worker name shown in status (default: host:pid)")
+    q.add_argument("--follow", action="store_true", help="keep waiting for new jobs instead of exiting when the queue is empty")
+    q.add_argument("-q", "--quiet", action="store_true", help="only report failures")
+    q.set_defaults(func=cmd_queue_work)
+    q = queue_sub.add_parser("status", help="show progress, active workers and failures")
+    q.add_argument("queue", help="queue folder")
+    q.add_argument("--failed", action="store_true", help="list the files that failed and why")
+    q.add_argument("--retry-failed", action="store_true", help="put failed files back in the queue first")
+    q.set_defaults(func=cmd_queue_status)
+
+    # The default port mirrors service.DEFAULT_PORT; spelled out so --help doesn't import Pillow.
+    p = sub.add_parser("serve", help="keep a warm worker pool running and take requests over local HTTP")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    p.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    p.add_argument("--socket", metavar="PATH", help="listen on this Unix socket instead of a port")
+    p.add_argument("--token", default=os.environ.get("TRASHPANDA_TOKEN"),
+                   help="token TCP requests must send as 'Authorization: Bearer <token>' "
+                        "(default: $TRASHPANDA_TOKEN, else a new one is printed at start)")
+    p.add_argument("--allow-remote", action="store_true",
+                   help="allow --host to be a non-loopback address; anyone with the token can then read and write your files")
+    p.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per core)")
+    p.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    p.set_defaults(func=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+    args = build_parser().parse_args(argv)
+    return args.func(args)
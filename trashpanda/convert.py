@@ -0,0 +1,433 @@
+import io
+import os
+import logging
+import multiprocessing
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from .backends import backend
+from .decode import DEFAULT_MEMORY_LIMIT_MB, decode_image, image_size
+from .encoders import DEFAULT_PROFILE, encode
+from .manifest import file_sha256, options_key
+from .paths import atomic_output
+from .renditions import Rendition, check_renditions
+from .strip import LOSSLESS_STRIP_EXTS, sniff_container, strip_file
+from .trace import FileTrace
+
+SUPPORTED_IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.heic', '.webp', '.bmp', '.gif', '.tiff', '.svg', '.raf', '.cr2', '.cr3', '.arw', '.nef', '.dng')
+
+# Target "format" meaning: keep the source container and only strip its metadata.
+ORIGINAL_FORMAT = "ORIGINAL"
+
+# Image.info keys that affect how pixels render; everything else is metadata.
+PIXEL_INFO_KEYS = ('transparency',)
+
+# How many files each pool worker may have queued at once. Keeps memory flat on
+# 20k-file batches while still giving every worker something to do next.
+TASKS_PER_WORKER = 4
+# With a progress channel, how often the pool loop checks it for pause and cancel.
+CONTROL_POLL_INTERVAL = 0.2
+
+
+@dataclass(frozen=True)
+class ConvertOptions:
+    """Per-batch settings, picklable so they can be shipped to pool workers."""
+    target_format: str = "JPEG"
+    remove_metadata: bool = True
+    resize: bool = False
+    keep_icc: bool = False
+    # Per-file cap on decoded pixels; files that would need more fail instead of exhausting RAM.
+    # Doesn't change what gets written, so it isn't part of the manifest's options key.
+    memory_limit_mb: int = field(default=DEFAULT_MEMORY_LIMIT_MB, metadata={"affects_output": False})
+    # Several outputs per source (see renditions.Rendition). When empty, the single
+    # output is target_format at full size, or half size with resize.
+    renditions: tuple = ()
+    # Encoder speed/size trade-off, one of encoders.PROFILES.
+    profile: str = DEFAULT_PROFILE
+
+    def rendition_list(self):
+        if self.renditions:
+            return list(self.renditions)
+        return [Rendition(self.target_format, scale=0.5 if self.resize else 1.0)]
+
+    def source_exts(self):
+        """Source extensions these options can handle: keeping the original format needs a container strip.py can rewrite."""
+        if any(r.format == ORIGINAL_FORMAT for r in self.rendition_list()):
+            return LOSSLESS_STRIP_EXTS
+        return SUPPORTED_IMAGE_EXTS
+
+
+@dataclass
+class ConvertResult:
+    """Outcome of converting one file. Exactly one of output/error is set."""
+    path: str
+    output: str = None
+    error: str = None
+    # True when the output was already up to date in the batch manifest and nothing was done.
+    skipped: bool = False
+    # True when the batch was cancelled before this file was started.
+    cancelled: bool = False
+    # Set when this file was byte-identical to another and its outputs are links to (or
+    # copies of) that one's: the other source, or its output from an earlier batch.
+    duplicate_of: str = None
+    # Every file written for this source (output is the first), and their SHA-256s when asked for.
+    outputs: list = field(default_factory=list)
+    hashes: dict = None
+    # Time spent writing outputs (encoding, or copying for lossless strips), and bytes read vs. written.
+    encode_seconds: float = 0.0
+    source_bytes: int = 0
+    output_bytes: int = 0
+    # Per-stage timings (trace.Span) from the worker that did the work.
+    spans: list = field(default_factory=list)
+
+
+def svg_supported():
+    return backend("svg") is not None
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+def make_pool(workers=None):
+    """A process pool for convert_images to keep reusing, e.g. across the batches of a long-running watch."""
+    # 'spawn' keeps forked copies of the GUI's Tk/thread state out of the workers
+    # and behaves the same on Windows, macOS and Linux.
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers or default_worker_count(), mp_context=ctx)
+
+
+def ensure_pool(pool, workers=None):
+    """pool if it still works, or a new one in its place: a worker that crashed outright breaks a pool for good."""
+    if pool is None:
+        return None
+    try:
+        pool.submit(int)
+        return pool
+    except BrokenProcessPool:
+        logging.warning("A worker process died; starting new ones.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        return make_pool(workers)
+
+
+def output_path_for(path, output_folder, target_format, suffix="_processed"):
+    """Returns where the converted copy of path is written."""
+    out_dir = output_folder or os.path.dirname(path)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    if target_format == ORIGINAL_FORMAT:
+        out_filename = stem + suffix + ext
+    else:
+        out_filename = stem + suffix + "." + target_format.lower()
+    return os.path.join(out_dir, out_filename)
+
+
+def output_paths_for(path, output_folder, options):
+    """Returns every file converting path writes, in rendition order."""
+    return [output_path_for(path, output_folder, r.format, r.suffix) for r in options.rendition_list()]
+
+
+def _drop_metadata(img, keep_icc=False):
+    """Forgets EXIF/XMP/comments (and ICC unless asked) without copying any pixels."""
+    img.load()
+    keep = PIXEL_INFO_KEYS + (('icc_profile',) if keep_icc else ())
+    img.info = {k: v for k, v in img.info.items() if k in keep}
+    return img
+
+
+def _can_strip_losslessly(path, ext, options, rendition):
+    """True when the rendition is just the source container minus its metadata."""
+    if ext not in LOSSLESS_STRIP_EXTS or not options.remove_metadata or not rendition.full_size or rendition.quality is not None:
+        return False
+    if rendition.format == ORIGINAL_FORMAT:
+        return True
+    with open(path, 'rb') as f:
+        return sniff_container(f.read(12)) == rendition.format
+
+
+def format_bytes(n):
+    for unit in ("bytes", "KB", "MB"):
+        if abs(n) < 1000:
+            return f"{n:.0f} {unit}" if unit == "bytes" else f"{n:.1f} {unit}"
+        n /= 1000
+    return f"{n:.2f} GB"
+
+
+def encoding_summary(results):
+    """One line on how long encoding took and how many bytes the converted files saved."""
+    done = [r for r in results if not r.error and not r.skipped and not r.cancelled and not r.duplicate_of]
+    seconds = sum(r.encode_seconds for r in done)
+    source_bytes = sum(r.source_bytes for r in done)
+    output_bytes = sum(r.output_bytes for r in done)
+    saved = source_bytes - output_bytes
+    line = f"Encoding took {seconds:.1f} s; {format_bytes(source_bytes)} in, {format_bytes(output_bytes)} out"
+    if source_bytes:
+        line += f" ({format_bytes(abs(saved))} {'saved' if saved >= 0 else 'larger'}, {abs(saved) / source_bytes:.0%})"
+    return line
+
+
+def _write_bytes(data, out_path):
+    with atomic_output(out_path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+
+def convert_image(path, output_folder, options, trace=None):
+    """
+    Writes every rendition of a single image, decoding it at most once. Returns
+    the output paths in rendition order; each only appears once completely written.
+    Each step (decode, resize, encode, write...) is recorded on trace, a
+    trace.FileTrace, if given.
+    """
+    trace = trace or FileTrace()
+    ext = os.path.splitext(path)[1].lower()
+    renditions = options.rendition_list()
+    check_renditions(renditions)
+    outputs = [output_path_for(path, output_folder, r.format, r.suffix) for r in renditions]
+    source_bytes = os.path.getsize(path)
+
+    cairosvg = backend("svg") if ext == '.svg' else None
+    if ext == '.svg':
+        if not cairosvg or any(r.format != "PNG" for r in renditions):
+            raise ValueError("SVG can only be converted to PNG.")
+        if len(renditions) == 1 and renditions[0].full_size:
+            with trace.stage("render", source_bytes) as span:
+                with atomic_output(outputs[0]) as tmp_path:
+                    cairosvg.svg2png(url=path, write_to=tmp_path)
+                span.bytes_written = os.path.getsize(outputs[0])
+            return outputs
+
+    to_encode = []
+    for idx, rendition in enumerate(renditions):
+        if ext != '.svg' and _can_strip_losslessly(path, ext, options, rendition):
+            with trace.stage("strip", source_bytes) as span:
+                with atomic_output(outputs[idx]) as tmp_path:
+                    strip_file(path, tmp_path, keep_icc=options.keep_icc)
+                span.bytes_written = os.path.getsize(outputs[idx])
+        elif rendition.format == ORIGINAL_FORMAT:
+            raise ValueError("Keeping the original format needs a JPEG, PNG or WebP source with Remove Metadata on and no resizing.")
+        else:
+            to_encode.append(idx)
+    if not to_encode:
+        return outputs
+
+    if ext == '.svg':
+        with trace.stage("render", source_bytes):
+            img = Image.open(io.BytesIO(cairosvg.svg2png(url=path)))
+            img.load()
+        size = img.size
+    else:
+        size = image_size(path)
+    targets = {idx: renditions[idx].target_size(size) for idx in to_encode}
+    # Largest first: the source is decoded once, straight at the largest size needed,
+    # and each smaller rendition is downscaled from the one before it.
+    to_encode.sort(key=lambda idx: targets[idx][0] * targets[idx][1], reverse=True)
+    if ext != '.svg':
+        with trace.stage("decode", source_bytes):
+            img = decode_image(path, size=targets[to_encode[0]], memory_limit_mb=options.memory_limit_mb)
+            img.load()
+
+    if options.remove_metadata:
+        img = _drop_metadata(img, keep_icc=options.keep_icc)
+
+    for idx in to_encode:
+        if img.size != targets[idx]:
+            with trace.stage("resize"):
+                img = img.resize(targets[idx], Image.Resampling.LANCZOS, reducing_gap=3.0)
+        # Encoded to memory first so the disk write shows up as a stage of its own.
+        buf = io.BytesIO()
+        with trace.stage("encode"):
+            encode(img, buf, renditions[idx].format, options.profile, renditions[idx].quality)
+        with trace.stage("write") as span:
+            _write_bytes(buf.getbuffer(), outputs[idx])
+            span.bytes_written = buf.tell()
+        del buf
+    return outputs
+
+
+def _convert_task(path, output_folder, options, fingerprint=False):
+    """Pool entry point: never raises, so one bad file can't take down the batch."""
+    trace = FileTrace()
+    try:
+        source_bytes = os.path.getsize(path)
+        outputs = convert_image(path, output_folder, options, trace)
+        output_bytes = sum(os.path.getsize(out) for out in outputs)
+        hashes = None
+        if fingerprint:
+            # Hashing here keeps it in the pool rather than on the thread collecting results.
+            with trace.stage("hash", output_bytes):
+                hashes = {out: file_sha256(out) for out in outputs}
+        return ConvertResult(path, output=outputs[0], outputs=outputs, hashes=hashes,
+                             encode_seconds=trace.seconds("render", "strip", "encode", "write"),
+                             source_bytes=source_bytes, output_bytes=output_bytes, spans=trace.spans)
+    except Exception as e:
+        return ConvertResult(path, error=str(e), spans=trace.spans)
+
+
+def _duplicate_result(path, sources, output_folder, options, dedup, duplicate_of):
+    """Gives path the outputs of a byte-identical file by linking or copying them."""
+    trace = FileTrace()
+    outputs = output_paths_for(path, output_folder, options)
+    try:
+        with trace.stage("link") as span:
+            span.bytes_written = dedup.materialize(sources, outputs)
+    except OSError as e:
+        return ConvertResult(path, error=f"could not reuse the output of {os.path.basename(duplicate_of)}: {e}",
+                             duplicate_of=duplicate_of, spans=trace.spans)
+    return ConvertResult(path, output=outputs[0], outputs=outputs, duplicate_of=duplicate_of, spans=trace.spans)
+
+
+def convert_images(paths, output_folder, options, workers=None, on_result=None, manifest=None, force=False, trace=None,
+                   progress=None, dedup=None, pool=None):
+    """
+    Converts every path and returns a ConvertResult per file, in input order.
+
+    Work is fanned out to a pool of `workers` processes (default: one per core).
+    workers <= 1 runs everything serially in the calling process, which is the
+    easiest way to debug a misbehaving file. on_result(result, done, total) is
+    called from the calling thread as each file finishes.
+
+    With a BatchManifest, files whose output is already up to date are skipped
+    (unless force is set) and every new output is recorded as soon as it lands,
+    so rerunning an interrupted batch resumes it.
+
+    With a trace.BatchTrace, every converted file's stage timings are added to it.
+
+    With a progress.ProgressChannel, every finished file is reported to it, and no
+    new file is started while it is paused. Once it is cancelled, the files
+    already being converted finish and the rest come back with cancelled set.
+
+    With a dedup.ContentIndex, byte-identical inputs are converted once and the
+    copies get links to (or copies of) its outputs, as do inputs whose content
+    was converted with the same options in an earlier batch (unless force is set).
+
+    With pool (see make_pool), files go to its already running workers instead of
+    a pool started for this batch, and it is left running afterwards.
+    """
+    paths = list(paths)
+    total = len(paths)
+    if workers is None:
+        workers = default_worker_count()
+    results = [None] * total
+    done_count = 0
+    key = options_key("image", options) if manifest or dedup else None
+    if progress is not None:
+        progress.set_total(total)
+    source_stats = {}
+    plan = None
+
+    def record(idx, result):
+        nonlocal done_count
+        results[idx] = result
+        done_count += 1
+        if trace is not None and not result.skipped:
+            trace.add(result.path, "image", result.spans, result.error)
+        if result.error:
+            logging.error(f"Error converting {os.path.basename(result.path)}: {result.error}")
+        elif manifest and not result.skipped:
+            try:
+                for out in result.outputs:
+                    manifest.record(result.path, out, key, source_stats.get(idx), (result.hashes or {}).get(out))
+            except OSError as e:
+                logging.warning(f"Could not record {os.path.basename(result.path)} in the batch manifest: {e}")
+        if progress is not None:
+            progress.item_done(result.path)
+        if on_result:
+            on_result(result, done_count, total)
+        if plan is not None and not result.skipped and not result.duplicate_of:
+            share(idx, result)
+
+    def share(idx, result):
+        """Hands a converted file's outputs to its byte-identical copies, and remembers its content."""
+        copies = plan.copies.pop(idx, ())
+        if result.error:
+            for dup in copies:
+                record(dup, ConvertResult(paths[dup], error=result.error, duplicate_of=result.path))
+            return
+        dedup.learn(result.path, key, result.outputs, plan.digests.get(idx))
+        for dup in copies:
+            dup_result = _duplicate_result(paths[dup], result.outputs, output_folder, options, dedup, result.path)
+            if result.hashes and not dup_result.error:
+                dup_result.hashes = {out: result.hashes.get(src) for out, src in zip(dup_result.outputs, result.outputs)}
+            record(dup, dup_result)
+
+    def finish():
+        # Files never started because the batch was cancelled, and copies of those.
+        for idx, path in enumerate(paths):
+            if results[idx] is None:
+                results[idx] = ConvertResult(path, cancelled=True)
+        return results
+
+    todo = []
+    for idx, path in enumerate(paths):
+        if manifest:
+            outputs = output_paths_for(path, output_folder, options)
+            if not force and all(manifest.is_current(path, out, key) for out in outputs):
+                record(idx, ConvertResult(path, output=outputs[0], skipped=True, outputs=outputs))
+                continue
+            try:
+                source_stats[idx] = os.stat(path)
+            except OSError:
+                pass
+        todo.append((idx, path))
+    plan = dedup.plan(todo, key, reuse=not force) if dedup is not None and todo else None
+    if plan is not None:
+        for idx, path in todo:
+            if idx in plan.reused:
+                record(idx, _duplicate_result(path, plan.reused[idx], output_folder, options, dedup, plan.reused[idx][0]))
+        waiting = plan.waiting()
+        todo = [(idx, path) for idx, path in todo if idx not in plan.reused and idx not in waiting]
+    if not todo:
+        return finish()
+    fingerprint = manifest is not None
+    workers = max(1, min(workers, len(todo)))
+
+    if workers == 1 and pool is None:
+        for idx, path in todo:
+            if progress is not None and not progress.wait_if_paused():
+                break
+            record(idx, _convert_task(path, output_folder, options, fingerprint))
+        return finish()
+
+    with nullcontext(pool) if pool is not None else make_pool(workers) as pool:
+        queue = deque(todo)
+        pending = {}
+
+        def halted():
+            return progress is not None and (progress.paused or progress.cancelled)
+
+        def fill():
+            while queue and len(pending) < workers * TASKS_PER_WORKER and not halted():
+                idx, path = queue.popleft()
+                try:
+                    pending[pool.submit(_convert_task, path, output_folder, options, fingerprint)] = idx
+                except Exception as e:
+                    # A worker died outright (e.g. a decoder crash) and broke the pool.
+                    record(idx, ConvertResult(path, error=f"worker failed: {e}"))
+
+        fill()
+        poll = CONTROL_POLL_INTERVAL if progress is not None else None
+        while pending:
+            done, _ = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = ConvertResult(paths[idx], error=f"worker failed: {e}")
+                record(idx, result)
+            if halted():
+                # Files still queued in the pool haven't started: hold them back until
+                # resumed (if cancelled, they're never submitted again).
+                held = sorted(pending.pop(f) for f in [f for f in pending if f.cancel()])
+                queue.extendleft((idx, paths[idx]) for idx in reversed(held))
+            fill()
+            if not pending and progress is not None:
+                # Paused with nothing in flight: wait here until resumed or cancelled.
+                progress.wait_if_paused()
+                fill()
+    return finish()
@@ -0,0 +1,241 @@
+"""
+Memory-aware image decoding.
+
+Pixels are decoded at the smallest scale the codec can produce that still
+covers the requested size (JPEG DCT scaling through draft(), embedded HEIF
+thumbnails), uncompressed rasters that would blow the budget are decoded and
+resized a strip of rows at a time, and anything else that would need more than
+the per-file memory limit is refused from its header, before any pixels are
+decoded.
+"""
+import math
+import os
+
+from PIL import Image
+
+from .backends import backend
+
+DEFAULT_MEMORY_LIMIT_MB = 1024
+
+HEIF_EXTS = ('.heic', '.heif')
+
+# Modes Pillow keeps at one byte per pixel; everything else we decode is stored in 4 (or 2 for I;16).
+_ONE_BYTE_MODES = ('1', 'L', 'P')
+_TWO_BYTE_MODES = ('I;16', 'I;16L', 'I;16B', 'LA', 'PA')
+# Modes Image.frombuffer can wrap without copying.
+_SHAREABLE_MODES = ('L', 'RGBX', 'RGBA', 'CMYK', 'I;16', 'I;16L', 'I;16B')
+# LANCZOS reads this many source pixels either side of an output pixel, per unit of downscale.
+_LANCZOS_SUPPORT = 3
+
+
+class MemoryLimitExceeded(ValueError):
+    pass
+
+
+def _open_heif(path):
+    pillow_heif = backend("heif")
+    if pillow_heif is None:
+        raise ValueError("HEIF support needs pillow_heif (pip install pillow-heif).")
+    return pillow_heif.open_heif(path, convert_hdr_to_8bit=True)
+
+
+def image_bytes(size, mode):
+    """Roughly what Pillow allocates for an image of this size and mode."""
+    if mode in _ONE_BYTE_MODES:
+        per_pixel = 1
+    elif mode in _TWO_BYTE_MODES:
+        per_pixel = 2
+    else:
+        per_pixel = 4
+    return size[0] * size[1] * per_pixel
+
+
+def _scaled(size, scale):
+    return max(1, int(size[0] * scale)), max(1, int(size[1] * scale))
+
+
+def _heif_source(primary, target):
+    """The smallest embedded thumbnail of a HEIF image that still covers target, else the image itself."""
+    if target != primary.size:
+        for idx, _ in sorted(enumerate(primary.info.get('thumbnails') or ()), key=lambda t: t[1]):
+            thumb = primary.get_thumbnail(idx)
+            if thumb.size[0] >= target[0] and thumb.size[1] >= target[1]:
+                return thumb
+    return primary
+
+
+def _heif_pixel_bytes(mode):
+    """Bytes per pixel in libheif's buffer for a pillow_heif mode such as "RGB", "I;16" or "RGBA;16"."""
+    base, _, bits = mode.partition(";")
+    try:
+        bands = Image.getmodebands(base)
+    except (KeyError, ValueError):
+        # Orders Pillow has no mode for, e.g. BGRA.
+        bands = len(base)
+    return bands * ((int(bits.rstrip("LB")) + 7) // 8 if bits else 1)
+
+
+def _heif_bytes(source, target):
+    """
+    Peak memory of decoding source and resizing it to target. Shareable modes
+    are wrapped in libheif's buffer. Anything else (8-bit RGB, the usual case)
+    holds the buffer and Pillow's copy together while it is unpacked, and
+    the copy alone during the resize.
+    """
+    decoded = source.size[0] * source.size[1] * _heif_pixel_bytes(source.mode)
+    resized = image_bytes(target, source.mode) if source.size != target else 0
+    if source.mode in _SHAREABLE_MODES:
+        return decoded + resized
+    copy = image_bytes(source.size, source.mode)
+    return max(decoded + copy, copy + resized)
+
+
+def _heif_to_image(source, info):
+    """
+    Wraps decoded HEIF pixels in a PIL image. Shareable modes use libheif's
+    buffer without a copy. libheif can't be asked for RGBX and Pillow pads RGB
+    to 4 bytes a pixel, so RGB is copied once. The buffer is freed when the
+    caller drops source.
+    """
+    if source.mode in _SHAREABLE_MODES:
+        img = Image.frombuffer(source.mode, source.size, source.data, "raw", source.mode, source.stride, 1)
+    else:
+        img = Image.frombytes(source.mode, source.size, source.data, "raw", source.mode, source.stride)
+    img.info = {k: v for k, v in info.items() if k in ('exif', 'xmp', 'icc_profile')}
+    return img
+
+
+def _raw_strips(img):
+    """
+    For uncompressed rasters (plain TIFF, BMP, PPM...), returns the tiles as
+    (x0, y0, x1, y1, offset, rawmode, stride, orientation) so any run of rows can
+    be read straight from the file. Returns None for anything compressed.
+    """
+    if img.mode in ('P', 'PA'):
+        return None
+    strips = []
+    for tile in img.tile:
+        if tile[0] != 'raw':
+            return None
+        (x0, y0, x1, y1), offset, args = tile[1], tile[2], tile[3]
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        if not stride:
+            try:
+                stride = len(Image.new(img.mode, (x1 - x0, 1)).tobytes('raw', rawmode))
+            except (ValueError, OSError):
+                return None
+        strips.append((x0, y0, x1, y1, offset, rawmode, abs(stride), orientation))
+    return strips or None
+
+
+def _read_rows(path, mode, width, strips, y0, y1):
+    """Decodes rows y0..y1 of an uncompressed raster into a new image."""
+    band = None
+    with open(path, 'rb') as f:
+        for x0, ty0, x1, ty1, offset, rawmode, stride, orientation in strips:
+            start, end = max(y0, ty0), min(y1, ty1)
+            if start >= end:
+                continue
+            rows = end - start
+            if orientation < 0:
+                # Bottom-up: the last row of the tile comes first in the file.
+                f.seek(offset + (ty1 - end) * stride)
+            else:
+                f.seek(offset + (start - ty0) * stride)
+            data = f.read(rows * stride)
+            if len(data) < rows * stride:
+                raise ValueError("image file is truncated")
+            part = Image.frombytes(mode, (x1 - x0, rows), data, "raw", rawmode, stride, orientation)
+            del data
+            if band is None and (x0, start, x1, end) == (0, y0, width, y1):
+                # One strip covers the whole band (the usual case): no need to copy it again.
+                return part
+            if band is None:
+                band = Image.new(mode, (width, y1 - y0))
+            band.paste(part, (x0, start - y0))
+    return band
+
+
+def _resize_in_strips(path, img, strips, target, limit):
+    """
+    LANCZOS-resizes an uncompressed raster to target while only ever holding one
+    strip of source rows. Each strip carries enough extra rows for the filter,
+    so the result matches a full-image resize.
+    """
+    width, height = img.size
+    scale_y = height / target[1]
+    margin = math.ceil(_LANCZOS_SUPPORT * max(scale_y, 1.0)) + 1
+    available = limit - image_bytes(target, img.mode)
+    # A strip costs its raw bytes, the decoded rows and the filter's intermediate rows.
+    source_rows = available // max(1, 3 * image_bytes((width, 1), img.mode)) - 2 * margin
+    out_rows = int(source_rows / scale_y)
+    if out_rows < 1:
+        raise MemoryLimitExceeded(f"resizing this {width}x{height} image to {target[0]}x{target[1]} needs more than the memory limit")
+
+    out = Image.new(img.mode, target)
+    for oy0 in range(0, target[1], out_rows):
+        oy1 = min(target[1], oy0 + out_rows)
+        y0 = max(0, int(oy0 * scale_y) - margin)
+        y1 = min(height, math.ceil(oy1 * scale_y) + margin)
+        band = _read_rows(path, img.mode, width, strips, y0, y1)
+        part = band.resize((target[0], oy1 - oy0), Image.Resampling.LANCZOS,
+                           box=(0, oy0 * scale_y - y0, width, oy1 * scale_y - y0))
+        out.paste(part, (0, oy0))
+    out.info = dict(img.info)
+    return out
+
+
+def image_size(path):
+    """Reads an image's pixel size from its header."""
+    if os.path.splitext(path)[1].lower() in HEIF_EXTS:
+        heif_file = _open_heif(path)
+        return heif_file[heif_file.primary_index].size
+    with Image.open(path) as img:
+        return img.size
+
+
+def decode_image(path, scale=1.0, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB, size=None):
+    """
+    Returns the image at path resized (LANCZOS) by scale, or to size if given,
+    decoding at reduced scale where the codec allows it. Raises
+    MemoryLimitExceeded, before decoding, if that would take more than
+    memory_limit_mb (None = no limit). An RGB HEIF is briefly held twice,
+    once as libheif's buffer and once as Pillow's copy. The limit check
+    counts both.
+    """
+    limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext in HEIF_EXTS:
+        heif_file = _open_heif(path)
+        primary = heif_file[heif_file.primary_index]
+        source_size = primary.size
+        target = size or _scaled(source_size, scale)
+        source = _heif_source(primary, target)
+        # libheif can't decode at reduced scale, so the whole frame (or thumbnail) is decoded.
+        need = _heif_bytes(source, target)
+        if limit and need > limit:
+            raise MemoryLimitExceeded(f"decoding this {source_size[0]}x{source_size[1]} HEIF needs about {need >> 20} MB, over the {memory_limit_mb} MB limit")
+        img = _heif_to_image(source, primary.info)
+        del heif_file, primary, source
+    else:
+        img = Image.open(path)
+        source_size = img.size
+        target = size or _scaled(source_size, scale)
+        if target != source_size:
+            # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 scale. A no-op for other formats.
+            img.draft(img.mode, target)
+        need = image_bytes(img.size, img.mode) + (image_bytes(target, img.mode) if img.size != target else 0)
+        if limit and need > limit:
+            strips = _raw_strips(img) if target != source_size else None
+            if strips is None:
+                raise MemoryLimitExceeded(f"decoding this {source_size[0]}x{source_size[1]} image needs about {need >> 20} MB, over the {memory_limit_mb} MB limit")
+            return _resize_in_strips(path, img, strips, target, limit)
+
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return img
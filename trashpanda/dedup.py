@@ -0,0 +1,305 @@
+"""
+Content-addressed de-duplication of batch inputs.
+
+Uploads often hold byte-identical copies of one photo or clip under different
+names. Inputs are grouped by size first (one stat each), and only files that
+share their size with another input, or with a source finished in an earlier
+batch, are hashed. Each distinct content is then processed once per set of
+options, and every other copy's outputs are copies of the first copy's
+(copy_file_range, so filesystems that can share extents do), or hard links
+if asked for. Links share one inode, so editing one output in place changes
+them all.
+
+A ContentIndex keeps three tables in SQLite: every hashed file's SHA-256 by
+path, size and mtime, so an unchanged file is never hashed twice; the outputs
+each content produced with each set of options; and the sources finished
+without being hashed, by size and mtime only. A finished source is only read
+again if a later input has the same size, so a batch of large videos that
+share no sizes costs no extra reads, and a copy submitted in a later batch
+costs two hashes instead of a decode and encode.
+"""
+import errno
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .manifest import file_sha256
+from .paths import atomic_output, user_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    hashed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contents (
+    sha256 TEXT NOT NULL,
+    options TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    outputs TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (sha256, options)
+);
+CREATE INDEX IF NOT EXISTS contents_size ON contents (options, size);
+CREATE TABLE IF NOT EXISTS unhashed (
+    path TEXT NOT NULL,
+    options TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    outputs TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (path, options)
+);
+CREATE INDEX IF NOT EXISTS unhashed_size ON unhashed (options, size);
+"""
+
+# Hashing is mostly waiting on the disk, and hashlib releases the GIL.
+HASH_WORKERS = 4
+
+
+def default_content_index_path():
+    return os.path.join(user_cache_dir(), "content.sqlite")
+
+
+def _copy_file(src, dst):
+    """
+    Copies src to dst in the kernel with copy_file_range, which shares extents
+    (a reflink) on Btrfs, XFS and the like; falls back to a plain copy.
+    """
+    if hasattr(os, "copy_file_range"):
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            try:
+                while os.copy_file_range(fsrc.fileno(), fdst.fileno(), 1 << 30):
+                    pass
+                return
+            except OSError as e:
+                # Not supported here, or across these filesystems on an older kernel.
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                    raise
+    shutil.copyfile(src, dst)
+
+
+def link_or_copy(src, dst, link=False):
+    """
+    Puts a copy of src (or with link, a hard link to it where possible) at dst,
+    atomically. Returns "link" or "copy".
+    """
+    with atomic_output(dst) as tmp_path:
+        if link:
+            try:
+                os.link(src, tmp_path)
+                return "link"
+            except OSError:
+                # Another filesystem, FAT/exFAT, or a share that doesn't do links.
+                pass
+        _copy_file(src, tmp_path)
+    return "copy"
+
+
+def _output_entries(outputs):
+    entries = []
+    for path in outputs:
+        st = os.stat(path)
+        entries.append({"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return json.dumps(entries)
+
+
+@dataclass
+class DedupPlan:
+    """How a batch's inputs (by index) share work. Inputs in none of these are processed as usual."""
+    # SHA-256 of every input that had to be hashed.
+    digests: dict = field(default_factory=dict)
+    # Index of the first input with some content -> indices of the identical inputs after it.
+    copies: dict = field(default_factory=dict)
+    # Index -> outputs the same content produced, with the same options, in an earlier batch.
+    reused: dict = field(default_factory=dict)
+
+    def waiting(self):
+        """Indices that get their outputs from another input in this batch."""
+        return {idx for dups in self.copies.values() for idx in dups}
+
+
+class ContentIndex:
+    """SQLite-backed hash cache and content -> outputs map. Safe to share between threads."""
+
+    def __init__(self, db_path=None, link=False):
+        self.db_path = db_path or default_content_index_path()
+        # Materialize duplicate outputs as hard links (falling back to copies) rather than copies.
+        self.link = link
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def sha256(self, path, st=None):
+        """path's SHA-256, from the cache while its size and mtime are unchanged."""
+        path = os.path.abspath(path)
+        st = st or os.stat(path)
+        with self._lock:
+            row = self._conn.execute("SELECT size, mtime_ns, sha256 FROM hashes WHERE path = ?", (path,)).fetchone()
+        if row and tuple(row[:2]) == (st.st_size, st.st_mtime_ns):
+            return row[2]
+        digest = file_sha256(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, sha256, hashed_at) VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, digest, time.time()),
+            )
+        return digest
+
+    def _known_sizes(self, options):
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT size FROM contents WHERE options = ? UNION SELECT size FROM unhashed WHERE options = ?", (options, options))}
+
+    def lookup(self, digest, options):
+        """The outputs this content was turned into with these options, if they are all still there untouched."""
+        with self._lock:
+            row = self._conn.execute("SELECT outputs FROM contents WHERE sha256 = ? AND options = ?", (digest, options)).fetchone()
+        if row is None:
+            return None
+        outputs = json.loads(row[0])
+        for out in outputs:
+            try:
+                st = os.stat(out["path"])
+            except OSError:
+                return None
+            if (st.st_size, st.st_mtime_ns) != (out["size"], out["mtime_ns"]):
+                return None
+        return [out["path"] for out in outputs]
+
+    def record(self, digest, options, size, outputs):
+        """Notes that content `digest` (size bytes) became outputs with these options."""
+        entries = _output_entries(outputs)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contents (sha256, options, size, outputs, finished_at) VALUES (?, ?, ?, ?, ?)",
+                (digest, options, size, entries, time.time()),
+            )
+
+    def learn(self, path, options, outputs, digest=None):
+        """
+        Records that path's content became outputs with options. Without its
+        digest, path is only noted by size and mtime, and hashed if a later
+        batch brings an input of the same size (see plan()).
+        """
+        try:
+            st = os.stat(path)
+            if digest:
+                self.record(digest, options, st.st_size, outputs)
+                return
+            entries = _output_entries(outputs)
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO unhashed (path, options, size, mtime_ns, outputs, finished_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (os.path.abspath(path), options, st.st_size, st.st_mtime_ns, entries, time.time()),
+                )
+        except OSError as e:
+            logging.warning(f"Could not record {os.path.basename(path)} in the content index: {e}")
+
+    def _hash_unhashed(self, options, sizes, pool):
+        """Hashes the finished sources of these sizes that were only noted by size, moving them to contents."""
+        rows = []
+        with self._lock:
+            # A few hundred at a time, well under SQLite's limit on bound parameters.
+            for start in range(0, len(sizes), 500):
+                chunk = sizes[start:start + 500]
+                rows += self._conn.execute(
+                    f"SELECT path, size, mtime_ns, outputs FROM unhashed WHERE options = ? AND size IN ({','.join('?' * len(chunk))})",
+                    (options, *chunk)).fetchall()
+        if not rows:
+            return
+
+        def digest_of(row):
+            path, size, mtime_ns, _ = row
+            try:
+                st = os.stat(path)
+                if (st.st_size, st.st_mtime_ns) == (size, mtime_ns):
+                    return self.sha256(path, st)
+            except OSError:
+                pass
+            # Gone or changed since: what it became is no longer known.
+            return None
+
+        for (path, size, _, outputs), digest in zip(rows, pool.map(digest_of, rows)):
+            with self._lock, self._conn:
+                if digest is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO contents (sha256, options, size, outputs, finished_at) VALUES (?, ?, ?, ?, ?)",
+                        (digest, options, size, outputs, time.time()),
+                    )
+                self._conn.execute("DELETE FROM unhashed WHERE path = ? AND options = ?", (path, options))
+
+    def plan(self, items, options, reuse=True):
+        """
+        Works out which of items ((index, path) pairs) are identical to each other
+        or, with reuse, to content already processed with options (an options_key string).
+        """
+        plan = DedupPlan()
+        by_size = {}
+        for idx, path in items:
+            try:
+                st = os.stat(path)
+            except OSError:
+                # Let the normal path report it.
+                continue
+            by_size.setdefault(st.st_size, []).append((idx, path, st))
+        known = self._known_sizes(options) if reuse else set()
+        # Sizes no other input and no earlier content share can't be duplicates: don't hash them.
+        to_hash = [item for size, group in by_size.items() if len(group) > 1 or size in known for item in group]
+        if not to_hash:
+            return plan
+        with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+            if reuse:
+                self._hash_unhashed(options, sorted({item[2].st_size for item in to_hash} & known), pool)
+            digests = pool.map(lambda item: self._try_sha256(item[1], item[2]), to_hash)
+            for (idx, _, _), digest in zip(to_hash, digests):
+                if digest is not None:
+                    plan.digests[idx] = digest
+
+        groups = {}
+        for idx in sorted(plan.digests):
+            groups.setdefault(plan.digests[idx], []).append(idx)
+        for digest, indices in groups.items():
+            earlier = self.lookup(digest, options) if reuse else None
+            if earlier is not None:
+                for idx in indices:
+                    plan.reused[idx] = earlier
+            elif len(indices) > 1:
+                plan.copies[indices[0]] = indices[1:]
+        return plan
+
+    def _try_sha256(self, path, st):
+        try:
+            return self.sha256(path, st)
+        except OSError:
+            return None
+
+    def materialize(self, sources, targets):
+        """Makes each of targets a link to (or copy of) the matching source output. Returns the bytes written."""
+        nbytes = 0
+        for src, dst in zip(sources, targets):
+            if os.path.abspath(src) == os.path.abspath(dst):
+                continue
+            link_or_copy(src, dst, self.link)
+            nbytes += os.path.getsize(dst)
+        return nbytes
@@ -0,0 +1,73 @@
+"""
+Encoder profiles: how hard each output format works for a smaller file.
+
+"fast" favours encode speed (PNG at zlib level 1, WebP method 0, AVIF speed 9),
+"balanced" is the default and "smallest" spends more time for fewer bytes
+(progressive, Huffman-optimized JPEG, PNG at level 9, WebP method 6, slow AVIF).
+A rendition's own quality always wins over the profile's.
+"""
+from PIL import features
+
+PROFILES = ("fast", "balanced", "smallest")
+DEFAULT_PROFILE = "balanced"
+
+# Pillow save() arguments per format and profile.
+ENCODER_SETTINGS = {
+    "JPEG": {
+        "fast": {"quality": 95, "subsampling": "4:2:0"},
+        # Huffman optimization is lossless: same pixels as "fast", typically 15-20% fewer bytes.
+        "balanced": {"quality": 95, "subsampling": "4:2:0", "optimize": True},
+        "smallest": {"quality": 85, "subsampling": "4:2:0", "optimize": True, "progressive": True},
+    },
+    "PNG": {
+        # PNG is lossless, so the profile only trades zlib effort for size.
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "smallest": {"optimize": True},
+    },
+    "WEBP": {
+        "fast": {"quality": 85, "method": 0},
+        "balanced": {"quality": 85, "method": 4},
+        "smallest": {"quality": 75, "method": 6},
+    },
+    "AVIF": {
+        "fast": {"quality": 75, "speed": 9},
+        "balanced": {"quality": 75, "speed": 6},
+        "smallest": {"quality": 60, "speed": 4},
+    },
+}
+
+ENCODED_FORMATS = tuple(ENCODER_SETTINGS)
+
+# Pillow feature that has to be compiled in to write each format.
+_FEATURES = {"WEBP": "webp", "AVIF": "avif"}
+
+
+def format_supported(fmt):
+    """True if this Pillow build can write fmt."""
+    feature = _FEATURES.get(fmt)
+    return fmt in ENCODER_SETTINGS and (feature is None or bool(features.check(feature)))
+
+
+def encoder_settings(fmt, profile=DEFAULT_PROFILE, quality=None):
+    """The save() arguments for fmt under profile, with quality overriding the profile's if given."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown encoder profile: {profile}")
+    if fmt not in ENCODER_SETTINGS:
+        raise ValueError(f"Unsupported output format: {fmt}")
+    if not format_supported(fmt):
+        raise ValueError(f"This Pillow build can't write {fmt}.")
+    settings = dict(ENCODER_SETTINGS[fmt][profile])
+    if quality is not None and fmt != "PNG":
+        settings["quality"] = quality
+    return settings
+
+
+def encode(img, out_path, fmt, profile=DEFAULT_PROFILE, quality=None):
+    """Saves img to out_path as fmt, converting the mode if the format can't store it."""
+    settings = encoder_settings(fmt, profile, quality)
+    if fmt == "JPEG" and img.mode in ('RGBA', 'P'):
+        img = img.convert('RGB')
+    elif fmt in ("WEBP", "AVIF") and img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+    img.save(out_path, fmt, icc_profile=img.info.get('icc_profile'), **settings)
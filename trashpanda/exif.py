@@ -0,0 +1,330 @@
+"""
+Header-only EXIF reader.
+
+Pulls camera metadata out of JPEG APP1 segments, PNG/WebP EXIF chunks, TIFF
+based RAW files (NEF, ARW, CR2, DNG), Fujifilm RAF and ISO-BMFF containers
+(HEIC and CR3) without decoding any pixels. Files are memory-mapped, so only
+the header pages and the IFDs they point at are ever read from disk.
+
+Results are plain JSON-serialisable dicts.
+"""
+import mmap
+import os
+import struct
+
+from PIL.ExifTags import TAGS, GPSTAGS
+
+from .bmff import find_box, iter_boxes
+
+# Values larger than this (MakerNotes, embedded XMP, strip tables) are summarised, not read.
+MAX_VALUE_BYTES = 64 * 1024
+MAX_IFD_ENTRIES = 1024
+MAX_ARRAY_ITEMS = 64
+
+_EXIF_IFD_POINTER = 0x8769
+_GPS_IFD_POINTER = 0x8825
+_INTEROP_IFD_POINTER = 0xA005
+_POINTER_TAGS = (_EXIF_IFD_POINTER, _GPS_IFD_POINTER, _INTEROP_IFD_POINTER, 0x014A)  # 0x014A: SubIFDs
+_TEXT_UNDEFINED_TAGS = (0x9000, 0xA000)  # ExifVersion, FlashPixVersion
+_USER_COMMENT = 0x9286
+# Windows XPTitle/XPComment/XPAuthor/XPKeywords/XPSubject: UTF-16LE stored as BYTE arrays.
+_XP_TAGS = range(0x9C9B, 0x9CA0)
+
+# TIFF field type -> (struct code, size in bytes)
+_TYPES = {
+    1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1),
+    7: ("s", 1), 8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8), 13: ("I", 4),
+}
+
+_CR3_UUID = bytes.fromhex("85c0b687820f11e08111f4ce462b6a48")
+_CR3_TIFF_BOXES = {b"CMT1": "IFD0", b"CMT2": "Exif", b"CMT4": "GPS"}
+_HEIF_BRANDS = (b"heic", b"heix", b"heim", b"heis", b"hevc", b"hevx", b"mif1", b"msf1", b"avif")
+
+
+def _decode_bytes(tag, raw):
+    if tag in _XP_TAGS:
+        return raw.decode("utf-16-le", errors="replace").rstrip("\x00")
+    if tag == _USER_COMMENT and len(raw) >= 8:
+        charset, text = raw[:8], raw[8:]
+        encoding = "utf-16" if charset.startswith(b"UNICODE") else "latin-1"
+        return text.decode(encoding, errors="replace").rstrip("\x00 ")
+    if tag in _TEXT_UNDEFINED_TAGS or all(32 <= b < 127 for b in raw.rstrip(b"\x00")):
+        return raw.rstrip(b"\x00").decode("ascii", errors="replace")
+    return f"<{len(raw)} bytes>"
+
+
+def _read_value(buf, base, order, entry, end):
+    tag, typ, count = struct.unpack_from(order + "HHI", buf, entry)
+    if typ not in _TYPES:
+        return tag, None
+    code, unit = _TYPES[typ]
+    size = unit * count
+    if size > MAX_VALUE_BYTES:
+        return tag, f"<{size} bytes>"
+    if size <= 4:
+        offset = entry + 8
+    else:
+        offset = base + struct.unpack_from(order + "I", buf, entry + 8)[0]
+    if offset + size > end:
+        return tag, None
+    raw = bytes(buf[offset:offset + size])
+    if typ == 2:
+        value = raw.split(b"\x00", 1)[0].decode("utf-8", errors="replace").strip()
+        return tag, value
+    if typ == 7 or (typ == 1 and (tag == _USER_COMMENT or tag in _XP_TAGS)):
+        return tag, _decode_bytes(tag, raw)
+    if count > MAX_ARRAY_ITEMS:
+        return tag, f"<{count} values>"
+    if typ in (5, 10):
+        pairs = struct.unpack(order + code[0] * (2 * count), raw)
+        values = [round(n / d, 6) if d else None for n, d in zip(pairs[::2], pairs[1::2])]
+    else:
+        values = list(struct.unpack(order + code * count, raw))
+    return tag, values[0] if count == 1 else values
+
+
+def _read_ifd(buf, base, order, offset, end):
+    """Returns ({tag: value}, next_ifd_offset) for the IFD at base + offset."""
+    pos = base + offset
+    if offset <= 0 or pos + 2 > end:
+        return {}, 0
+    count = min(struct.unpack_from(order + "H", buf, pos)[0], MAX_IFD_ENTRIES)
+    entries = {}
+    for i in range(count):
+        entry = pos + 2 + 12 * i
+        if entry + 12 > end:
+            break
+        tag, value = _read_value(buf, base, order, entry, end)
+        if value is not None:
+            entries[tag] = value
+    next_pos = pos + 2 + 12 * count
+    next_offset = struct.unpack_from(order + "I", buf, next_pos)[0] if next_pos + 4 <= end else 0
+    return entries, next_offset
+
+
+def parse_tiff(buf, base=0, end=None):
+    """Parses a TIFF header at buf[base:] and returns {'IFD0': {...}, 'Exif': {...}, 'GPS': {...}} keyed by tag id."""
+    end = len(buf) if end is None else end
+    if base + 8 > end:
+        return {}
+    byte_order = bytes(buf[base:base + 2])
+    if byte_order == b"II":
+        order = "<"
+    elif byte_order == b"MM":
+        order = ">"
+    else:
+        return {}
+    ifd0_offset = struct.unpack_from(order + "I", buf, base + 4)[0]
+    ifd0, _ = _read_ifd(buf, base, order, ifd0_offset, end)
+    ifds = {"IFD0": ifd0}
+    for name, pointer in (("Exif", _EXIF_IFD_POINTER), ("GPS", _GPS_IFD_POINTER)):
+        offset = ifd0.get(pointer)
+        if isinstance(offset, int):
+            ifds[name], _ = _read_ifd(buf, base, order, offset, end)
+    return ifds
+
+
+def _jpeg_exif(buf, start=0, end=None):
+    """Returns the TIFF offset of the EXIF APP1 segment in a JPEG, or None."""
+    end = len(buf) if end is None else end
+    pos = start + 2
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            return None
+        length = struct.unpack_from(">H", buf, pos + 2)[0]
+        if marker == 0xE1 and bytes(buf[pos + 4:pos + 10]) == b"Exif\x00\x00":
+            return pos + 10, min(pos + 2 + length, end)
+        pos += 2 + length
+    return None
+
+
+def _png_exif(buf):
+    pos = 8
+    while pos + 8 <= len(buf):
+        length, chunk_type = struct.unpack_from(">I4s", buf, pos)
+        if chunk_type == b"eXIf":
+            return pos + 8, pos + 8 + length
+        if chunk_type in (b"IDAT", b"IEND"):
+            return None
+        pos += 12 + length
+    return None
+
+
+def _webp_exif(buf):
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk_type, length = struct.unpack_from("<4sI", buf, pos)
+        if chunk_type == b"EXIF":
+            start = pos + 8
+            if bytes(buf[start:start + 6]) == b"Exif\x00\x00":
+                start += 6
+            return start, pos + 8 + length
+        pos += 8 + length + (length & 1)
+    return None
+
+
+def _heif_exif(buf):
+    """Locates the Exif item of a HEIF file through its meta/iinf/iloc boxes."""
+    meta = find_box(buf, b"meta")
+    if meta is None:
+        return None
+    children = meta.payload + 4  # meta is a full box
+    exif_id = None
+    iinf = find_box(buf, b"iinf", children, meta.end)
+    if iinf is None:
+        return None
+    version = buf[iinf.payload]
+    first_entry = iinf.payload + 4 + (2 if version == 0 else 4)
+    for infe in iter_boxes(buf, first_entry, iinf.end):
+        if infe.type != b"infe":
+            continue
+        infe_version = buf[infe.payload]
+        if infe_version < 2:
+            continue
+        pos = infe.payload + 4
+        if infe_version == 2:
+            item_id = struct.unpack_from(">H", buf, pos)[0]
+            pos += 2
+        else:
+            item_id = struct.unpack_from(">I", buf, pos)[0]
+            pos += 4
+        if bytes(buf[pos + 2:pos + 6]) == b"Exif":
+            exif_id = item_id
+            break
+    if exif_id is None:
+        return None
+
+    iloc = find_box(buf, b"iloc", children, meta.end)
+    if iloc is None:
+        return None
+    version = buf[iloc.payload]
+    pos = iloc.payload + 4
+    offset_size, length_size = buf[pos] >> 4, buf[pos] & 0x0F
+    base_offset_size, index_size = buf[pos + 1] >> 4, (buf[pos + 1] & 0x0F if version in (1, 2) else 0)
+    pos += 2
+
+    def read_uint(size):
+        nonlocal pos
+        value = int.from_bytes(buf[pos:pos + size], "big") if size else 0
+        pos += size
+        return value
+
+    item_count = read_uint(2 if version < 2 else 4)
+    for _ in range(item_count):
+        item_id = read_uint(2 if version < 2 else 4)
+        if version in (1, 2):
+            read_uint(2)  # construction_method
+        read_uint(2)  # data_reference_index
+        base_offset = read_uint(base_offset_size)
+        extent_count = read_uint(2)
+        extents = []
+        for _ in range(extent_count):
+            read_uint(index_size)
+            extents.append((read_uint(offset_size), read_uint(length_size)))
+        if item_id == exif_id and extents:
+            start = base_offset + extents[0][0]
+            length = extents[0][1]
+            # Exif item payload: 4-byte offset to the TIFF header, then the header itself.
+            tiff_offset = struct.unpack_from(">I", buf, start)[0]
+            return start + 4 + tiff_offset, min(start + length, len(buf))
+    return None
+
+
+def _cr3_ifds(buf):
+    """Reads the TIFF blocks Canon stores in moov/uuid/CMT1..CMT4."""
+    moov = find_box(buf, b"moov")
+    if moov is None:
+        return {}
+    ifds = {}
+    for box in iter_boxes(buf, moov.payload, moov.end):
+        if box.type == b"uuid" and box.uuid == _CR3_UUID:
+            for cmt in iter_boxes(buf, box.payload, box.end):
+                name = _CR3_TIFF_BOXES.get(cmt.type)
+                if name:
+                    parsed = parse_tiff(buf, cmt.payload, cmt.end)
+                    ifds[name] = parsed.get("IFD0", {})
+    return ifds
+
+
+def _raf_ifds(buf):
+    """Fujifilm RAF: the EXIF lives in the embedded JPEG preview."""
+    jpeg_offset, jpeg_length = struct.unpack_from(">II", buf, 84)
+    found = _jpeg_exif(buf, jpeg_offset, min(jpeg_offset + jpeg_length, len(buf)))
+    return parse_tiff(buf, found[0], found[1]) if found else {}
+
+
+def sniff_format(buf):
+    head = bytes(buf[:16])
+    if head[:2] == b"\xff\xd8":
+        return "JPEG"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:16] == b"FUJIFILMCCD-RAW ":
+        return "RAF"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "TIFF"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand == b"crx ":
+            return "CR3"
+        if brand in _HEIF_BRANDS:
+            return "HEIF"
+    return None
+
+
+def _read_ifds(buf, fmt):
+    if fmt == "TIFF":
+        return parse_tiff(buf)
+    if fmt == "RAF":
+        return _raf_ifds(buf)
+    if fmt == "CR3":
+        return _cr3_ifds(buf)
+    locate = {"JPEG": _jpeg_exif, "PNG": _png_exif, "WEBP": _webp_exif, "HEIF": _heif_exif}.get(fmt)
+    found = locate(buf) if locate else None
+    return parse_tiff(buf, found[0], found[1]) if found else {}
+
+
+def _named(entries, names):
+    return {names.get(tag, f"0x{tag:04X}"): value for tag, value in entries.items() if tag not in _POINTER_TAGS}
+
+
+def read_exif(path):
+    """
+    Returns {'path', 'file', 'kind', 'format', 'exif', 'gps', 'make', 'model', 'datetime'}
+    for an image, or None if its container isn't one this reader understands.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 16:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            fmt = sniff_format(buf)
+            if fmt is None:
+                return None
+            try:
+                ifds = _read_ifds(buf, fmt)
+            except (struct.error, IndexError, ValueError):
+                ifds = {}
+
+    exif = _named(ifds.get("IFD0", {}), TAGS)
+    exif.update(_named(ifds.get("Exif", {}), TAGS))
+    gps = _named(ifds.get("GPS", {}), GPSTAGS)
+    return {
+        "path": path,
+        "file": os.path.basename(path),
+        "kind": "image",
+        "format": fmt,
+        "exif": exif,
+        "gps": gps,
+        "make": exif.get("Make"),
+        "model": exif.get("Model"),
+        "datetime": exif.get("DateTimeOriginal") or exif.get("DateTime"),
+    }
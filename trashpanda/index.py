@@ -0,0 +1,172 @@
+"""
+On-disk metadata index.
+
+Structured metadata records are stored in SQLite keyed by path, size and mtime,
+so asking for the metadata of a file we've already seen is a stat() and a row
+lookup instead of another EXIF parse or ffprobe run. A few summary columns are
+kept alongside the JSON record for queries that never touch the media.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .metadata import STREAM_CHUNK, has_gps, iter_chunks, read_metadata_batch
+from .jobs import DEFAULT_PROBE_JOBS
+from .paths import user_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    format TEXT,
+    make TEXT,
+    model TEXT,
+    datetime TEXT,
+    creation_time TEXT,
+    has_gps INTEGER NOT NULL DEFAULT 0,
+    record TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_kind ON files (kind);
+CREATE INDEX IF NOT EXISTS files_has_gps ON files (has_gps) WHERE has_gps;
+CREATE INDEX IF NOT EXISTS files_creation_time ON files (creation_time) WHERE creation_time IS NOT NULL;
+"""
+
+# SQLite's default limit on host parameters is 999 on older builds.
+_LOOKUP_CHUNK = 500
+
+
+def default_index_path():
+    return os.path.join(user_cache_dir(), "metadata.sqlite")
+
+
+class MetadataIndex:
+    """A SQLite-backed cache of metadata records. Safe to share between threads."""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_index_path()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _lookup(self, keys):
+        """Returns {path: record} for the (path, size, mtime_ns) keys that are still current."""
+        fresh = {}
+        by_path = {path: (size, mtime_ns) for path, size, mtime_ns in keys}
+        paths = list(by_path)
+        with self._lock:
+            for i in range(0, len(paths), _LOOKUP_CHUNK):
+                chunk = paths[i:i + _LOOKUP_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT path, size, mtime_ns, record FROM files WHERE path IN ({','.join('?' * len(chunk))})", chunk
+                )
+                for path, size, mtime_ns, record in rows:
+                    if by_path[path] == (size, mtime_ns):
+                        fresh[path] = json.loads(record)
+        return fresh
+
+    def store(self, records, stats):
+        """Saves records (with their os.stat results); records that carry an error are not cached."""
+        now = time.time()
+        rows = []
+        for record, st in zip(records, stats):
+            if record.get("error"):
+                continue
+            rows.append((
+                record["path"], st.st_size, st.st_mtime_ns, record["kind"], record.get("format"),
+                record.get("make"), record.get("model"), record.get("datetime"), record.get("creation_time"),
+                int(has_gps(record)), json.dumps(record, default=str), now,
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, kind, format, make, model, datetime, "
+                "creation_time, has_gps, record, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def refresh(self, paths, ffprobe_path=None, max_concurrent=DEFAULT_PROBE_JOBS, trace=None):
+        """
+        Returns a metadata record per path, in order. Files whose size and mtime
+        match the index are served from it; the rest are read (or probed), traced
+        on trace if given, and stored.
+        """
+        paths = [os.path.abspath(p) for p in paths]
+        records = [None] * len(paths)
+        keys, stats = [], {}
+        for idx, path in enumerate(paths):
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                records[idx] = {"path": path, "file": os.path.basename(path), "kind": "unknown", "error": str(e)}
+                continue
+            stats[path] = st
+            keys.append((path, st.st_size, st.st_mtime_ns))
+
+        fresh = self._lookup(keys)
+        stale = [idx for idx, path in enumerate(paths) if records[idx] is None and path not in fresh]
+        for idx, path in enumerate(paths):
+            if path in fresh:
+                records[idx] = fresh[path]
+
+        if stale:
+            new_records = read_metadata_batch([paths[i] for i in stale], ffprobe_path, max_concurrent, trace)
+            for idx, record in zip(stale, new_records):
+                records[idx] = record
+            self.store(new_records, [stats[paths[i]] for i in stale])
+        return records
+
+    def iter_refresh(self, paths, ffprobe_path=None, max_concurrent=DEFAULT_PROBE_JOBS, chunk_size=STREAM_CHUNK, trace=None):
+        """Like refresh, but yields records (in order) a chunk at a time as they are read."""
+        for chunk in iter_chunks(paths, chunk_size):
+            yield from self.refresh(chunk, ffprobe_path, max_concurrent, trace)
+
+    def query(self, kind=None, has_gps=None, has_creation_time=None, under=None, limit=None):
+        """Yields stored records matching every given filter, without touching the media."""
+        clauses, params = [], []
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if has_gps is not None:
+            clauses.append("has_gps = ?")
+            params.append(int(has_gps))
+        if has_creation_time is not None:
+            clauses.append("creation_time IS NOT NULL" if has_creation_time else "creation_time IS NULL")
+        if under:
+            prefix = os.path.join(os.path.abspath(under), "")
+            clauses.append("substr(path, 1, ?) = ?")
+            params.extend([len(prefix), prefix])
+        sql = "SELECT record FROM files"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY path"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def prune(self):
+        """Drops entries for files that no longer exist. Returns how many were removed."""
+        with self._lock:
+            paths = [row[0] for row in self._conn.execute("SELECT path FROM files")]
+        missing = [(p,) for p in paths if not os.path.exists(p)]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", missing)
+        return len(missing)
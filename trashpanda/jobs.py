@@ -0,0 +1,254 @@
+"""
+Runs batches of external tool processes (ffmpeg, ffprobe) concurrently.
+
+Jobs run as asyncio subprocesses with a cap on how many are alive at once, an
+optional wall-clock timeout and, for ffmpeg jobs that write `-progress pipe:1`,
+a stall timeout and live per-file progress. Hung processes are killed.
+
+With a progress.ProgressChannel, running processes are suspended while it is
+paused (SIGSTOP/SIGCONT, so POSIX only; elsewhere they run to the end and only
+new jobs wait) and killed once it is cancelled. Paused time doesn't count
+towards either timeout.
+"""
+import asyncio
+import re
+import signal
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+DEFAULT_FFMPEG_JOBS = 3
+DEFAULT_PROBE_JOBS = 8
+# An ffmpeg job that hasn't reported progress for this long is considered hung.
+DEFAULT_STALL_TIMEOUT = 120
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+_STDERR_TAIL_LINES = 50
+# How often a running job checks for pause, cancel and its timeouts.
+_POLL_INTERVAL = 0.2
+_CAN_SUSPEND = hasattr(signal, "SIGSTOP")
+
+
+@dataclass
+class ToolJob:
+    """One external command. key identifies it in callbacks and results (usually the input path)."""
+    key: str
+    cmd: list
+    output: str = None
+    timeout: float = None
+    # Set for ffmpeg commands run with '-progress pipe:1'.
+    progress: bool = False
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT
+    # Input duration in seconds; parsed from ffmpeg's stderr when not given.
+    duration: float = None
+
+
+@dataclass
+class JobResult:
+    key: str
+    output: str = None
+    returncode: int = None
+    stdout: bytes = b""
+    stderr: str = ""
+    error: str = None
+    elapsed: float = 0.0
+    progress: dict = field(default_factory=dict)
+    # Set by callers that found the output already up to date and never ran the command.
+    skipped: bool = False
+    # The batch was cancelled before or while this job ran; its process was killed.
+    cancelled: bool = False
+    # Set by callers that linked or copied the output of a byte-identical input instead.
+    duplicate_of: str = None
+
+
+class JobStalled(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _parse_duration(text):
+    m = _DURATION_RE.search(text)
+    if not m:
+        return None
+    hours, minutes, seconds = m.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _progress_fraction(stats, duration):
+    if stats.get("progress") == "end":
+        return 1.0
+    if not duration:
+        return None
+    # out_time_ms is (despite the name) also in microseconds on every ffmpeg that has it.
+    value = stats.get("out_time_us") or stats.get("out_time_ms")
+    try:
+        return max(0.0, min(1.0, int(value) / 1e6 / duration))
+    except (TypeError, ValueError):
+        return None
+
+
+async def _pump_progress(job, proc, on_progress, activity):
+    """
+    Reads ffmpeg's -progress key=value blocks from stdout while keeping a tail of
+    stderr. activity[0] is bumped on every line, for the stall check.
+    """
+    duration = job.duration
+    stderr_tail = deque(maxlen=_STDERR_TAIL_LINES)
+    last_stats = {}
+
+    async def read_stderr():
+        nonlocal duration
+        async for line in proc.stderr:
+            text = line.decode(errors="replace").rstrip()
+            stderr_tail.append(text)
+            if duration is None:
+                duration = _parse_duration(text)
+
+    stderr_task = asyncio.ensure_future(read_stderr())
+    try:
+        stats = {}
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            activity[0] += 1
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            stats[key] = value
+            if key == "progress":
+                last_stats = stats
+                if on_progress:
+                    on_progress(job.key, _progress_fraction(stats, duration), stats)
+                stats = {}
+        await stderr_task
+        await proc.wait()
+    finally:
+        if not stderr_task.done():
+            stderr_task.cancel()
+    return b"", "\n".join(stderr_tail), last_stats
+
+
+async def _communicate(proc):
+    stdout, stderr = await proc.communicate()
+    return stdout, stderr.decode(errors="replace")[-8192:], {}
+
+
+def _signal(proc, sig):
+    try:
+        proc.send_signal(sig)
+    except ProcessLookupError:
+        # Exited in the meantime.
+        pass
+
+
+async def _supervise(job, proc, pump, progress, activity):
+    """
+    Waits for pump, enforcing job's timeouts and the channel's pause and cancel.
+    Only time spent running counts towards the timeouts.
+    """
+    task = asyncio.ensure_future(pump)
+    running = idle = 0.0
+    suspended = False
+    last_tick, last_activity = time.monotonic(), activity[0]
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=_POLL_INTERVAL)
+            if done:
+                return task.result()
+            now = time.monotonic()
+            if progress is not None and progress.cancelled:
+                raise JobCancelled()
+            pause = progress is not None and progress.paused and _CAN_SUSPEND
+            if pause != suspended:
+                _signal(proc, signal.SIGSTOP if pause else signal.SIGCONT)
+                suspended = pause
+            if not suspended:
+                running += now - last_tick
+                idle = 0.0 if activity[0] != last_activity else idle + now - last_tick
+            last_tick, last_activity = now, activity[0]
+            if job.timeout and running > job.timeout:
+                raise asyncio.TimeoutError()
+            if job.progress and idle > job.stall_timeout:
+                raise JobStalled(f"no progress for {job.stall_timeout}s")
+    finally:
+        if suspended:
+            _signal(proc, signal.SIGCONT)
+        if not task.done():
+            task.cancel()
+
+
+async def _run_job(job, semaphore, on_progress, progress):
+    async with semaphore:
+        result = JobResult(job.key, output=job.output)
+        # Paused: don't start anything new; cancelled: don't start at all.
+        while progress is not None and progress.paused:
+            await asyncio.sleep(_POLL_INTERVAL)
+        if progress is not None and progress.cancelled:
+            result.cancelled = True
+            return result
+        start = time.monotonic()
+        activity = [0]
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *job.cmd, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+            )
+        except OSError as e:
+            result.error = str(e)
+            return result
+        try:
+            pump = _pump_progress(job, proc, on_progress, activity) if job.progress else _communicate(proc)
+            result.stdout, result.stderr, result.progress = await _supervise(job, proc, pump, progress, activity)
+            result.returncode = proc.returncode
+            if proc.returncode != 0:
+                last_line = result.stderr.strip().splitlines()[-1:] or [""]
+                result.error = f"{job.cmd[0]} exited with status {proc.returncode}: {last_line[0]}"
+        except asyncio.TimeoutError:
+            result.error = f"timed out after {job.timeout}s"
+        except JobStalled as e:
+            result.error = str(e)
+        except JobCancelled:
+            result.cancelled = True
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            result.elapsed = time.monotonic() - start
+        return result
+
+
+async def _run_all(jobs, max_concurrent, on_progress, on_done, progress):
+    semaphore = asyncio.Semaphore(max(1, max_concurrent))
+
+    async def run_indexed(idx, job):
+        return idx, await _run_job(job, semaphore, on_progress, progress)
+
+    tasks = [asyncio.ensure_future(run_indexed(idx, job)) for idx, job in enumerate(jobs)]
+    results = [None] * len(jobs)
+    done_count = 0
+    for next_done in asyncio.as_completed(tasks):
+        idx, result = await next_done
+        results[idx] = result
+        done_count += 1
+        if on_done:
+            on_done(result, done_count, len(jobs))
+    return results
+
+
+def run_jobs(jobs, max_concurrent=DEFAULT_FFMPEG_JOBS, on_progress=None, on_done=None, progress=None):
+    """
+    Runs every ToolJob and returns a JobResult per job, in input order. Blocks the
+    calling thread, which must not already be running an event loop.
+
+    on_progress(key, fraction, stats) fires for progress-enabled jobs (fraction is
+    None while the duration is unknown); on_done(result, done, total) fires as each
+    job finishes. Both are called from the calling thread. With a
+    progress.ProgressChannel, jobs are paused and cancelled through it; cancelled
+    jobs come back with cancelled set.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+    return asyncio.run(_run_all(jobs, max_concurrent, on_progress, on_done, progress))
@@ -0,0 +1,124 @@
+"""
+Batch manifest: a record of every output a batch has finished.
+
+Each row ties an input (by path, size and mtime) and the options it was
+processed with to the output that was written (path, size, mtime, SHA-256).
+A rerun of the same batch skips inputs whose output is still up to date, so an
+interrupted 50k-file job picks up where it stopped instead of starting over.
+Rows are only written once the output has been renamed into place.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import fields, is_dataclass
+
+from .paths import user_cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outputs (
+    source TEXT NOT NULL,
+    output TEXT NOT NULL,
+    options TEXT NOT NULL,
+    source_size INTEGER NOT NULL,
+    source_mtime_ns INTEGER NOT NULL,
+    output_size INTEGER NOT NULL,
+    output_mtime_ns INTEGER NOT NULL,
+    output_sha256 TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (source, output)
+);
+"""
+
+_HASH_CHUNK = 1024 * 1024
+
+
+def default_manifest_path():
+    return os.path.join(user_cache_dir(), "manifest.sqlite")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def options_key(kind, options):
+    """
+    A stable string for the settings an output was produced with (a dataclass or a
+    dict). Dataclass fields marked metadata={"affects_output": False} are left out.
+    """
+    if is_dataclass(options):
+        values = {f.name: getattr(options, f.name) for f in fields(options) if f.metadata.get("affects_output", True)}
+    else:
+        values = dict(options)
+    return json.dumps({"kind": kind, **values}, sort_keys=True, default=_jsonable)
+
+
+def _jsonable(value):
+    # Nested option objects, e.g. ConvertOptions.renditions.
+    if is_dataclass(value):
+        return {f.name: getattr(value, f.name) for f in fields(value)}
+    return str(value)
+
+
+class BatchManifest:
+    """SQLite-backed manifest of finished outputs. Safe to share between threads."""
+
+    def __init__(self, db_path=None, verify=False):
+        self.db_path = db_path or default_manifest_path()
+        # Re-hash outputs before trusting them, instead of only comparing size and mtime.
+        self.verify = verify
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_current(self, source, output, options):
+        """True if output was produced from source as it is now, with these options, and is untouched since."""
+        source, output = os.path.abspath(source), os.path.abspath(output)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT options, source_size, source_mtime_ns, output_size, output_mtime_ns, output_sha256 "
+                "FROM outputs WHERE source = ? AND output = ?", (source, output)
+            ).fetchone()
+        if row is None or row[0] != options:
+            return False
+        try:
+            src, out = os.stat(source), os.stat(output)
+        except OSError:
+            return False
+        if (src.st_size, src.st_mtime_ns) != tuple(row[1:3]) or (out.st_size, out.st_mtime_ns) != tuple(row[3:5]):
+            return False
+        return not self.verify or file_sha256(output) == row[5]
+
+    def record(self, source, output, options, source_stat=None, output_sha256=None):
+        """
+        Notes that output is finished. Pass the source's os.stat from before it was
+        read, so a source edited mid-conversion is redone next time.
+        """
+        source, output = os.path.abspath(source), os.path.abspath(output)
+        src = source_stat or os.stat(source)
+        out = os.stat(output)
+        digest = output_sha256 or file_sha256(output)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO outputs (source, output, options, source_size, source_mtime_ns, "
+                "output_size, output_mtime_ns, output_sha256, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, output, options, src.st_size, src.st_mtime_ns, out.st_size, out.st_mtime_ns, digest, time.time()),
+            )
@@ -0,0 +1,202 @@
+import os
+import csv
+import json
+import subprocess
+
+from PIL import Image, ExifTags
+
+from .backends import backend, backend_for
+from .exif import read_exif
+from .jobs import DEFAULT_PROBE_JOBS, ToolJob, run_jobs
+from .trace import FileTrace, job_span
+from .video import SUPPORTED_VIDEO_EXTS
+
+RAW_EXTS = ('.raf', '.cr2', '.cr3', '.arw', '.nef', '.dng')
+
+
+def _record(path, kind, **fields):
+    record = {"path": path, "file": os.path.basename(path), "kind": kind}
+    record.update(fields)
+    return record
+
+
+def _pillow_metadata(image_path):
+    """Fallback for containers the header reader doesn't know (BMP, GIF, ...). Pillow only parses headers on open."""
+    # Registers the HEIF opener if this is a HEIC the header reader couldn't handle.
+    backend_for(image_path)
+    with Image.open(image_path) as img:
+        exif_data = img.getexif()
+        exif = {}
+        for tag_id, value in exif_data.items():
+            if tag_id in (ExifTags.IFD.Exif, ExifTags.IFD.GPSInfo):
+                continue
+            if isinstance(value, bytes):
+                value = value.decode(errors='replace')
+            exif[ExifTags.TAGS.get(tag_id, f"0x{tag_id:04X}")] = value
+        gps = {ExifTags.GPSTAGS.get(k, f"0x{k:04X}"): v for k, v in exif_data.get_ifd(ExifTags.IFD.GPSInfo).items()}
+        fmt = img.format
+    return _record(image_path, "image", format=fmt, exif=exif, gps=gps, make=exif.get("Make"), model=exif.get("Model"),
+                   datetime=exif.get("DateTimeOriginal") or exif.get("DateTime"))
+
+
+def read_photo_metadata(image_path):
+    """Returns a structured metadata record for an image, reading only its headers where possible."""
+    try:
+        record = read_exif(image_path) or _pillow_metadata(image_path)
+        ext = os.path.splitext(image_path)[1].lower()
+        rawpy = backend("raw") if ext in RAW_EXTS and not record["make"] else None
+        if rawpy:
+            # Last resort for RAW layouts the header reader doesn't cover; this unpacks the whole file.
+            with rawpy.imread(image_path) as raw:
+                record.update(make=raw.camera_manufacturer, model=raw.model, datetime=raw.timestamp)
+        return record
+    except Exception as e:
+        return _record(image_path, "image", error=str(e))
+
+
+# A probe only reads headers; anything slower than this is a hung process or a dead network share.
+PROBE_TIMEOUT = 60
+# Files read per step when streaming records, so viewers can show the first results right away.
+STREAM_CHUNK = 64
+
+
+def probe_command(video_path, ffprobe_path):
+    return [ffprobe_path, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", video_path]
+
+
+def _video_record(video_path, probe):
+    creation_time = (probe.get("format", {}).get("tags") or {}).get("creation_time")
+    return _record(video_path, "video", probe=probe, creation_time=creation_time)
+
+
+def read_video_metadata(video_path, ffprobe_path):
+    """Returns a structured metadata record for a video, holding ffprobe's format/streams output."""
+    if not ffprobe_path:
+        return _record(video_path, "video", error="ffprobe not found.")
+    try:
+        cmd = probe_command(video_path, ffprobe_path)
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True, timeout=PROBE_TIMEOUT)
+        return _video_record(video_path, json.loads(result.stdout))
+    except Exception as e:
+        return _record(video_path, "video", error=str(e))
+
+
+def _probe_result_record(video_path, result):
+    try:
+        if result.error:
+            raise RuntimeError(result.error)
+        return _video_record(video_path, json.loads(result.stdout))
+    except Exception as e:
+        return _record(video_path, "video", error=str(e))
+
+
+def format_metadata(record):
+    """Renders a metadata record as the indented text shown in the metadata viewer."""
+    if record.get("error"):
+        return f"Error reading {record['file']}: {record['error']}"
+    if record["kind"] == "video":
+        return f"File: {record['file']}\n" + json.dumps(record["probe"], indent=4)
+    text_content = f"File: {record['file']}\n"
+    if not record["exif"] and not record["gps"]:
+        if record.get("make"):
+            return text_content + f"  Camera: {record['make']} {record['model']}\n  Timestamp: {record['datetime']}"
+        return text_content + "  No EXIF metadata found."
+    for tag, value in record["exif"].items():
+        text_content += f"  {tag}: {value}\n"
+    for tag, value in record["gps"].items():
+        text_content += f"  {tag}: {value}\n"
+    return text_content
+
+
+def has_gps(record):
+    """True if a record carries a location: EXIF GPS tags, or a location tag in a video's container."""
+    if record.get("gps"):
+        return True
+    if record["kind"] == "video":
+        tags = (record.get("probe", {}).get("format", {}).get("tags") or {})
+        return any("location" in key.lower() for key in tags)
+    return False
+
+
+# Fixed columns so CSV rows can be written as records stream in; the full tag set goes in "metadata" as JSON.
+CSV_COLUMNS = ("path", "file", "kind", "format", "make", "model", "datetime", "creation_time", "has_gps", "error", "metadata")
+
+
+def write_jsonl(records, f):
+    """Writes one JSON object per record to the text file f. Returns how many were written."""
+    count = 0
+    for record in records:
+        f.write(json.dumps(record, default=str) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(records, f):
+    """Writes records as CSV_COLUMNS rows to f (opened with newline=''). Returns how many were written."""
+    writer = csv.writer(f)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for record in records:
+        if record.get("error"):
+            tags = None
+        elif record["kind"] == "video":
+            tags = record.get("probe")
+        else:
+            tags = {**record.get("exif", {}), **record.get("gps", {})}
+        row = {**record, "has_gps": int(has_gps(record)) if not record.get("error") else "",
+               "metadata": json.dumps(tags, default=str) if tags else ""}
+        writer.writerow(["" if row.get(col) is None else row.get(col) for col in CSV_COLUMNS])
+        count += 1
+    return count
+
+
+def read_metadata(path, ffprobe_path=None):
+    """Returns the metadata record for any supported file, picking the photo or video reader by extension."""
+    if os.path.splitext(path)[1].lower() in SUPPORTED_VIDEO_EXTS:
+        return read_video_metadata(path, ffprobe_path)
+    return read_photo_metadata(path)
+
+
+def read_metadata_batch(paths, ffprobe_path=None, max_concurrent=DEFAULT_PROBE_JOBS, trace=None):
+    """
+    Returns a metadata record per path, in order, running the ffprobe calls
+    concurrently. With a trace.BatchTrace, each read is added to it as one span.
+    """
+    paths = list(paths)
+    reports = [None] * len(paths)
+    video_jobs, video_indices = [], []
+    for idx, path in enumerate(paths):
+        if os.path.splitext(path)[1].lower() not in SUPPORTED_VIDEO_EXTS:
+            file_trace = FileTrace()
+            with file_trace.stage("metadata"):
+                reports[idx] = read_photo_metadata(path)
+            if trace is not None:
+                trace.add(path, "image", file_trace.spans, reports[idx].get("error"))
+        elif not ffprobe_path:
+            reports[idx] = read_video_metadata(path, ffprobe_path)
+        else:
+            video_jobs.append(ToolJob(path, probe_command(path, ffprobe_path), timeout=PROBE_TIMEOUT))
+            video_indices.append(idx)
+    for idx, result in zip(video_indices, run_jobs(video_jobs, max_concurrent)):
+        reports[idx] = _probe_result_record(paths[idx], result)
+        if trace is not None:
+            trace.add(paths[idx], "video", [job_span("ffprobe", None, None, result.elapsed)], reports[idx].get("error"))
+    return reports
+
+
+def iter_chunks(items, size):
+    """Yields lists of up to size items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_metadata(paths, ffprobe_path=None, max_concurrent=DEFAULT_PROBE_JOBS, chunk_size=STREAM_CHUNK, trace=None):
+    """Like read_metadata_batch, but yields records (in order) a chunk at a time as they are read."""
+    for chunk in iter_chunks(paths, chunk_size):
+        yield from read_metadata_batch(chunk, ffprobe_path, max_concurrent, trace)
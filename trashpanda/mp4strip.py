@@ -0,0 +1,176 @@
+"""
+Metadata removal for MP4/MOV files without a remux.
+
+Only the moov box is rebuilt: udta/meta/uuid boxes are dropped, the creation
+and modification times in mvhd/tkhd/mdhd are zeroed and the stco/co64 chunk
+offsets are moved down by however much the boxes before the media data shrank.
+The mdat itself is copied byte for byte, by the kernel where it can
+(copy_file_range, which shares extents instead of copying on btrfs and XFS).
+
+Anything this can't vouch for (fragmented files, timed metadata tracks whose
+samples live in mdat, truncated boxes) raises UnsupportedContainer so the
+caller can fall back to ffmpeg.
+"""
+import bisect
+import mmap
+import os
+import struct
+
+from .bmff import find_box, find_path, iter_boxes
+from .strip import UnsupportedContainer
+
+MP4_STRIP_EXTS = ('.mp4', '.mov', '.m4v')
+
+# Dropped wherever they appear at the top level or inside the containers below.
+# free/skip/wide are padding, but nothing guarantees what's left in them.
+_METADATA_BOXES = {b'udta', b'meta', b'uuid', b'free', b'skip', b'wide'}
+# Boxes that only hold other boxes, on the way down to the sample tables.
+_CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+# Full boxes that start with creation and modification times.
+_TIMESTAMP_BOXES = {b'mvhd', b'tkhd', b'mdhd'}
+
+_COPY_CHUNK = 8 * 1024 * 1024
+
+
+def _top_level_boxes(buf, size):
+    boxes = list(iter_boxes(buf, 0, size))
+    if not boxes or boxes[-1].end != size:
+        raise UnsupportedContainer("Not an MP4/MOV file, or it is truncated.")
+    types = [box.type for box in boxes]
+    if types.count(b'moov') != 1:
+        raise UnsupportedContainer("Expected exactly one moov box.")
+    if b'moof' in types:
+        raise UnsupportedContainer("Fragmented MP4 files aren't supported.")
+    return boxes
+
+
+def _set_size(header, size):
+    if struct.unpack_from(">I", header, 0)[0] == 1:
+        struct.pack_into(">Q", header, 8, size)
+    elif size > 0xFFFFFFFF:
+        raise UnsupportedContainer("Box too large for its header.")
+    else:
+        struct.pack_into(">I", header, 0, size)
+
+
+def _zero_times(buf, box):
+    data = bytearray(buf[box.start:box.end])
+    pos = box.payload - box.start
+    if len(data) < pos + 20:
+        raise UnsupportedContainer(f"Truncated {box.type.decode('latin-1')} box.")
+    if data[pos] == 1:
+        data[pos + 4:pos + 20] = bytes(16)
+    else:
+        data[pos + 4:pos + 12] = bytes(8)
+    return bytes(data)
+
+
+def _check_track(buf, trak):
+    hdlr = find_path(buf, [b'mdia', b'hdlr'], trak.payload, trak.end)
+    if hdlr is not None and buf[hdlr.payload + 8:hdlr.payload + 12] == b'meta':
+        # e.g. GoPro GPS or Apple location tracks: their samples are in mdat.
+        raise UnsupportedContainer("File has a timed metadata track.")
+
+
+def _clean_box(buf, box):
+    """Returns box as bytes, minus any metadata boxes inside it."""
+    if box.type in _TIMESTAMP_BOXES:
+        return _zero_times(buf, box)
+    if box.type not in _CONTAINER_BOXES:
+        return bytes(buf[box.start:box.end])
+    if box.type == b'moov' and (find_box(buf, b'mvex', box.payload, box.end) or find_box(buf, b'cmov', box.payload, box.end)):
+        raise UnsupportedContainer("Fragmented or compressed movie headers aren't supported.")
+    if box.type == b'trak':
+        _check_track(buf, box)
+    children = list(iter_boxes(buf, box.payload, box.end))
+    if (children[-1].end if children else box.payload) != box.end:
+        raise UnsupportedContainer(f"Unexpected data inside the {box.type.decode('latin-1')} box.")
+    body = b"".join(_clean_box(buf, child) for child in children if child.type not in _METADATA_BOXES)
+    header = bytearray(buf[box.start:box.payload])
+    _set_size(header, len(header) + len(body))
+    return bytes(header) + body
+
+
+def _patch_chunk_offsets(moov, relocate):
+    """Rewrites every stco/co64 entry in moov (a bytearray) through relocate(offset)."""
+    top = next(iter_boxes(moov))
+    for trak in iter_boxes(moov, top.payload, top.end):
+        if trak.type != b'trak':
+            continue
+        stbl = find_path(moov, [b'mdia', b'minf', b'stbl'], trak.payload, trak.end)
+        if stbl is None:
+            continue
+        for box in iter_boxes(moov, stbl.payload, stbl.end):
+            if box.type not in (b'stco', b'co64'):
+                continue
+            fmt = ">I" if box.type == b'stco' else ">Q"
+            width = struct.calcsize(fmt)
+            count = struct.unpack_from(">I", moov, box.payload + 4)[0]
+            if box.payload + 8 + count * width > box.end:
+                raise UnsupportedContainer("Truncated chunk offset table.")
+            for pos in range(box.payload + 8, box.payload + 8 + count * width, width):
+                struct.pack_into(fmt, moov, pos, relocate(struct.unpack_from(fmt, moov, pos)[0]))
+
+
+def _copy_range(src, dst, offset, length):
+    """Appends length bytes of src, from offset, to dst; in the kernel where the OS allows it."""
+    dst.flush()
+    if hasattr(os, "copy_file_range"):
+        try:
+            while length:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), min(length, 1 << 30), offset)
+                if not copied:
+                    raise ValueError("source file is truncated")
+                offset += copied
+                length -= copied
+            return
+        except OSError:
+            # Not supported between these filesystems; finish with plain reads and writes.
+            pass
+    src.seek(offset)
+    while length:
+        data = src.read(min(length, _COPY_CHUNK))
+        if not data:
+            raise ValueError("source file is truncated")
+        dst.write(data)
+        length -= len(data)
+
+
+def strip_mp4(src, dst):
+    """
+    Writes src to dst without its metadata, rebuilding only the moov box.
+    Raises UnsupportedContainer if the file has to go through ffmpeg instead.
+    """
+    with open(src, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < 8:
+            raise UnsupportedContainer("Not an MP4/MOV file.")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            boxes = _top_level_boxes(buf, size)
+            old_moov = next(box for box in boxes if box.type == b'moov')
+            moov = bytes(buf[old_moov.start:old_moov.end])
+        new_moov = bytearray(_clean_box(moov, next(iter_boxes(moov))))
+
+        kept = [box for box in boxes if box.type not in _METADATA_BOXES]
+        starts, moves = [], []
+        new_pos = 0
+        for box in kept:
+            starts.append(box.start)
+            moves.append((box, new_pos - box.start))
+            new_pos += len(new_moov) if box is old_moov else box.end - box.start
+
+        if any(shift for box, shift in moves if box is not old_moov):
+            def relocate(offset):
+                idx = bisect.bisect_right(starts, offset) - 1
+                box, shift = moves[idx] if idx >= 0 else (None, 0)
+                if box is None or box is old_moov or offset > box.end:
+                    raise UnsupportedContainer("A chunk offset points outside the media data.")
+                return offset + shift
+            _patch_chunk_offsets(new_moov, relocate)
+
+        with open(dst, 'wb') as out:
+            for box in kept:
+                if box is old_moov:
+                    out.write(new_moov)
+                else:
+                    _copy_range(f, out, box.start, box.end - box.start)
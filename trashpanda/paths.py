@@ -0,0 +1,50 @@
+import os
+import sys
+import uuid
+from contextlib import contextmanager
+
+
+def user_cache_dir(*parts):
+    """Returns (and creates) a per-user cache folder for Trash Panda, e.g. ~/.cache/trashpanda/<parts>."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    path = os.path.join(base, 'trashpanda', *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def partial_path_for(path):
+    """
+    A unique hidden temporary name next to path to write it under first. Keeps the
+    extension, so tools that pick a format from it (ffmpeg) still work.
+    """
+    directory, name = os.path.split(path)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(directory, f".{stem}.{uuid.uuid4().hex[:8]}.part{ext}")
+
+
+def discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def atomic_output(path):
+    """
+    Yields a temporary path to write path's contents to. It is renamed over path
+    only if the block succeeds, so a crash never leaves a truncated file under
+    the real name.
+    """
+    tmp_path = partial_path_for(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        discard(tmp_path)
+        raise
@@ -0,0 +1,307 @@
+"""
+Preview thumbnails for the GUI: cheap decodes, an LRU cache and a single
+background worker that only ever works on what the user is looking at.
+
+Images handed back are plain PIL images; turning them into Tk PhotoImages is
+the caller's job and must happen on the Tk thread.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+
+from PIL import Image, ImageOps, ExifTags
+
+from .backends import backend
+
+RAW_EXTS = ('.raf', '.cr2', '.cr3', '.arw', '.nef', '.dng')
+HEIF_EXTS = ('.heic', '.heif')
+
+# EXIF IFD1 tags pointing at the embedded JPEG thumbnail.
+_JPEG_IF_OFFSET = 0x0201
+_JPEG_IF_LENGTH = 0x0202
+
+# EXIF orientation -> the transpose that puts the image upright (same table as ImageOps.exif_transpose).
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# rawpy's sizes.flip -> the equivalent EXIF orientation.
+_RAW_FLIP_ORIENTATION = {3: 3, 5: 8, 6: 6}
+
+
+def _covers(size, box):
+    """True if an image of this size can be shrunk (not enlarged) to fill box."""
+    return size[0] >= box[0] or size[1] >= box[1]
+
+
+def _apply_orientation(img, orientation):
+    method = _ORIENTATION_TRANSPOSE.get(orientation)
+    return img.transpose(method) if method else img
+
+
+def _raw_thumbnail(path, box):
+    """Returns the camera's embedded preview from a RAW file without demosaicing anything."""
+    rawpy = backend("raw")
+    if not rawpy:
+        return None
+    with rawpy.imread(path) as raw:
+        try:
+            thumb = raw.extract_thumb()
+        except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+            return None
+        flip = raw.sizes.flip
+    if thumb.format == rawpy.ThumbFormat.JPEG:
+        img = Image.open(io.BytesIO(thumb.data))
+        img.draft('RGB', box)
+    else:
+        img = Image.fromarray(thumb.data)
+    return _apply_orientation(img, _RAW_FLIP_ORIENTATION.get(flip))
+
+
+def _exif_thumbnail(img, box):
+    """Returns the EXIF (IFD1) JPEG thumbnail, upright, if it is big enough for box."""
+    try:
+        exif = img.getexif()
+        ifd1 = exif.get_ifd(ExifTags.IFD.IFD1)
+    except Exception:
+        return None
+    offset, length = ifd1.get(_JPEG_IF_OFFSET), ifd1.get(_JPEG_IF_LENGTH)
+    if not offset or not length:
+        return None
+    # Offsets are relative to the TIFF header: the start of the EXIF block, or of the file for TIFFs.
+    raw_exif = img.info.get('exif')
+    if raw_exif:
+        tiff = raw_exif[6:] if raw_exif.startswith(b'Exif\x00\x00') else raw_exif
+        thumb_bytes = tiff[offset:offset + length]
+    else:
+        with open(img.filename, 'rb') as f:
+            f.seek(offset)
+            thumb_bytes = f.read(length)
+    if len(thumb_bytes) != length:
+        return None
+    thumb = Image.open(io.BytesIO(thumb_bytes))
+    if not _covers(thumb.size, box):
+        return None
+    return _apply_orientation(thumb, exif.get(ExifTags.Base.Orientation))
+
+
+def _heif_thumbnail(path, box):
+    """Returns the smallest embedded HEIF thumbnail that still covers box."""
+    pillow_heif = backend("heif")
+    if not pillow_heif:
+        return None
+    heif_file = pillow_heif.open_heif(path)
+    primary = heif_file[heif_file.primary_index]
+    for idx, _ in sorted(enumerate(heif_file.info.get('thumbnails') or ()), key=lambda t: t[1]):
+        thumb = primary.get_thumbnail(idx)
+        if _covers(thumb.size, box):
+            return thumb.to_pillow()
+    return None
+
+
+def load_preview(path, box):
+    """
+    Returns a PIL image no larger than box for path, using the cheapest source available:
+    RAW embedded previews, HEIF thumbnails, JPEG draft (DCT-scaled) decoding or EXIF
+    thumbnails, and only falling back to a full decode when none of those fit.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    img = None
+    if ext in RAW_EXTS:
+        img = _raw_thumbnail(path, box)
+    elif ext in HEIF_EXTS:
+        img = _heif_thumbnail(path, box)
+
+    if img is None:
+        img = Image.open(path)
+        if img.format == 'JPEG':
+            # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale straight away.
+            img.draft('RGB', box)
+            img = ImageOps.exif_transpose(img)
+        else:
+            thumb = _exif_thumbnail(img, box)
+            img = thumb if thumb is not None else ImageOps.exif_transpose(img)
+
+    img.thumbnail(box, Image.Resampling.LANCZOS)
+    if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+    return img
+
+
+class ThumbnailCache:
+    """
+    LRU cache of preview images keyed by path, size, mtime and box, bounded by
+    decoded bytes in memory and (optionally) by file bytes on disk.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def key_for(path, box):
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_size, st.st_mtime_ns, tuple(box))
+
+    def _disk_path(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, name + '.png')
+
+    def _load_disk_index(self):
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and entry.name.endswith('.png'):
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.path, st.st_size))
+        for _, path, size in sorted(entries):
+            self._disk[path] = size
+            self._disk_bytes += size
+
+    def get(self, key):
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                return img
+        if not self.disk_dir:
+            return None
+        disk_path = self._disk_path(key)
+        try:
+            with Image.open(disk_path) as f:
+                img = f.copy()
+            os.utime(disk_path)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            if disk_path in self._disk:
+                self._disk.move_to_end(disk_path)
+        self._remember(key, img)
+        return img
+
+    def put(self, key, img):
+        self._remember(key, img)
+        if self.disk_dir:
+            disk_path = self._disk_path(key)
+            try:
+                img.save(disk_path, 'PNG', compress_level=1)
+                size = os.path.getsize(disk_path)
+            except OSError as e:
+                logging.warning(f"Could not write preview cache entry {disk_path}: {e}")
+                return
+            with self._lock:
+                self._disk_bytes += size - self._disk.pop(disk_path, 0)
+                self._disk[disk_path] = size
+                while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                    old_path, old_size = self._disk.popitem(last=False)
+                    self._disk_bytes -= old_size
+                    try:
+                        os.remove(old_path)
+                    except OSError:
+                        pass
+
+    def _remember(self, key, img):
+        size = img.width * img.height * len(img.getbands())
+        with self._lock:
+            if key in self._memory:
+                old = self._memory.pop(key)
+                self._memory_bytes -= old.width * old.height * len(old.getbands())
+            self._memory[key] = img
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                self._memory_bytes -= old.width * old.height * len(old.getbands())
+
+
+class PreviewWorker:
+    """
+    One background thread that renders previews. A new request supersedes any
+    that haven't started yet, results for superseded requests are cached but not
+    delivered, and once idle the worker prefetches the neighbouring files.
+
+    on_ready(path, image, error) is called from the worker thread.
+    """
+
+    def __init__(self, on_ready, cache=None, loader=load_preview):
+        self.on_ready = on_ready
+        self.cache = cache or ThumbnailCache()
+        self.loader = loader
+        self._cond = threading.Condition()
+        self._current = None
+        self._generation = 0
+        self._prefetch = deque()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="preview-worker", daemon=True)
+        self._thread.start()
+
+    def request(self, path, box, neighbours=()):
+        """Asks for a preview of path, dropping whatever was requested before."""
+        with self._cond:
+            self._generation += 1
+            self._current = (self._generation, path, tuple(box))
+            self._prefetch = deque((p, tuple(box)) for p in neighbours)
+            self._cond.notify()
+
+    def cancel(self):
+        """Drops pending work (e.g. when the preview is cleared)."""
+        with self._cond:
+            self._generation += 1
+            self._current = None
+            self._prefetch.clear()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _render(self, path, box):
+        key = ThumbnailCache.key_for(path, box)
+        img = self.cache.get(key)
+        if img is None:
+            img = self.loader(path, box)
+            self.cache.put(key, img)
+        return img
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and self._current is None and not self._prefetch:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                if self._current is not None:
+                    generation, path, box = self._current
+                    self._current = None
+                    prefetch = False
+                else:
+                    path, box = self._prefetch.popleft()
+                    generation = self._generation
+                    prefetch = True
+
+            try:
+                img, error = self._render(path, box), None
+            except Exception as e:
+                img, error = None, e
+                if not prefetch:
+                    logging.error(f"Error creating preview for {path}: {e}")
+
+            with self._cond:
+                stale = generation != self._generation
+            if not prefetch and not stale:
+                self.on_ready(path, img, error)
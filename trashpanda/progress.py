@@ -0,0 +1,136 @@
+"""
+One channel between a batch's workers and whoever shows its progress.
+
+Workers report into it as often as they like (every finished file, every ffmpeg
+progress block) and the UI reads snapshot() on a timer of its own, so a batch
+of tiny files costs the main loop one redraw per tick instead of a couple of
+callbacks per file. Throughput and the ETA come from a moving window over the
+last few seconds of progress.
+
+Control goes the other way through the same object: pause(), resume() and
+cancel(). Workers call wait_if_paused() before starting each file, and
+jobs.run_jobs suspends (POSIX) or kills the ffmpeg processes already running.
+"""
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+# How often a UI should call snapshot().
+REFRESH_MS = 100
+# Seconds of recent progress the files/s rate and ETA are averaged over.
+RATE_WINDOW = 10.0
+
+
+def format_eta(seconds):
+    """1:05 or 2:03:45."""
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+
+@dataclass
+class ProgressSnapshot:
+    # Files finished, and the same plus the finished fraction of each file in flight.
+    done: int
+    units: float
+    total: int
+    label: str = ""
+    files_per_s: float = None
+    eta: float = None
+    paused: bool = False
+    cancelled: bool = False
+
+    def text(self):
+        if self.cancelled:
+            return f"Cancelling after {self.done}/{self.total}..."
+        if self.paused:
+            return f"Paused at {self.done}/{self.total}"
+        line = f"{self.done}/{self.total}: {self.label}" if self.label else f"{self.done}/{self.total}"
+        if self.files_per_s:
+            line += f" - {self.files_per_s:.1f} files/s"
+            if self.eta is not None:
+                line += f", about {format_eta(self.eta)} left"
+        return line
+
+
+class ProgressChannel:
+    """Progress from worker threads to a UI, and pause/resume/cancel back. Thread-safe."""
+
+    def __init__(self, total=0, window=RATE_WINDOW):
+        self.total = total
+        self.window = window
+        self._done = 0
+        # Fraction finished of each file still in flight, e.g. from ffmpeg's progress.
+        self._partial = {}
+        self._label = ""
+        self._samples = deque()
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    # --- Worker side ---
+    def set_total(self, total):
+        with self._lock:
+            self.total = total
+
+    def item_progress(self, key, fraction):
+        """Notes how far along a file in flight is; fraction None means unknown."""
+        with self._lock:
+            self._partial[key] = fraction or 0.0
+            self._label = os.path.basename(key) + (f" {fraction:.0%}" if fraction is not None else "")
+
+    def item_done(self, key):
+        with self._lock:
+            self._done += 1
+            self._partial.pop(key, None)
+            self._label = os.path.basename(key)
+
+    def wait_if_paused(self):
+        """Blocks while the batch is paused. Returns False once it has been cancelled."""
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+    # --- UI side ---
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        with self._lock:
+            # Time spent paused shouldn't drag the rate down.
+            self._samples.clear()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wakes anything waiting in wait_if_paused so it can see the cancel.
+        self._running.set()
+
+    def snapshot(self):
+        """The current progress, with files/s and the ETA averaged over the last `window` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            units = self._done + sum(self._partial.values())
+            if not self.paused:
+                self._samples.append((now, units))
+            while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+            rate = eta = None
+            if len(self._samples) >= 2:
+                (start, start_units), (end, end_units) = self._samples[0], self._samples[-1]
+                if end > start:
+                    rate = (end_units - start_units) / (end - start)
+                    if rate > 0:
+                        eta = max(0.0, self.total - units) / rate
+            return ProgressSnapshot(self._done, units, self.total, self._label, rate, eta, self.paused, self.cancelled)
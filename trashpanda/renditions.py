@@ -0,0 +1,76 @@
+"""
+Rendition specs: the set of outputs made from each source image.
+
+A batch can ask for several sizes and formats at once, e.g. a full-size JPEG, a
+2048 px web copy and a 256 px thumbnail. Each source is decoded once and its
+renditions are written largest first, each downscaled from the one before.
+"""
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """One output per source image."""
+    format: str = "JPEG"
+    # Longest edge in pixels (images are never enlarged). When unset, scale applies instead.
+    max_size: int = None
+    scale: float = 1.0
+    # Encoder quality; None means the format's default.
+    quality: int = None
+    # Added to the source's file name, before the extension.
+    suffix: str = "_processed"
+
+    @property
+    def full_size(self):
+        return not self.max_size and self.scale == 1.0
+
+    def target_size(self, size):
+        width, height = size
+        if self.max_size:
+            factor = self.max_size / max(width, height)
+            if factor >= 1.0:
+                return size
+            return max(1, round(width * factor)), max(1, round(height * factor))
+        if self.scale == 1.0:
+            return size
+        return max(1, int(width * self.scale)), max(1, int(height * self.scale))
+
+
+def parse_rendition(text):
+    """
+    Parses 'SIZE:FORMAT[:QUALITY]', where SIZE is 'full', a percentage ('50%') or
+    the longest edge in pixels ('2048'), e.g. 'full:jpeg:92' or '256:webp:80'.
+    """
+    parts = [part.strip() for part in text.split(":")]
+    if len(parts) not in (2, 3) or not parts[1]:
+        raise ValueError(f"expected SIZE:FORMAT[:QUALITY], got {text!r}")
+    size, fmt = parts[0].lower(), parts[1].upper()
+    if fmt == "JPG":
+        fmt = "JPEG"
+    quality = None
+    if len(parts) == 3 and parts[2]:
+        quality = int(parts[2])
+        if not 0 <= quality <= 100:
+            raise ValueError(f"quality must be between 0 and 100, got {quality}")
+
+    if size == "full":
+        return Rendition(fmt, quality=quality, suffix="_full")
+    if size.endswith("%"):
+        percent = float(size[:-1])
+        if not 0 < percent <= 100:
+            raise ValueError(f"percentage must be between 0 and 100, got {size}")
+        return Rendition(fmt, scale=percent / 100, quality=quality, suffix=f"_{size[:-1]}pct")
+    pixels = int(size)
+    if pixels <= 0:
+        raise ValueError(f"size must be positive, got {pixels}")
+    return Rendition(fmt, max_size=pixels, quality=quality, suffix=f"_{pixels}")
+
+
+def check_renditions(renditions):
+    """Raises ValueError if two renditions would write the same file."""
+    seen = set()
+    for rendition in renditions:
+        key = (rendition.suffix, rendition.format)
+        if key in seen:
+            raise ValueError(f"two renditions would both write *{rendition.suffix}.{rendition.format.lower()}")
+        seen.add(key)
@@ -0,0 +1,481 @@
+"""
+Long-running service mode: a warm worker pool behind a local HTTP endpoint.
+
+Every `python -m trashpanda` run pays for starting the interpreter, importing
+Pillow and the codec backends and finding ffprobe before it touches a file.
+A ConverterService pays that once: its worker processes import everything when
+they start, and it answers requests over localhost TCP or a Unix socket until
+stopped, so a small request costs milliseconds rather than seconds.
+
+    POST /convert    convert images
+    POST /strip      remove metadata losslessly (JPEG, PNG, WebP)
+    POST /metadata   read metadata
+    GET  /health     pool size, loaded backends and ffprobe
+
+A JSON body ({"paths": [...], "output": ..., options...}) works on files the
+service can read and streams back one JSON line per file as each one finishes,
+then a {"summary": ...} line. Any other body is the file itself, and the
+response is the converted or stripped file, or its metadata record as JSON;
+options then go in the query string, e.g. /convert?format=WEBP&name=IMG_1.heic.
+
+Requests can read and write whatever the service's user can, so it listens on
+loopback (other addresses need allow_remote) or on a Unix socket only that user
+can open. Over TCP every request must also carry the run's token
+("Authorization: Bearer <token>") and name a local Host. That keeps out web
+pages, which can reach localhost and use DNS rebinding to get around the
+same-origin policy.
+"""
+import hmac
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .backends import BACKEND_MODULES, backend, installed, load_times
+from .convert import ORIGINAL_FORMAT, ConvertOptions, _convert_task, convert_image, default_worker_count
+from .encoders import DEFAULT_PROFILE
+from .metadata import read_metadata
+from .renditions import check_renditions, parse_rendition
+from .strip import sniff_container, strip_bytes
+
+DEFAULT_PORT = 8765
+# Largest request body accepted, in megabytes.
+MAX_BODY_MB = 512
+
+# Host header values accepted over TCP, besides the address the server is bound to.
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "AVIF": "image/avif"}
+_TRUE = ("1", "true", "yes", "on")
+
+
+def _warm_worker():
+    """Pool initializer: loads every installed codec backend before the first request needs it."""
+    for name in BACKEND_MODULES:
+        if installed(name):
+            backend(name)
+
+
+def _worker_ready():
+    return os.getpid(), sorted(load_times)
+
+
+def _upload_name(data, name):
+    """A file name for uploaded bytes. The extension decides how they're read, so sniff one if none was given."""
+    name = os.path.basename(name or "")
+    if os.path.splitext(name)[1]:
+        return name
+    container = sniff_container(data[:12])
+    if container is None:
+        raise ValueError("Can't tell what kind of file this is: pass its file name as ?name=")
+    return (name or "upload") + "." + container.lower()
+
+
+def _convert_bytes(data, name, options):
+    """Pool entry point: converts an uploaded image. Returns (bytes, format)."""
+    with tempfile.TemporaryDirectory(prefix="trashpanda-") as tmp:
+        path = os.path.join(tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        output = convert_image(path, tmp, options)[0]
+        with open(output, "rb") as f:
+            converted = f.read()
+    fmt = options.rendition_list()[0].format
+    return converted, sniff_container(converted[:12]) if fmt == ORIGINAL_FORMAT else fmt
+
+
+def _metadata_bytes(data, name, ffprobe_path):
+    """Pool entry point: reads the metadata of an uploaded file, as if it were called name."""
+    with tempfile.TemporaryDirectory(prefix="trashpanda-") as tmp:
+        path = os.path.join(tmp, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        record = read_metadata(path, ffprobe_path)
+    record.update(path=name, file=name)
+    return record
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _flag(value, default=False):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in _TRUE
+
+
+def parse_options(params, strip_only=False):
+    """ConvertOptions from a request's JSON body or query parameters. Raises ValueError on bad ones."""
+    if strip_only:
+        return ConvertOptions(target_format=ORIGINAL_FORMAT, remove_metadata=True, keep_icc=_flag(params.get("keep_icc")),
+                              memory_limit_mb=0)
+    renditions = params.get("renditions") or ()
+    if isinstance(renditions, str):
+        renditions = renditions.split(",")
+    renditions = tuple(parse_rendition(text) for text in renditions)
+    check_renditions(renditions)
+    target_format = str(params.get("format") or "JPEG").upper()
+    if target_format == "JPG":
+        target_format = "JPEG"
+    if target_format not in CONTENT_TYPES and target_format != ORIGINAL_FORMAT:
+        raise ValueError(f"unknown format {target_format}")
+    return ConvertOptions(
+        target_format=target_format,
+        remove_metadata=_flag(params.get("strip"), True),
+        resize=_flag(params.get("resize")),
+        keep_icc=_flag(params.get("keep_icc")),
+        renditions=renditions,
+        profile=params.get("profile") or DEFAULT_PROFILE,
+    )
+
+
+def _convert_record(result):
+    return {"path": result.path, "outputs": result.outputs, "error": result.error, "source_bytes": result.source_bytes,
+            "output_bytes": result.output_bytes, "seconds": round(sum(span.seconds for span in result.spans), 4)}
+
+
+class RequestError(ValueError):
+    """A bad request; status is the HTTP status to answer it with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ConverterService:
+    """A pool of worker processes with Pillow and the codec backends already imported. Thread-safe."""
+
+    def __init__(self, workers=None, ffprobe_path=None):
+        self.workers = max(1, workers or default_worker_count())
+        self.ffprobe_path = ffprobe_path
+        self.started = time.time()
+        self.tasks = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _new_pool(self):
+        # 'spawn', as in convert_images: the same behaviour on every platform.
+        ctx = multiprocessing.get_context("spawn")
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_warm_worker)
+
+    def start(self):
+        """Starts every worker and waits until each has loaded its backends. Returns the backends loaded."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+            pool = self._pool
+        # Submitted together, so each one starts a worker of its own.
+        ready = [pool.submit(_worker_ready) for _ in range(self.workers)]
+        wait(ready)
+        return sorted({name for future in ready for name in future.result()[1]})
+
+    def submit(self, fn, *args):
+        with self._lock:
+            self.tasks += 1
+            try:
+                return self._pool.submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died outright (e.g. a decoder crash): start a fresh pool rather than failing every request.
+                logging.warning("A worker process died; restarting the pool.")
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+                return self._pool.submit(fn, *args)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def health(self):
+        return {"status": "ok", "workers": self.workers, "tasks": self.tasks,
+                "uptime": round(time.time() - self.started, 1), "ffprobe": self.ffprobe_path,
+                "backends": {name: installed(name) for name in BACKEND_MODULES}}
+
+    # --- Requests naming files the service can read ---
+    def iter_paths(self, operation, params):
+        """Yields one JSON-ready record per file as each finishes, then a summary."""
+        paths = params.get("paths")
+        if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+            raise RequestError('expected {"paths": [...]}')
+        if not all(os.path.isabs(path) for path in paths):
+            # The service's working folder is nobody's business.
+            raise RequestError("paths must be absolute")
+        output = params.get("output")
+        if output is not None and not os.path.isabs(output):
+            raise RequestError("output must be an absolute path")
+        if operation == "metadata":
+            futures = {self.submit(read_metadata, path, self.ffprobe_path): path for path in paths}
+        else:
+            try:
+                options = parse_options(params, strip_only=operation == "strip")
+            except ValueError as e:
+                raise RequestError(str(e))
+            if output:
+                os.makedirs(output, exist_ok=True)
+            futures = {self.submit(_convert_task, path, output, options): path for path in paths}
+        return self._iter_results(operation, futures)
+
+    def _iter_results(self, operation, futures):
+        start = time.perf_counter()
+        failed = 0
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    record = {"path": futures[future], "error": f"worker failed: {e}"}
+                else:
+                    record = result if operation == "metadata" else _convert_record(result)
+                if record.get("error"):
+                    failed += 1
+                yield record
+        finally:
+            # The client went away: don't start what's still queued for it.
+            for future in futures:
+                future.cancel()
+        yield {"summary": {"files": len(futures), "failed": failed, "seconds": round(time.perf_counter() - start, 4)}}
+
+    # --- Requests carrying the file itself ---
+    def run_bytes(self, operation, data, params):
+        """Returns (body, content type) for an uploaded file."""
+        try:
+            if operation == "metadata":
+                record = self.submit(_metadata_bytes, data, _upload_name(data, params.get("name")), self.ffprobe_path).result()
+                return json.dumps(record, default=str).encode(), "application/json"
+            if operation == "strip":
+                stripped = self.submit(strip_bytes, data, _flag(params.get("keep_icc"))).result()
+                return stripped, CONTENT_TYPES[sniff_container(stripped[:12])]
+            options = parse_options(params)
+            if len(options.rendition_list()) > 1:
+                raise RequestError("an upload gets one output: send a JSON request with paths for several renditions")
+            converted, fmt = self.submit(_convert_bytes, data, _upload_name(data, params.get("name")), options).result()
+            return converted, CONTENT_TYPES.get(fmt, "application/octet-stream")
+        except RequestError:
+            raise
+        except Exception as e:
+            # Bad options, or a file that couldn't be read or converted.
+            raise RequestError(str(e), status=422)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "trashpanda"
+    OPERATIONS = ("convert", "strip", "metadata")
+
+    def address_string(self):
+        # Unix socket clients have no address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj, default=str).encode() + b"\n")
+
+    def _send_stream(self, records):
+        """Sends records as JSON lines with chunked encoding, each as soon as it's ready."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for record in records:
+            line = json.dumps(record, default=str).encode() + b"\n"
+            self.wfile.write(b"%X\r\n%s\r\n" % (len(line), line))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _authorized(self):
+        """Checks the Host header and token of a TCP request; Unix socket clients already passed the file permissions."""
+        server = self.server
+        if server.token is None:
+            return True
+        try:
+            # Without the port, or the brackets around an IPv6 address.
+            host = urlsplit("//" + self.headers.get("Host", "")).hostname or ""
+        except ValueError:
+            host = ""
+        if server.check_host and host not in server.allowed_hosts:
+            self.close_connection = True
+            self._send_json(403, {"error": f"unexpected Host {host!r}"})
+            return False
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), server.token.encode()):
+            self.close_connection = True
+            self._send_json(401, {"error": "missing or wrong token (Authorization: Bearer <token>)"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if urlsplit(self.path).path.rstrip("/") == "/health":
+            self._send_json(200, self.server.service.health())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        url = urlsplit(self.path)
+        operation = url.path.strip("/")
+        if operation not in self.OPERATIONS:
+            self._send_json(404, {"error": f"unknown operation {operation!r}"})
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._send_json(411, {"error": "Content-Length required"})
+            return
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self._send_json(400, {"error": "invalid Content-Length"})
+            return
+        if length > MAX_BODY_MB * 1024 * 1024:
+            self.close_connection = True
+            self._send_json(413, {"error": f"larger than {MAX_BODY_MB} MB"})
+            return
+        body = self.rfile.read(length)
+        service = self.server.service
+        try:
+            if self.headers.get_content_type() == "application/json":
+                try:
+                    params = json.loads(body)
+                except ValueError as e:
+                    raise RequestError(f"invalid JSON: {e}")
+                if not isinstance(params, dict):
+                    raise RequestError("expected a JSON object")
+                records = service.iter_paths(operation, params)
+            else:
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                content, content_type = service.run_bytes(operation, body, params)
+                self._send(200, content, content_type)
+                return
+        except RequestError as e:
+            self._send_json(e.status, {"error": str(e)})
+            return
+        try:
+            self._send_stream(records)
+        except (BrokenPipeError, ConnectionResetError):
+            records.close()
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+        def server_bind(self):
+            # Only this user may connect: requests can read and write anything they can.
+            old_umask = os.umask(0o177)
+            try:
+                super().server_bind()
+            finally:
+                os.umask(old_umask)
+else:
+    _UnixServer = None
+
+
+def _clear_stale_socket(socket_path):
+    """Removes a socket file left behind by a service that didn't shut down, but not a live one."""
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socket_path)
+    else:
+        raise OSError(f"a service is already listening on {socket_path}")
+    finally:
+        probe.close()
+
+
+def is_loopback(host):
+    """True if every address host resolves to is a loopback one."""
+    try:
+        infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except OSError:
+        return False
+    return bool(infos) and all(ipaddress.ip_address(info[4][0].split("%")[0]).is_loopback for info in infos)
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, token=None, allow_remote=False):
+    """
+    An HTTP server for service on host:port, or on the Unix socket socket_path if given.
+    Over TCP, requests need token (one is generated if not given; see server.token).
+    Raises OSError for a host that isn't loopback unless allow_remote is set.
+    """
+    if socket_path:
+        if _UnixServer is None:
+            raise OSError("Unix sockets aren't available on this platform; use a port instead.")
+        _clear_stale_socket(socket_path)
+        server = _UnixServer(socket_path, _Handler)
+        server.token = None
+    else:
+        if not is_loopback(host):
+            if not allow_remote:
+                raise OSError(f"{host} is not a loopback address; requests can read and write any file this user can, "
+                              f"so listening on the network needs allow_remote (--allow-remote)")
+            logging.warning(f"Listening on {host}: anyone on the network with the token can read and write "
+                            f"any file this user can.")
+        server = _TCPServer((host, port), _Handler)
+        server.token = token or secrets.token_urlsafe(24)
+        # A wildcard address has no name of its own to check for; only the token guards it then.
+        server.check_host = not ipaddress.ip_address(server.server_address[0].split("%")[0]).is_unspecified
+        server.allowed_hosts = set(LOCAL_HOSTS) | {host.lower(), server.server_address[0]}
+    server.service = service
+    return server
+
+
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, on_ready=None, token=None, allow_remote=False):
+    """
+    Warms service up and answers requests until interrupted (Ctrl+C or SIGTERM).
+    on_ready(address, token) is called once it is listening; token is None on a Unix socket.
+    """
+    server = make_server(service, host, port, socket_path, token, allow_remote)
+    try:
+        start = time.perf_counter()
+        loaded = service.start()
+        address = socket_path or "http://%s:%d" % server.server_address[:2]
+        logging.info(f"{service.workers} workers ready in {time.perf_counter() - start:.1f} s "
+                     f"(backends: {', '.join(loaded) or 'none'})")
+        if on_ready:
+            on_ready(address, server.token)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, _interrupt)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,203 @@
+"""
+Lossless metadata stripping for JPEG, PNG and WebP.
+
+These rewrite the container only: metadata segments/chunks are dropped and the
+compressed image data is copied byte-for-byte, so nothing is decoded or
+re-encoded and the pixels are bit-identical to the source.
+"""
+import struct
+
+LOSSLESS_STRIP_EXTS = ('.jpg', '.jpeg', '.png', '.webp')
+
+JPEG_SOI = b'\xff\xd8'
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# APPn payload prefixes that carry metadata. APP0 (JFIF) and APP14 (Adobe colour
+# transform) are left alone because decoders need them to get the colours right.
+_JPEG_METADATA_PREFIXES = {
+    0xE1: (b'Exif\x00', b'http://ns.adobe.com/xap/1.0/\x00', b'http://ns.adobe.com/xmp/extension/\x00'),
+    0xE2: (b'MPF\x00',),
+    0xED: (b'Photoshop 3.0\x00',),
+}
+_JPEG_ICC_PREFIX = b'ICC_PROFILE\x00'
+_JPEG_COM = 0xFE
+_JPEG_SOS = 0xDA
+_JPEG_EOI = 0xD9
+
+# Ancillary PNG chunks that hold metadata rather than anything needed to render.
+_PNG_METADATA_CHUNKS = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+_PNG_ICC_CHUNK = b'iCCP'
+
+_WEBP_METADATA_CHUNKS = {b'EXIF', b'XMP '}
+_WEBP_ICC_CHUNK = b'ICCP'
+# VP8X feature flags that advertise the chunks above.
+_VP8X_ICC_FLAG = 0x20
+_VP8X_EXIF_FLAG = 0x08
+_VP8X_XMP_FLAG = 0x04
+
+
+class UnsupportedContainer(ValueError):
+    """Raised when a file isn't in a container we know how to rewrite."""
+
+
+def sniff_container(data):
+    """Returns 'JPEG', 'PNG', 'WEBP' or None from the file's magic bytes."""
+    if data[:2] == JPEG_SOI:
+        return 'JPEG'
+    if data[:8] == PNG_SIGNATURE:
+        return 'PNG'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def _is_jpeg_metadata(marker, payload, keep_icc):
+    if marker == _JPEG_COM:
+        return True
+    if marker == 0xE2 and payload.startswith(_JPEG_ICC_PREFIX):
+        return not keep_icc
+    return any(payload.startswith(prefix) for prefix in _JPEG_METADATA_PREFIXES.get(marker, ()))
+
+
+def strip_jpeg(data, keep_icc=False):
+    """Returns a list of byte chunks forming data without its metadata segments."""
+    raw = bytes(data)
+    data = memoryview(raw)
+    if raw[:2] != JPEG_SOI:
+        raise UnsupportedContainer("Not a JPEG file.")
+    out = [JPEG_SOI]
+    pos = 2
+    size = len(data)
+    while pos < size:
+        if data[pos] != 0xFF:
+            raise ValueError(f"Corrupt JPEG: expected a marker at offset {pos}.")
+        if pos + 1 >= size:
+            raise ValueError("Corrupt JPEG: missing EOI marker.")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker.
+            pos += 1
+            continue
+        if marker == _JPEG_EOI:
+            # Anything after EOI (MPF secondary images, vendor trailers) is dropped too.
+            out.append(bytes(data[pos:pos + 2]))
+            return out
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            out.append(bytes(data[pos:pos + 2]))
+            pos += 2
+            continue
+        if pos + 4 > size:
+            raise ValueError("Corrupt JPEG: segment runs past end of file.")
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        end = pos + 2 + length
+        if end > size:
+            raise ValueError("Corrupt JPEG: segment runs past end of file.")
+        payload = data[pos + 4:end]
+        if 0xE0 <= marker <= 0xEF or marker == _JPEG_COM:
+            if not _is_jpeg_metadata(marker, bytes(payload[:40]), keep_icc):
+                out.append(data[pos:end])
+            pos = end
+            continue
+        out.append(data[pos:end])
+        pos = end
+        if marker == _JPEG_SOS:
+            pos = _copy_entropy_data(raw, data, pos, out)
+    raise ValueError("Corrupt JPEG: missing EOI marker.")
+
+
+def _copy_entropy_data(raw, data, pos, out):
+    """Copies scan data up to the next real marker and returns its offset."""
+    start = pos
+    size = len(raw)
+    while True:
+        pos = raw.find(b'\xff', pos, size)
+        if pos < 0 or pos + 1 >= size:
+            raise ValueError("Corrupt JPEG: scan data runs past end of file.")
+        nxt = raw[pos + 1]
+        # 0xFF00 is a stuffed data byte and RSTn markers live inside the scan.
+        if nxt == 0x00 or 0xD0 <= nxt <= 0xD7:
+            pos += 2
+            continue
+        if nxt == 0xFF:
+            pos += 1
+            continue
+        out.append(data[start:pos])
+        return pos
+
+
+def strip_png(data, keep_icc=False):
+    """Returns a list of byte chunks forming data without its metadata chunks."""
+    data = memoryview(data)
+    if bytes(data[:8]) != PNG_SIGNATURE:
+        raise UnsupportedContainer("Not a PNG file.")
+    out = [PNG_SIGNATURE]
+    pos = 8
+    size = len(data)
+    while pos + 8 <= size:
+        length = struct.unpack('>I', data[pos:pos + 4])[0]
+        chunk_type = bytes(data[pos + 4:pos + 8])
+        end = pos + 12 + length
+        if end > size:
+            raise ValueError("Corrupt PNG: chunk runs past end of file.")
+        drop = chunk_type in _PNG_METADATA_CHUNKS or (chunk_type == _PNG_ICC_CHUNK and not keep_icc)
+        if not drop:
+            out.append(data[pos:end])
+        pos = end
+        if chunk_type == b'IEND':
+            return out
+    raise ValueError("Corrupt PNG: missing IEND chunk.")
+
+
+def strip_webp(data, keep_icc=False):
+    """Returns a list of byte chunks forming data without its EXIF/XMP (and ICC) chunks."""
+    data = memoryview(data)
+    if bytes(data[:4]) != b'RIFF' or bytes(data[8:12]) != b'WEBP':
+        raise UnsupportedContainer("Not a WebP file.")
+    riff_end = min(8 + struct.unpack('<I', data[4:8])[0], len(data))
+    drop_flags = _VP8X_EXIF_FLAG | _VP8X_XMP_FLAG | (0 if keep_icc else _VP8X_ICC_FLAG)
+    chunks = []
+    pos = 12
+    while pos + 8 <= riff_end:
+        chunk_type = bytes(data[pos:pos + 4])
+        length = struct.unpack('<I', data[pos + 4:pos + 8])[0]
+        end = pos + 8 + length + (length & 1)
+        if pos + 8 + length > riff_end:
+            raise ValueError("Corrupt WebP: chunk runs past end of file.")
+        end = min(end, riff_end)
+        if chunk_type in _WEBP_METADATA_CHUNKS or (chunk_type == _WEBP_ICC_CHUNK and not keep_icc):
+            pos = end
+            continue
+        if chunk_type == b'VP8X':
+            vp8x = bytearray(data[pos:end])
+            vp8x[8] &= ~drop_flags & 0xFF
+            chunks.append(bytes(vp8x))
+        else:
+            chunks.append(data[pos:end])
+        pos = end
+    body_size = 4 + sum(len(c) for c in chunks)
+    return [b'RIFF', struct.pack('<I', body_size), b'WEBP'] + chunks
+
+
+_STRIPPERS = {'JPEG': strip_jpeg, 'PNG': strip_png, 'WEBP': strip_webp}
+
+
+def strip_bytes(data, keep_icc=False):
+    """Returns data with its metadata removed, as a single bytes object."""
+    container = sniff_container(data)
+    if container is None:
+        raise UnsupportedContainer("Lossless metadata stripping supports JPEG, PNG and WebP only.")
+    return b''.join(_STRIPPERS[container](data, keep_icc=keep_icc))
+
+
+def strip_file(src, dst, keep_icc=False):
+    """Writes a metadata-free copy of src to dst. Returns the container name."""
+    with open(src, 'rb') as f:
+        data = f.read()
+    container = sniff_container(data)
+    if container is None:
+        raise UnsupportedContainer("Lossless metadata stripping supports JPEG, PNG and WebP only.")
+    chunks = _STRIPPERS[container](data, keep_icc=keep_icc)
+    with open(dst, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return container
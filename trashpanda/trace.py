@@ -0,0 +1,255 @@
+"""
+Per-file, per-stage instrumentation.
+
+The work done on each file is recorded as spans: a stage name (decode, resize,
+encode, write, ffmpeg...), when it started and how long it took, the bytes it
+read and wrote and the process's resident memory when it ended. Spans are
+small dataclasses, so pool workers hand them back with their results.
+
+A BatchTrace gathers the spans of a whole batch, summarises where the time went
+(files/s, MB/s, time per stage, the slowest files) and exports Chrome
+trace-event JSON, which chrome://tracing and https://ui.perfetto.dev open.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from .paths import atomic_output
+
+# --- Optional Dependency Imports ---
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SLOWEST_FILES = 5
+# How many traces save_recent_trace keeps in its folder.
+RECENT_TRACES = 20
+# Time-to-interactive the startup report holds the GUI to, in milliseconds.
+STARTUP_TARGET_MS = 1500
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb():
+    """This process's resident memory right now, or None where it can't be read cheaply."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_mb():
+    """This process's peak resident memory, or None if the platform doesn't report it."""
+    try:
+        # Linux: this process's own high-water mark. ru_maxrss would also count the
+        # parent's memory from before the exec that started a spawned worker.
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@dataclass
+class Span:
+    stage: str
+    # Wall-clock start (time.time()), so spans from different processes line up.
+    start: float
+    seconds: float = 0.0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    rss_mb: float = None
+    pid: int = 0
+
+
+class FileTrace:
+    """The spans for one file, recorded in whichever process does the work."""
+
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def stage(self, name, bytes_read=0):
+        """Times the block as one span; set bytes_written on the yielded span inside it."""
+        span = Span(name, time.time(), bytes_read=bytes_read, pid=os.getpid())
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - start
+            span.rss_mb = current_rss_mb()
+            self.spans.append(span)
+
+    def seconds(self, *stages):
+        return sum(span.seconds for span in self.spans if span.stage in stages)
+
+
+def job_span(stage, path, output, elapsed):
+    """A span for work timed elsewhere (an ffmpeg run, say) that just finished."""
+    span = Span(stage, time.time() - elapsed, elapsed, pid=os.getpid())
+    for attr, file_path in (("bytes_read", path), ("bytes_written", output)):
+        try:
+            setattr(span, attr, os.path.getsize(file_path) if file_path else 0)
+        except OSError:
+            pass
+    return span
+
+
+@dataclass
+class TracedFile:
+    path: str
+    kind: str
+    spans: list
+    error: str = None
+
+    @property
+    def seconds(self):
+        return sum(span.seconds for span in self.spans)
+
+
+class BatchTrace:
+    """Collects the spans of every file in a batch. Safe to add to from several threads."""
+
+    def __init__(self, name="batch"):
+        self.name = name
+        self.files = []
+        self.started = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, path, kind, spans, error=None):
+        with self._lock:
+            self.files.append(TracedFile(path, kind, list(spans), error))
+
+    def finish(self):
+        self.finished = time.time()
+
+    def stage_totals(self):
+        """{stage: (seconds, bytes_read, bytes_written, spans)}, busiest stage first."""
+        totals = {}
+        for traced in self.files:
+            for span in traced.spans:
+                seconds, read, written, count = totals.get(span.stage, (0.0, 0, 0, 0))
+                totals[span.stage] = (seconds + span.seconds, read + span.bytes_read, written + span.bytes_written, count + 1)
+        return dict(sorted(totals.items(), key=lambda item: item[1][0], reverse=True))
+
+    def slowest(self, count=SLOWEST_FILES):
+        return sorted(self.files, key=lambda traced: traced.seconds, reverse=True)[:count]
+
+    def summary(self, slowest=SLOWEST_FILES):
+        """A few lines on throughput, time per stage and the slowest files."""
+        wall = max(1e-9, (self.finished or time.time()) - self.started)
+        totals = self.stage_totals()
+        # A file's first span reads it from disk; counting every span would count it once per stage.
+        read = sum(traced.spans[0].bytes_read for traced in self.files if traced.spans)
+        written = sum(span.bytes_written for traced in self.files for span in traced.spans)
+        peaks = [span.rss_mb for traced in self.files for span in traced.spans if span.rss_mb is not None]
+        lines = [f"{self.name}: {len(self.files)} files in {wall:.1f} s, {len(self.files) / wall:.1f} files/s, "
+                 f"{read / 1e6 / wall:.1f} MB/s read, {written / 1e6 / wall:.1f} MB/s written"
+                 + (f", up to {max(peaks):.0f} MB per process" if peaks else "")]
+        busy = sum(seconds for seconds, _, _, _ in totals.values()) or 1e-9
+        for stage, (seconds, _, _, count) in totals.items():
+            lines.append(f"  {stage:<10} {seconds:8.2f} s  {seconds / busy:4.0%}  ({count} runs, {seconds / count * 1000:.0f} ms each)")
+        if slowest and self.files:
+            lines.append("Slowest files:")
+            for traced in self.slowest(slowest):
+                top = max(traced.spans, key=lambda span: span.seconds, default=None)
+                detail = f" (mostly {top.stage}, {top.seconds:.2f} s)" if top else ""
+                lines.append(f"  {traced.seconds:7.2f} s  {traced.path}{detail}{' FAILED' if traced.error else ''}")
+        return "\n".join(lines)
+
+    def chrome_events(self):
+        """Chrome trace events: one row per process and concurrent file, one bar per stage."""
+        origin = min((span.start for traced in self.files for span in traced.spans), default=self.started)
+        events = []
+        lanes = {}
+        for traced in sorted(self.files, key=lambda t: min((s.start for s in t.spans), default=0)):
+            if not traced.spans:
+                continue
+            start = min(span.start for span in traced.spans)
+            end = max(span.start + span.seconds for span in traced.spans)
+            pid = traced.spans[0].pid
+            # Files that overlap in one process (concurrent ffmpeg runs) get rows of their own.
+            pid_lanes = lanes.setdefault(pid, [])
+            lane = next((i for i, lane_end in enumerate(pid_lanes) if lane_end <= start), len(pid_lanes))
+            if lane == len(pid_lanes):
+                pid_lanes.append(end)
+            else:
+                pid_lanes[lane] = end
+            args = {"path": traced.path}
+            if traced.error:
+                args["error"] = traced.error
+            events.append({"name": os.path.basename(traced.path), "cat": traced.kind, "ph": "X", "pid": pid, "tid": lane,
+                           "ts": (start - origin) * 1e6, "dur": (end - start) * 1e6, "args": args})
+            for span in traced.spans:
+                events.append({"name": span.stage, "cat": traced.kind, "ph": "X", "pid": pid, "tid": lane,
+                               "ts": (span.start - origin) * 1e6, "dur": span.seconds * 1e6,
+                               "args": {"bytes_read": span.bytes_read, "bytes_written": span.bytes_written, "rss_mb": span.rss_mb}})
+        for pid in lanes:
+            events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"{self.name} (pid {pid})"}})
+        return events
+
+    def write_chrome_trace(self, path):
+        with atomic_output(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": self.chrome_events(), "displayTimeUnit": "ms"}, f)
+
+
+class StartupTimer:
+    """Named milestones since `started` (a time.perf_counter() reading), for a startup report."""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, time.perf_counter()))
+
+    def elapsed_ms(self):
+        return ((self.marks[-1][1] if self.marks else time.perf_counter()) - self.started) * 1000
+
+    def report(self, target_ms=STARTUP_TARGET_MS, lazy_loads=None):
+        """
+        One line per milestone with its own and cumulative time, then any lazy
+        imports (e.g. backends.load_times) and the total against target_ms.
+        """
+        lines = ["Startup:"]
+        previous = self.started
+        for name, at in self.marks:
+            lines.append(f"  {name:<12} {(at - previous) * 1000:7.0f} ms  (at {(at - self.started) * 1000:.0f} ms)")
+            previous = at
+        for name, seconds in sorted((lazy_loads or {}).items()):
+            lines.append(f"  loaded {name:<5} {seconds * 1000:7.0f} ms  (on first use)")
+        total = self.elapsed_ms()
+        verdict = "OVER TARGET" if total > target_ms else "ok"
+        lines.append(f"Interactive after {total:.0f} ms (target {target_ms:.0f} ms, {verdict})")
+        return "\n".join(lines)
+
+
+def save_recent_trace(trace, folder, keep=RECENT_TRACES):
+    """
+    Writes trace's Chrome trace into folder as <time>-<name>.json and deletes all
+    but the newest `keep` traces there. Returns the new file's path.
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(trace.started))
+    path = os.path.join(folder, f"{stamp}-{trace.name.lower()}.json")
+    trace.write_chrome_trace(path)
+    traces = sorted(name for name in os.listdir(folder) if name.endswith(".json"))
+    for name in traces[:-keep]:
+        try:
+            os.remove(os.path.join(folder, name))
+        except OSError:
+            pass
+    return path
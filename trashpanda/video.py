@@ -0,0 +1,266 @@
+import logging
+import os
+import subprocess
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace
+
+from .jobs import DEFAULT_FFMPEG_JOBS, DEFAULT_STALL_TIMEOUT, JobResult, ToolJob, run_jobs
+from .manifest import options_key
+from .mp4strip import MP4_STRIP_EXTS, strip_mp4
+from .paths import atomic_output, discard, partial_path_for
+from .strip import UnsupportedContainer
+from .trace import job_span
+
+SUPPORTED_VIDEO_EXTS = ('.mp4', '.mov', '.avi', '.mkv')
+
+
+def find_ffmpeg_bin(name):
+    # First, check local directory (if bundled with exe, e.g. PyInstaller's _MEIPASS or .)
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    base_dirs = [getattr(sys, '_MEIPASS', app_dir), os.getcwd()]
+    for base in base_dirs:
+        candidate = os.path.join(base, name)
+        if os.path.isfile(candidate):
+            return candidate
+        # Windows: allow .exe
+        if os.name == 'nt':
+            candidate_exe = candidate + '.exe'
+            if os.path.isfile(candidate_exe):
+                return candidate_exe
+    # Else, fallback to PATH
+    return shutil.which(name)
+
+
+def video_output_path_for(path, output_folder):
+    """Returns where the processed copy of a video is written. It keeps the source's container."""
+    out_dir = output_folder or os.path.dirname(path)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return os.path.join(out_dir, stem + "_processed" + ext)
+
+
+def remux_command(path, out_path, ffmpeg_path, remove_metadata=True, progress=False):
+    """Builds the ffmpeg command that copies streams (never re-encodes) into out_path."""
+    cmd = [ffmpeg_path, '-i', path, '-y']
+    if remove_metadata:
+        cmd.extend(['-map_metadata', '-1'])
+    if progress:
+        cmd.extend(['-progress', 'pipe:1', '-nostats'])
+    cmd.extend(['-c:v', 'copy', '-c:a', 'copy', out_path])
+    return cmd
+
+
+def can_strip_natively(path, remove_metadata=True):
+    """True if path is worth trying with mp4strip before falling back to ffmpeg."""
+    return remove_metadata and os.path.splitext(path)[1].lower() in MP4_STRIP_EXTS
+
+
+def _strip_natively(path, out_path):
+    """Writes out_path with mp4strip. Returns a JobResult, or None if the file needs ffmpeg."""
+    start = time.monotonic()
+    try:
+        with atomic_output(out_path) as tmp_path:
+            strip_mp4(path, tmp_path)
+    except UnsupportedContainer as e:
+        logging.info(f"Remuxing {os.path.basename(path)} with ffmpeg: {e}")
+        return None
+    except (OSError, ValueError) as e:
+        return JobResult(path, output=out_path, error=str(e), elapsed=time.monotonic() - start)
+    return JobResult(path, output=out_path, returncode=0, elapsed=time.monotonic() - start)
+
+
+def process_video(path, output_folder, ffmpeg_path, remove_metadata=True):
+    """Strips or remuxes a single video. Returns the output path."""
+    out_path = video_output_path_for(path, output_folder)
+    if can_strip_natively(path, remove_metadata):
+        result = _strip_natively(path, out_path)
+        if result is not None:
+            if result.error:
+                raise ValueError(result.error)
+            return out_path
+    if not ffmpeg_path:
+        raise ValueError("FFmpeg is not installed or not in PATH.")
+    with atomic_output(out_path) as tmp_path:
+        cmd = remux_command(path, tmp_path, ffmpeg_path, remove_metadata)
+        subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return out_path
+
+
+def _duplicate_result(path, source_output, out_path, dedup, duplicate_of):
+    """Gives path the output of a byte-identical video by linking or copying it."""
+    start = time.monotonic()
+    try:
+        dedup.materialize([source_output], [out_path])
+    except OSError as e:
+        return JobResult(path, output=out_path, error=f"could not reuse the output of {os.path.basename(duplicate_of)}: {e}",
+                         elapsed=time.monotonic() - start, duplicate_of=duplicate_of)
+    return JobResult(path, output=out_path, returncode=0, elapsed=time.monotonic() - start, duplicate_of=duplicate_of)
+
+
+def process_videos(paths, output_folder, ffmpeg_path, remove_metadata=True, max_concurrent=DEFAULT_FFMPEG_JOBS,
+                   timeout=None, stall_timeout=DEFAULT_STALL_TIMEOUT, on_progress=None, on_result=None,
+                   manifest=None, force=False, trace=None, progress=None, dedup=None):
+    """
+    Strips or remuxes several videos and returns a JobResult per path, in input
+    order (see jobs.run_jobs for callbacks). MP4/MOV files are stripped natively
+    first (mp4strip: only the moov box is rewritten), max_concurrent at a time;
+    everything else, and any MP4/MOV that can't be, is remuxed with up to
+    max_concurrent ffmpeg processes at once. An ffmpeg job is killed after
+    `timeout` seconds in total or `stall_timeout` seconds without progress.
+    Outputs are written under a temporary name and renamed into place once done.
+
+    With a BatchManifest, videos whose output is already up to date are skipped
+    (unless force is set) and reported first; new outputs are recorded as they land.
+    With a trace.BatchTrace, each processed video is added to it as one span
+    ("strip" or "ffmpeg").
+    With a progress.ProgressChannel, progress goes to it and the batch can be
+    paused (running ffmpeg processes are suspended) or cancelled through it;
+    cancelled videos come back with cancelled set and no output.
+    With a dedup.ContentIndex, byte-identical videos are processed once and the
+    copies get a link to (or copy of) its output ("link" spans in the trace).
+    A path given more than once is processed once and each repeat gets a copy of its result.
+    """
+    paths = list(paths)
+    total = len(paths)
+    # Index of a path's first occurrence -> the indices that repeat it. ffmpeg jobs and
+    # partial outputs are keyed by path, so each path must only run once.
+    first, repeats = {}, {}
+    for idx, path in enumerate(paths):
+        if path in first:
+            repeats.setdefault(first[path], []).append(idx)
+        else:
+            first[path] = idx
+    key = options_key("video", {"remove_metadata": remove_metadata}) if manifest or dedup else None
+    results = [None] * total
+    jobs, job_indices, partials, source_stats = [], {}, {}, {}
+    todo, native = [], []
+    finished = 0
+    plan = None
+    if progress is not None:
+        progress.set_total(total)
+
+    def report(idx, result):
+        nonlocal finished
+        for i in [idx] + repeats.pop(idx, []):
+            results[i] = result if i == idx else replace(result)
+            finished += 1
+            if progress is not None:
+                progress.item_done(result.key)
+            if on_result:
+                on_result(results[i], finished, total)
+        if plan is not None and not result.skipped and not result.duplicate_of:
+            share(idx, result)
+
+    def share(idx, result):
+        """Hands a processed video's output to its byte-identical copies, and remembers its content."""
+        copies = plan.copies.pop(idx, ())
+        if not result.error:
+            dedup.learn(result.key, key, [result.output], plan.digests.get(idx))
+        for dup in copies:
+            dup_path = paths[dup]
+            if result.error:
+                dup_result = JobResult(dup_path, error=result.error, duplicate_of=result.key)
+            else:
+                dup_result = _duplicate_result(dup_path, result.output, video_output_path_for(dup_path, output_folder), dedup, result.key)
+            record(dup_result, "link")
+            report(dup, dup_result)
+
+    def record(result, stage):
+        if trace is not None:
+            trace.add(result.key, "video", [job_span(stage, result.key, None if result.error else result.output, result.elapsed)], result.error)
+        if manifest and not result.error:
+            try:
+                manifest.record(result.key, result.output, key, source_stats.get(result.key))
+            except OSError as e:
+                logging.warning(f"Could not record {os.path.basename(result.key)} in the batch manifest: {e}")
+
+    def add_job(idx, path, out_path):
+        if not ffmpeg_path:
+            report(idx, JobResult(path, output=out_path, error="FFmpeg is not installed or not in PATH."))
+            return
+        partials[path] = partial_path_for(out_path)
+        cmd = remux_command(path, partials[path], ffmpeg_path, remove_metadata, progress=True)
+        jobs.append(ToolJob(path, cmd, output=out_path, timeout=timeout, progress=True, stall_timeout=stall_timeout))
+        job_indices[path] = idx
+
+    for path, idx in first.items():
+        out_path = video_output_path_for(path, output_folder)
+        if manifest:
+            if not force and manifest.is_current(path, out_path, key):
+                report(idx, JobResult(path, output=out_path, returncode=0, skipped=True))
+                continue
+            try:
+                source_stats[path] = os.stat(path)
+            except OSError:
+                pass
+        todo.append((idx, path))
+
+    if dedup is not None and todo:
+        plan = dedup.plan(todo, key, reuse=not force)
+        waiting = plan.waiting()
+        for idx, path in todo:
+            if idx in plan.reused:
+                result = _duplicate_result(path, plan.reused[idx][0], video_output_path_for(path, output_folder), dedup, plan.reused[idx][0])
+                record(result, "link")
+                report(idx, result)
+        todo = [(idx, path) for idx, path in todo if idx not in plan.reused and idx not in waiting]
+
+    for idx, path in todo:
+        out_path = video_output_path_for(path, output_folder)
+        if can_strip_natively(path, remove_metadata):
+            native.append((idx, path, out_path))
+        else:
+            add_job(idx, path, out_path)
+
+    def strip_one(path, out_path):
+        if progress is not None and not progress.wait_if_paused():
+            return JobResult(path, output=out_path, cancelled=True)
+        return _strip_natively(path, out_path)
+
+    if native:
+        # Mostly copying the mdat, so threads are enough; files that turn out to need ffmpeg join its queue.
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent)) as pool:
+            futures = {pool.submit(strip_one, path, out_path): (idx, path, out_path) for idx, path, out_path in native}
+            for future in as_completed(futures):
+                idx, path, out_path = futures[future]
+                result = future.result()
+                if result is not None and result.cancelled:
+                    results[idx] = result
+                    continue
+                if result is None:
+                    add_job(idx, path, out_path)
+                    continue
+                record(result, "strip")
+                report(idx, result)
+
+    def job_progress(path, fraction, stats):
+        if progress is not None:
+            progress.item_progress(path, fraction)
+        if on_progress:
+            on_progress(path, fraction, stats)
+
+    def on_done(result, done, _):
+        idx = job_indices[result.key]
+        partial = partials[result.key]
+        if result.error or result.cancelled:
+            discard(partial)
+        else:
+            try:
+                os.replace(partial, result.output)
+            except OSError as e:
+                result.error = f"could not move the output into place: {e}"
+                discard(partial)
+        if result.cancelled:
+            results[idx] = result
+            return
+        record(result, "ffmpeg")
+        report(idx, result)
+
+    run_jobs(jobs, max_concurrent, on_progress=job_progress, on_done=on_done, progress=progress)
+    # Copies and repeats of videos that were cancelled never got a result of their own.
+    for idx, path in enumerate(paths):
+        if results[idx] is None:
+            results[idx] = JobResult(path, cancelled=True)
+    return results
@@ -0,0 +1,340 @@
+"""
+Watch folders and feed new media through the normal pipeline as it lands.
+
+A FolderWatcher is told about new and changed files by inotify on Linux, or
+otherwise polls the modification time of each folder it knows and re-lists
+only those that changed, so a big tree isn't rescanned every time (polling
+therefore misses a file rewritten in place under the same name). Either way a
+file is only handed on once it has stopped changing: the same size and mtime
+for `settle` seconds, so a camera upload or a network copy still in progress
+is left alone. Hidden files are ignored, which covers partially written
+outputs (paths.partial_path_for) and the temporary names rsync and most
+upload tools write under.
+
+An IngestQueue runs the conversions on a thread of its own, a batch at a time:
+whatever becomes ready while one batch runs makes up the next one.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+# Seconds a file's size and mtime must stay the same before it is processed.
+SETTLE_SECONDS = 2.0
+# Without inotify: how often each known folder's mtime is checked.
+POLL_INTERVAL = 1.0
+# How often files waiting to settle are checked.
+TICK = 0.25
+# Ready files arriving this soon after the first of a batch join it.
+BATCH_WINDOW = 0.5
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """The few inotify calls the watcher needs, through libc."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        # Watch descriptor -> folder.
+        self.folders = {}
+
+    def add(self, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), _WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            # ENOSPC here means fs.inotify.max_user_watches is used up.
+            raise OSError(err, os.strerror(err), folder)
+        self.folders[wd] = folder
+
+    def read(self, timeout):
+        """(folder, mask, name) for each event, waiting up to timeout seconds for the first."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+            pos += _EVENT.size + length
+            folder = self.folders.get(wd)
+            if mask & IN_IGNORED:
+                # The folder was deleted or unmounted; its watch is gone.
+                self.folders.pop(wd, None)
+            events.append((folder, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Watches folders on a background thread and calls on_ready(paths) from it
+    with files whose extension is in exts once they have settled. Files already
+    there when it starts count as new unless existing is False. Folders under
+    ignore (e.g. the output folder) are never looked at.
+    """
+
+    def __init__(self, folders, exts, on_ready, recursive=True, settle=SETTLE_SECONDS, ignore=(), existing=True,
+                 poll=False, poll_interval=POLL_INTERVAL):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.exts = tuple(exts)
+        self.on_ready = on_ready
+        self.recursive = recursive
+        self.settle = settle
+        self.ignore = [os.path.abspath(path) for path in ignore if path]
+        self.existing = existing
+        self.poll_interval = poll_interval
+        # Files waiting to settle: path -> (size, mtime_ns, unchanged since).
+        self._pending = {}
+        # Size and mtime of every file already handed on, so it only goes again if it changes.
+        self._handed = {}
+        # Known folders and their mtimes, for polling.
+        self._dirs = {}
+        self._inotify = None
+        if not poll and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify is not available ({e}); polling instead.")
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="folder-watcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def mode(self):
+        return "inotify" if self._inotify is not None else "polling"
+
+    @property
+    def waiting(self):
+        """How many files are waiting to settle."""
+        return len(self._pending)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _ignored(self, path):
+        return any(path == folder or path.startswith(folder + os.sep) for folder in self.ignore)
+
+    def _add_folder(self, folder, initial=False):
+        if self._ignored(folder) or folder in self._dirs:
+            return
+        try:
+            self._dirs[folder] = os.stat(folder).st_mtime_ns
+            if self._inotify is not None:
+                # Watch first and list after, so nothing created in between is missed.
+                self._inotify.add(folder)
+        except OSError as e:
+            if self._inotify is not None and e.errno == errno.ENOSPC:
+                logging.warning(f"Out of inotify watches at {folder}; polling instead "
+                                f"(raise fs.inotify.max_user_watches to avoid this).")
+                self._inotify.close()
+                self._inotify = None
+            else:
+                logging.warning(f"Could not watch folder {folder}: {e}")
+                self._dirs.pop(folder, None)
+                return
+        self._list(folder, initial)
+
+    def _list(self, folder, initial=False):
+        """Looks at every entry of one folder, adding new sub-folders and files."""
+        try:
+            with os.scandir(folder) as it:
+                entries = list(it)
+        except OSError as e:
+            logging.warning(f"Could not read folder {folder}: {e}")
+            return
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.recursive:
+                        self._add_folder(entry.path, initial)
+                elif entry.is_file():
+                    self._consider(entry.path, initial)
+            except OSError:
+                continue
+
+    def _consider(self, path, initial=False):
+        """Starts waiting for path to settle, unless it isn't wanted or hasn't changed since it was handed on."""
+        name = os.path.basename(path)
+        if name.startswith(".") or os.path.splitext(name)[1].lower() not in self.exts or self._ignored(path):
+            return
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        key = (st.st_size, st.st_mtime_ns)
+        if self._handed.get(path) == key:
+            return
+        if initial and not self.existing:
+            self._handed[path] = key
+            return
+        current = self._pending.get(path)
+        if current is not None and current[:2] == key:
+            return
+        since = time.monotonic()
+        if initial and time.time() - st.st_mtime >= self.settle:
+            # Already there and untouched for a while: no need to wait and see.
+            since -= self.settle
+        self._pending[path] = key + (since,)
+
+    def _forget(self, path):
+        self._pending.pop(path, None)
+        self._handed.pop(path, None)
+
+    def _handle_events(self, events):
+        for folder, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped: list everything again to catch up.
+                logging.warning("inotify queue overflowed; re-listing the watched folders.")
+                for known in list(self._dirs):
+                    self._list(known)
+                continue
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                if mask & IN_ISDIR:
+                    # Forget it and everything under it, so a folder made again by that name is watched afresh.
+                    for known in [d for d in self._dirs if d == path or d.startswith(path + os.sep)]:
+                        del self._dirs[known]
+                else:
+                    self._forget(path)
+            elif mask & IN_ISDIR:
+                if self.recursive and not name.startswith("."):
+                    self._add_folder(path)
+            else:
+                self._consider(path)
+
+    def _poll(self):
+        for folder, mtime_ns in list(self._dirs.items()):
+            try:
+                current = os.stat(folder).st_mtime_ns
+            except OSError:
+                del self._dirs[folder]
+                continue
+            if current != mtime_ns:
+                # Something was added, removed or renamed in this folder (not in its sub-folders).
+                self._dirs[folder] = current
+                self._list(folder)
+
+    def _check_pending(self):
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (st.st_size, st.st_mtime_ns, now)
+            elif st.st_size and now - since >= self.settle:
+                # Empty files are usually just created; wait for their contents.
+                del self._pending[path]
+                self._handed[path] = (size, mtime_ns)
+                ready.append(path)
+        if ready:
+            self.on_ready(sorted(ready))
+
+    def _run(self):
+        try:
+            for folder in self.folders:
+                self._add_folder(folder, initial=True)
+            self._check_pending()
+            last_poll = time.monotonic()
+            while not self._stopped.is_set():
+                if self._inotify is not None:
+                    self._handle_events(self._inotify.read(TICK))
+                else:
+                    self._stopped.wait(TICK)
+                    if time.monotonic() - last_poll >= self.poll_interval:
+                        self._poll()
+                        last_poll = time.monotonic()
+                self._check_pending()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+
+_STOP = object()
+
+
+class IngestQueue:
+    """
+    Calls handler(paths) on a thread of its own for the files put() into it,
+    a batch at a time. stop() lets the files already queued finish first.
+    """
+
+    def __init__(self, handler, window=BATCH_WINDOW):
+        self.handler = handler
+        self.window = window
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ingest-queue", daemon=True)
+        self._thread.start()
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def put(self, paths):
+        for path in paths:
+            self._queue.put(path)
+
+    def stop(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self.handler(list(dict.fromkeys(batch)))
+            except Exception:
+                logging.exception(f"Processing {len(batch)} watched files failed")
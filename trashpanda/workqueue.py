@@ -0,0 +1,329 @@
+"""
+A work queue in a shared folder, so several processes or machines can split one batch.
+
+A coordinator submits jobs: a list of files and the options to process them
+with, written to an SQLite database in a queue folder every worker can reach (a
+local folder, or a network share mounted at the same path everywhere). Workers
+claim a few files at a time under a lease, process them with convert_images or
+process_videos as usual and record each result as it lands. A worker keeps
+renewing its leases while it works; if it dies they run out and another worker
+claims the files again. A file whose lease has run out max_attempts times is
+failed instead of being handed out again, since it is probably what kills them.
+
+SQLite's file locking keeps two workers from claiming the same file. On a
+network share that needs working POSIX locks (NFSv4, or NFSv3 with lockd), and
+leases compare wall-clock times, so the machines' clocks must agree (NTP).
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+from .convert import ConvertOptions, convert_images, ensure_pool, make_pool
+from .renditions import Rendition
+from .video import process_videos
+
+QUEUE_DB = "queue.sqlite"
+# Seconds a claim lasts without being renewed. Workers renew every third of it.
+DEFAULT_LEASE = 120.0
+# Files claimed at once per worker process.
+DEFAULT_CLAIM = 4
+MAX_ATTEMPTS = 3
+# How often an idle worker looks for files again (new jobs, or leases that ran out).
+IDLE_POLL = 2.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    options TEXT NOT NULL,
+    output TEXT,
+    submitted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job INTEGER NOT NULL REFERENCES jobs (id),
+    path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'todo',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    outputs TEXT,
+    error TEXT,
+    seconds REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, job);
+"""
+
+# Task states.
+TODO, LEASED, DONE, FAILED = "todo", "leased", "done", "failed"
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def dump_options(kind, options):
+    """JSON for a job's options: ConvertOptions for images, {"remove_metadata": bool} for videos."""
+    return json.dumps(asdict(options) if kind == "image" else options, sort_keys=True)
+
+
+def load_options(kind, text):
+    values = json.loads(text)
+    if kind != "image":
+        return values
+    values["renditions"] = tuple(Rendition(**r) for r in values.get("renditions", ()))
+    return ConvertOptions(**values)
+
+
+@dataclass
+class Lease:
+    """Files claimed from one job, as (task id, path) pairs."""
+    job: int
+    kind: str
+    options: str
+    output: str
+    tasks: list
+
+
+class WorkQueue:
+    """The queue database in folder. Safe to share between threads; open one per process."""
+
+    def __init__(self, folder, lease=DEFAULT_LEASE, max_attempts=MAX_ATTEMPTS):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.db_path = os.path.join(folder, QUEUE_DB)
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # Transactions are explicit (see _transaction); the timeout rides out other workers' claims.
+        self._conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        # Not WAL: its shared-memory index only works for processes on one machine.
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, so a claim's SELECT and UPDATE can't interleave with another's.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    # --- Coordinator side ---
+    def submit(self, kind, paths, options, output=None):
+        """Adds a job ("image" or "video") for paths. Returns (job id, files added)."""
+        paths = list(dict.fromkeys(os.path.abspath(path) for path in paths))
+        with self._transaction() as conn:
+            job = conn.execute(
+                "INSERT INTO jobs (kind, options, output, submitted_at) VALUES (?, ?, ?, ?)",
+                (kind, dump_options(kind, options), os.path.abspath(output) if output else None, time.time()),
+            ).lastrowid
+            conn.executemany("INSERT INTO tasks (job, path) VALUES (?, ?)", ((job, path) for path in paths))
+        return job, len(paths)
+
+    def summary(self):
+        """Per job: its kind, output folder and how many files are in each state."""
+        with self._lock:
+            jobs = {row[0]: {"job": row[0], "kind": row[1], "output": row[2], "counts": {}}
+                    for row in self._conn.execute("SELECT id, kind, output FROM jobs ORDER BY id")}
+            for job, state, count in self._conn.execute("SELECT job, state, COUNT(*) FROM tasks GROUP BY job, state"):
+                jobs[job]["counts"][state] = count
+        return list(jobs.values())
+
+    def active_workers(self):
+        """{worker id: files it holds unexpired leases on}."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT worker, COUNT(*) FROM tasks WHERE state = ? AND lease_until >= ? GROUP BY worker", (LEASED, time.time())))
+
+    def failures(self, limit=None):
+        """(path, error) for failed files, oldest first."""
+        with self._lock:
+            return self._conn.execute("SELECT path, error FROM tasks WHERE state = ? ORDER BY finished_at LIMIT ?",
+                                      (FAILED, -1 if limit is None else limit)).fetchall()
+
+    def retry_failed(self):
+        """Puts every failed file back in the queue. Returns how many."""
+        with self._transaction() as conn:
+            return conn.execute("UPDATE tasks SET state = ?, attempts = 0, error = NULL, worker = NULL, finished_at = NULL "
+                                "WHERE state = ?", (TODO, FAILED)).rowcount
+
+    def unfinished(self):
+        """Files still to do or leased (perhaps by a worker that has died)."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tasks WHERE state IN (?, ?)", (TODO, LEASED)).fetchone()[0]
+
+    # --- Worker side ---
+    def claim(self, worker, limit=DEFAULT_CLAIM):
+        """
+        Leases up to limit files of one job to worker: files nobody has claimed,
+        or whose lease has run out. Returns a Lease, or None if there are none.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET state = ?, error = ?, finished_at = ? WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, f"gave up after {self.max_attempts} attempts: the worker processing it stopped responding",
+                 now, LEASED, now, self.max_attempts),
+            )
+            claimable = "(state = ? OR (state = ? AND lease_until < ?))"
+            row = conn.execute(f"SELECT job FROM tasks WHERE {claimable} ORDER BY id LIMIT 1", (TODO, LEASED, now)).fetchone()
+            if row is None:
+                return None
+            job = row[0]
+            tasks = conn.execute(f"SELECT id, path FROM tasks WHERE job = ? AND {claimable} ORDER BY id LIMIT ?",
+                                 (job, TODO, LEASED, now, limit)).fetchall()
+            conn.executemany("UPDATE tasks SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                             ((LEASED, worker, now + self.lease, task_id) for task_id, _ in tasks))
+            kind, options, output = conn.execute("SELECT kind, options, output FROM jobs WHERE id = ?", (job,)).fetchone()
+        return Lease(job, kind, options, output, [tuple(task) for task in tasks])
+
+    def renew(self, worker, task_ids):
+        """Extends worker's leases on task_ids. Returns how many it still held."""
+        with self._transaction() as conn:
+            return conn.executemany("UPDATE tasks SET lease_until = ? WHERE id = ? AND worker = ? AND state = ?",
+                                    ((time.time() + self.lease, task_id, worker, LEASED) for task_id in task_ids)).rowcount
+
+    def complete(self, worker, task_id, outputs=None, error=None, seconds=None):
+        """
+        Records a file's result. Returns False if worker no longer held its lease
+        (it ran out and someone else claimed the file), in which case nothing changes.
+        """
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE tasks SET state = ?, outputs = ?, error = ?, seconds = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ? AND state = ?",
+                (FAILED if error else DONE, json.dumps(outputs or []), error, seconds, time.time(), task_id, worker, LEASED),
+            ).rowcount == 1
+
+    def release(self, worker, task_ids):
+        """Hands worker's unfinished files back without counting the attempt, e.g. when it is told to stop."""
+        with self._transaction() as conn:
+            conn.executemany("UPDATE tasks SET state = ?, worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+                             "WHERE id = ? AND worker = ? AND state = ?", ((TODO, task_id, worker, LEASED) for task_id in task_ids))
+
+
+class _LeaseKeeper:
+    """Renews a worker's leases on a background thread, every third of the lease time, until each file is done."""
+
+    def __init__(self, queue, worker):
+        self.queue = queue
+        self.worker = worker
+        self._held = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+        self._thread.start()
+
+    def hold(self, task_ids):
+        with self._lock:
+            self._held.update(task_ids)
+
+    def drop(self, task_id):
+        with self._lock:
+            self._held.discard(task_id)
+
+    def held(self):
+        with self._lock:
+            return sorted(self._held)
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.queue.lease / 3):
+            held = self.held()
+            if not held:
+                continue
+            try:
+                renewed = self.queue.renew(self.worker, held)
+            except sqlite3.Error as e:
+                logging.warning(f"Could not renew leases: {e}")
+                continue
+            if renewed < len(held):
+                logging.warning(f"{len(held) - renewed} leases ran out before they could be renewed; "
+                                "another worker may process those files too.")
+
+
+def run_worker(queue, worker=None, workers=1, claim=DEFAULT_CLAIM, ffmpeg_path=None, follow=False, on_result=None,
+               stop=None):
+    """
+    Claims and processes files from queue until none are left to do or leased,
+    or with follow, until stop (a threading.Event) is set. workers > 1 converts
+    images in a pool of that many processes, kept for the whole run.
+    on_result(path, outputs, error) is called as each file finishes.
+    Returns (done, failed) for the files this worker finished.
+    """
+    worker = worker or default_worker_id()
+    stop = stop or threading.Event()
+    keeper = _LeaseKeeper(queue, worker)
+    pool = make_pool(workers) if workers > 1 else None
+    counts = [0, 0]
+
+    def finish(task_id, path, outputs, error, seconds):
+        keeper.drop(task_id)
+        if not queue.complete(worker, task_id, outputs, error, seconds):
+            logging.warning(f"Lost the lease on {path} before it finished; keeping the other worker's result.")
+            return
+        counts[1 if error else 0] += 1
+        if on_result:
+            on_result(path, outputs, error)
+
+    try:
+        while not stop.is_set():
+            lease = queue.claim(worker, claim * max(1, workers))
+            if lease is None:
+                if not follow and queue.unfinished() == 0:
+                    break
+                # Other workers hold the rest: wait for them to finish, or for their leases to run out.
+                stop.wait(IDLE_POLL)
+                continue
+            keeper.hold(task_id for task_id, _ in lease.tasks)
+            task_ids = {path: task_id for task_id, path in lease.tasks}
+            paths = list(task_ids)
+            options = load_options(lease.kind, lease.options)
+            if lease.output:
+                os.makedirs(lease.output, exist_ok=True)
+            if lease.kind == "image":
+                pool = ensure_pool(pool, workers)
+                convert_images(paths, lease.output, options, workers=workers, pool=pool,
+                               on_result=lambda r, done, total: finish(task_ids[r.path], r.path, r.outputs, r.error,
+                                                                       sum(span.seconds for span in r.spans)))
+            else:
+                process_videos(paths, lease.output, ffmpeg_path, remove_metadata=options["remove_metadata"],
+                               on_result=lambda r, done, total: finish(task_ids[r.key], r.key, [r.output] if r.output and not r.error else [],
+                                                                       r.error, r.elapsed))
+    finally:
+        keeper.stop()
+        # Whatever was claimed but not finished (an exception, Ctrl+C) goes straight back rather than waiting out its lease.
+        unfinished = keeper.held()
+        if unfinished:
+            try:
+                queue.release(worker, unfinished)
+            except sqlite3.Error:
+                pass
+        if pool is not None:
+            pool.shutdown()
+    return tuple(counts)